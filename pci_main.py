@@ -15,109 +15,261 @@ pci_main.py:
 
 # pylint: disable=no-member, broad-exception-caught
 
-import time
+import os
+import sys
 import logging
-import threading
+from typing import Any
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import yaml
 
-from src.pci_threads import pemel_control, data_storage, supervisor
+from src.pci_threads import pemel_control, data_storage, data_acquisition
+from src.pci_scan import ScanScheduler
+from src.pci_reload import ConfigWatcher, apply_gen_config
 from src.pci_modbus import ModbusConnection
 from src.pci_opcua import OPCUAConnection
 from src.pci_sql import SQLConnection
+from src.pci_status import status_bit_names
+from src.pci_events import StatusChangeDetector, EventWriter
+from src.pci_health import Supervisor
+from src.pci_row import RowBuffer
+from src.pci_config import (CONFIG_FILES, load_configs, check_configs, compile_gen_config,
+                            row_layout)
+from src.pci_service import ServiceRunner, drain_rows
+from src.pci_history import load_history
+from src.pci_logging import setup_logging
+from src.pci_trace import TRACER, configure_tracing, trace_exporter
 
-def setup_logging() -> None:
-    """Sets up logging to write messages to a file."""
-    logging.basicConfig(
-        filename='PyComInt.log',                                # Log file name
-        level=logging.INFO,                                     # Log level
-        format="%(asctime)s - %(levelname)s - %(message)s",     # Log format
-        datefmt="%Y-%m-%d %H:%M:%S"                             # Date format
-    )
-
-    # Suppress INFO logs from third-party libraries
-    logging.getLogger("pymodbus").setLevel(logging.ERROR)
-    logging.getLogger("opcua").setLevel(logging.WARNING)
-    logging.getLogger("opcua").setLevel(logging.WARNING)
-
-def main() -> None:
-    """ Main function to set up connections and start threads. """
+def load_sinks(gen_config: dict[str, Any], sql_config: dict[str, Any]) -> list:
+    """
+        Creates the additional data sinks. The archive module (and pyarrow) is only imported
+        if the archive is enabled.
+        :param gen_config: General configuration (storage interval for the history size)
+        :param sql_config: Validated SQL configuration (columns of the history)
+        :return: List of data sinks providing write_row() and close()
+    """
+    sinks = []
+    # In-memory history of the recent data with its local API (optional)
+    history = load_history(gen_config, sql_config)
+    if history is not None:
+        sinks.append(history)
+    # Local columnar archive (optional, also if config_archive.yaml does not exist)
+    archive_config = {}
+    if os.path.exists("config/config_archive.yaml"):
+        with open("config/config_archive.yaml", "r", encoding="utf-8") as env_file:
+            archive_config = yaml.safe_load(env_file) or {}
+    if archive_config.get('ARCHIVE_ENABLED'):
+        from src.pci_archive import ArchiveWriter  # pylint: disable=import-outside-toplevel
+        sinks.append(ArchiveWriter())
+    return sinks
+
+def reload_all(
+        connections: list,
+        configs: dict[str, Any],
+        name: str,
+        new_config: dict
+    ) -> None:
+    """
+        Applies a changed configuration to the connections using the file (checked against
+        the other configuration files before, see check_reload()).
+        :param connections: Connections providing reload_config()
+        :param configs: Applied configurations by name (updated)
+        :param name: Name of the changed configuration ('modbus', 'opcua', or 'sql')
+        :param new_config: New configuration
+    """
+    for connection in connections:
+        connection.reload_config(new_config)
+    configs[name] = new_config
+
+def check_reload(configs: dict[str, Any], new_configs: dict[str, dict]) -> None:
+    """
+        Checks the reloaded configuration files together with the applied ones (e.g.
+        DB_COLUMNS against the row layout), so that a new node or register can be added to
+        config_opcua.yaml or config_modbus.yaml and config_sql.yaml at once.
+        :param configs: Applied configurations by name
+        :param new_configs: Reloaded configurations by file path
+    """
+    names = {path: name for name, path in CONFIG_FILES.items()}
+    check_configs({**configs, **{names[path]: config for path, config in new_configs.items()}})
+
+def main() -> int:
+    """
+        Main function to set up connections and start threads. Runs until SIGTERM or SIGINT
+        and then stops the threads, drains the buffered rows, and closes the connections.
+        :return: Exit code of the service
+    """
     # Load general configuration
     try:
-        with open("config/config_gen.yaml", "r", encoding="utf-8") as env_file:
-            gen_config = yaml.safe_load(env_file)
+        # Validate all configuration files first, so that errors stop the service at startup
+        configs = load_configs()
+        gen_config = configs['gen']     # Shared with the threads, updated in place on reload
+        # Scan groups for multi-rate data acquisition (optional)
+        scan_scheduler = None
+        scan_groups = compile_gen_config(gen_config)
+        if scan_groups:
+            scan_scheduler = ScanScheduler(list(scan_groups))
+        # Opt-in tracing of the protocol calls and loop bodies
+        configure_tracing(gen_config)
         logging.info("Loaded general configuration successfully.")
     except Exception as e:
         logging.error("Error loading configuration: %s", e)
-        return
+        return 1
+    runner = ServiceRunner(gen_config)
 
     # Initialize connections
     try:
-        modbus_connection = ModbusConnection()
-        opcua_connection = OPCUAConnection()
-        sql_connection = SQLConnection()
-        modbus_connection.connect()
-        opcua_connection.connect()
-        sql_connection.connect()
+        modbus_connection = ModbusConnection(modbus_config=configs['modbus'])
+        # Low-latency control path
+        control_connection = ModbusConnection(control=True, modbus_config=configs['modbus'])
+        opcua_connection = OPCUAConnection(configs['opcua'])
+        sql_connection = SQLConnection(configs['sql'])
+        bit_names = status_bit_names(modbus_connection.modbus_config)
+        sql_connection.status_bit_names = bit_names     # Columns of the status view
+        # The Modbus retries end on shutdown
+        for connection in (modbus_connection, control_connection):
+            connection.stop_event = runner.stop_event
+        # Connect concurrently, so that a slow connection (e.g. Modbus retries) does not delay
+        # the others
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="connect")
+        connecting_control = [executor.submit(control_connection.connect),
+                              executor.submit(opcua_connection.connect)]
+        connecting_storage = [executor.submit(modbus_connection.connect),
+                              executor.submit(sql_connection.connect)]
+        executor.shutdown(wait=False)
+        # Recent data history and local columnar archive alongside the SQL database (optional)
+        sinks = load_sinks(gen_config, configs['sql'])
+        # Status change events of both Modbus connections (and the optional events table)
+        status_detector = StatusChangeDetector(bit_names)
+        modbus_connection.status_detector = status_detector
+        control_connection.status_detector = status_detector
+        event_writer = None
+        if sql_connection.sql_config.get('EVENTS_TABLE'):
+            event_writer = EventWriter(sql_connection, sql_connection.sql_config['EVENTS_TABLE'],
+                                       sql_connection.sql_config['EVENTS_COLUMNS'])
+            status_detector.subscribe(event_writer)
     except Exception as e:
         logging.error("Error initializing connections: %s", e)
-        return
+        return 1
 
+    supervisor = None
+    row_buffer = None
     try:
         # Thread for PEMEL control
-        thread_con = threading.Thread(
-            target=pemel_control,
-            args=(
-                gen_config['PEMEL_CONTROL_INTERVAL'],
-                modbus_connection,
-                opcua_connection
-            ),
-            daemon=True
+        thread_con = runner.thread(
+            "pemel-control",
+            pemel_control,
+            gen_config,
+            control_connection,
+            opcua_connection
         )
-        # Thread for data storage
-        thread_dat = threading.Thread(
-            target=data_storage,
-            args=(
-                gen_config['DATA_STORAGE_INTERVAL'],
+        # Thread for data storage (or multi-rate acquisition, if scan groups are configured)
+        if scan_scheduler is None:
+            # Created here, so that the buffered rows can be drained on shutdown
+            row_buffer = RowBuffer(
+                row_layout(modbus_connection.settings, opcua_connection.settings,
+                           sql_connection.settings),
+                gen_config.get('ROW_BUFFER_SIZE', 8640)
+            )
+            thread_dat = runner.thread(
+                "data-storage",
+                data_storage,
+                gen_config,
                 modbus_connection,
                 opcua_connection,
-                sql_connection
-            ),
-            daemon=True
-        )
-        # Thread for connection supervision
-        thread_sup = threading.Thread(
-            target=supervisor,
-            args=(
-                gen_config['RECONNECTION_INTERVAL'],
+                sql_connection,
+                sinks,
+                row_buffer
+            )
+        else:
+            thread_dat = runner.thread(
+                "data-acquisition",
+                data_acquisition,
+                scan_scheduler,
                 modbus_connection,
                 opcua_connection,
-                sql_connection
-                ),
-            daemon=True
+                sql_connection,
+                sinks
+            )
+        # Connection supervision: one reconnect worker per connection, woken by failures
+        supervisor = Supervisor(gen_config, {
+            'Modbus (PEMEL control)': control_connection,
+            'OPC UA': opcua_connection,
+            'Modbus': modbus_connection,
+            'SQL': sql_connection
+        }, runner.stop_event)
+
+        # Thread for the hot reload of the configuration files
+        config_watcher = ConfigWatcher(
+            {
+                "config/config_gen.yaml": partial(apply_gen_config, gen_config, scan_scheduler),
+                "config/config_modbus.yaml": partial(
+                    reload_all, [modbus_connection, control_connection], configs, 'modbus'),
+                "config/config_opcua.yaml": partial(reload_all, [opcua_connection], configs,
+                                                    'opcua'),
+                "config/config_sql.yaml": partial(reload_all, [sql_connection], configs, 'sql')
+            },
+            gen_config.get('CONFIG_POLL_INTERVAL', 5),
+            partial(check_reload, configs)
         )
+        thread_cfg = runner.thread("config-watcher", config_watcher.run, critical=False)
+        # Thread for exporting the trace file (while tracing is enabled)
+        thread_trc = runner.thread("trace-exporter", trace_exporter, gen_config, critical=False)
+        # Thread for writing the status change events
+        thread_evt = None
+        if event_writer is not None:
+            thread_evt = runner.thread("event-writer", event_writer.run, critical=False)
+
+        # SIGTERM (service manager, container stop) and SIGINT stop the threads gracefully
+        runner.install_signal_handlers()
 
+        # PEMEL control only needs Modbus and OPC UA and starts before the SQL connection is up
+        # (The reconnect workers start after the initial connect of their connections)
+        wait(connecting_control)
+        supervisor.start('Modbus (PEMEL control)', 'OPC UA')
         thread_con.start()
         logging.info("PEMEL control thread started.")
+        wait(connecting_storage)
+        supervisor.start('Modbus', 'SQL')
         thread_dat.start()
         logging.info("Data storage thread started.")
-        thread_sup.start()
-        logging.info("Supervisor thread started.")
+        logging.info("Reconnect workers started.")
+        thread_cfg.start()
+        logging.info("Configuration watcher thread started.")
+        thread_trc.start()
+        if thread_evt is not None:
+            thread_evt.start()
+            logging.info("Status event writer thread started.")
 
-        while True:  # Keep the main thread running
-            time.sleep(0.1)
+        runner.run()    # Until stopped (or a critical thread ended unexpectedly)
     except KeyboardInterrupt:
         logging.info("Exiting on user request (KeyboardInterrupt).")
     finally:
+        # Stop the loops after their current cycle, then store the rows of failed inserts
+        running = runner.shutdown()
+        if supervisor is not None:
+            supervisor.stop()
+        if row_buffer is not None:
+            if "data-storage" in running:   # Still using the buffer and the SQL connection
+                logging.error("Data storage thread did not stop, buffered rows not drained")
+            else:
+                drain_rows(row_buffer, sql_connection, runner.remaining())
+        if TRACER.enabled:
+            TRACER.export_chrome_trace(gen_config['TRACE_FILE'])
         # Clean up connections
-        modbus_connection.client.close()
-        opcua_connection.client.disconnect()
+        for connection in (modbus_connection, control_connection):
+            if connection.client is not None:
+                connection.client.close()
+        opcua_connection.disconnect()
+        for sink in sinks:
+            sink.close()
         sql_connection.close()
         logging.info("Connections closed successfully.")
+    return runner.exit_code
 
 if __name__ == "__main__":
-    # Set up logging
-    setup_logging()
+    # Set up logging (asynchronous via a queue listener thread)
+    log_listener = setup_logging()
 
     logging.info("\n\n-----------------------------------------------------"
                  "----------------------------------------------------")
@@ -125,4 +277,8 @@ if __name__ == "__main__":
                  " process with biological methanation")
 
     # Run the main function
-    main()
+    try:
+        EXIT_CODE = main()
+    finally:
+        log_listener.stop()     # Write the remaining log records
+    sys.exit(EXIT_CODE)
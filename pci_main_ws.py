@@ -22,21 +22,13 @@ import threading
 import win32serviceutil
 import win32service
 import win32event
-import yaml
 
 from src.pci_threads import pemel_control, data_storage, supervisor
 from src.pci_modbus import ModbusConnection
 from src.pci_opcua import OPCUAConnection
 from src.pci_sql import SQLConnection
-
-def setup_logging() -> None:
-    """Sets up logging to write messages to a file."""
-    logging.basicConfig(
-        filename='PyComInt.log',                                # Log file name
-        level=logging.INFO,                                     # Log level
-        format="%(asctime)s - %(levelname)s - %(message)s",     # Log format
-        datefmt="%Y-%m-%d %H:%M:%S"                             # Date format
-    )
+from src.pci_logging import setup_logging
+from src.pci_config import load_configs
 
 class PyComIntService(win32serviceutil.ServiceFramework):
     """ Windows Service for PyComInt. """
@@ -52,6 +44,7 @@ class PyComIntService(win32serviceutil.ServiceFramework):
             win32serviceutil.ServiceFramework.__init__(self, args)
             self.h_wait_stop = win32event.CreateEvent(None, 0, 0, None)
             self.running = True
+            self.stop_event = threading.Event()     # Ends the loops of the threads
             logging.info("Service initialized.")
         except Exception as e:
             logging.error("Error during service initialization: %s", e)
@@ -61,51 +54,55 @@ class PyComIntService(win32serviceutil.ServiceFramework):
         """ Stops the service. """
         # Stop the service
         self.running = False
+        self.stop_event.set()
         win32event.SetEvent(self.h_wait_stop)
 
     def SvcDoRun(self):
         """ Main service loop. """
         try:
-            # Load general configuration
-            with open("config/config_gen.yaml", "r", encoding="utf-8") as env_file:
-                gen_config = yaml.safe_load(env_file)
+            # Validate all configuration files first
+            configs = load_configs()
+            gen_config = configs['gen']
 
             # Initialize connections
-            modbus_connection = ModbusConnection()
-            opcua_connection = OPCUAConnection()
-            sql_connection = SQLConnection()
+            modbus_connection = ModbusConnection(modbus_config=configs['modbus'])
+            opcua_connection = OPCUAConnection(configs['opcua'])
+            sql_connection = SQLConnection(configs['sql'])
 
             logging.info("Service is starting.")
             # Thread for PEMEL control
             thread_con = threading.Thread(
                 target=pemel_control,
                 args=(
-                    gen_config['PEMEL_CONTROL_INTERVAL'],
+                    gen_config,
                     modbus_connection,
                     opcua_connection
                 ),
+                kwargs={'stop_event': self.stop_event},
                 daemon=True
             )
             # Thread for data storage
             thread_dat = threading.Thread(
                 target=data_storage,
                 args=(
-                    gen_config['DATA_STORAGE_INTERVAL'],
+                    gen_config,
                     modbus_connection,
                     opcua_connection,
                     sql_connection
                 ),
+                kwargs={'stop_event': self.stop_event},
                 daemon=True
             )
             # Thread for connection supervision
             thread_sup = threading.Thread(
                 target=supervisor,
                 args=(
-                    gen_config['RECONNECTION_INTERVAL'],
+                    gen_config,
                     modbus_connection,
                     opcua_connection,
                     sql_connection
                 ),
+                kwargs={'stop_event': self.stop_event},
                 daemon=True
             )
 
@@ -117,7 +114,7 @@ class PyComIntService(win32serviceutil.ServiceFramework):
             while self.running:
                 time.sleep(1)
 
-            # Wait for threads to finish
+            # Wait for threads to finish their current cycle
             thread_con.join()
             thread_dat.join()
             thread_sup.join()
@@ -0,0 +1,102 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_replay.py:
+> Replays recorded process data from the SQL table or the local archive through the Modbus and
+  OPC UA decoding and the storage path at maximum speed (testing and backfill tool)
+> Example: python pci_replay.py --source archive --start 2025-01-01 --end 2025-02-01
+                                --target-table pemel_data_v2
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=no-member, broad-exception-caught
+
+import sys
+import logging
+import argparse
+from datetime import datetime
+
+from src.pci_modbus import ModbusConnection
+from src.pci_opcua import OPCUAConnection
+from src.pci_sql import SQLConnection
+from src.pci_replay import Replayer, BatchSQLWriter, sql_rows, archive_rows
+
+def parse_args() -> argparse.Namespace:
+    """ Parses the command line arguments of the replay. """
+    parser = argparse.ArgumentParser(description="Replay recorded PyComInt process data.")
+    parser.add_argument('--source', choices=('sql', 'archive'), required=True,
+                        help="Recorded data: SQL table or local Parquet archive")
+    parser.add_argument('--source-table', help="SQL table with the recorded data "
+                                               "(default: DB_TABLE)")
+    parser.add_argument('--source-columns', help="Comma-separated columns of the recorded data "
+                                                 "in the order of DB_COLUMNS (default: "
+                                                 "DB_COLUMNS)")
+    parser.add_argument('--source-packed', action=argparse.BooleanOptionalAction,
+                        help="The recorded data contains the packed status word instead of "
+                             "the status bits (default: STATUS_PACKED)")
+    parser.add_argument('--archive-dir', default='archive', help="Directory of the archive")
+    parser.add_argument('--start', type=datetime.fromisoformat, required=True,
+                        help="First timestamp (ISO format)")
+    parser.add_argument('--end', type=datetime.fromisoformat, required=True,
+                        help="End of the time range (ISO format)")
+    parser.add_argument('--target-table', help="SQL table for the replayed rows (the rows are "
+                                               "not stored in the database if omitted)")
+    parser.add_argument('--target-archive', help="Directory of a new archive for the "
+                                                 "replayed rows")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Number of rows per SQL transaction")
+    return parser.parse_args()
+
+def main() -> int:
+    """ Runs the replay and prints the throughput. """
+    args = parse_args()
+    if args.source == 'archive' and args.target_archive == args.archive_dir:
+        print("The target archive must differ from the source archive.")
+        return 1
+
+    modbus_connection = ModbusConnection()
+    opcua_connection = OPCUAConnection()
+    sql_connection = SQLConnection()
+    if args.source == 'sql' or args.target_table:
+        sql_connection.connect()
+        if sql_connection.pool is None:
+            print("Could not connect to the SQL database.")
+            return 1
+
+    sinks = []
+    if args.target_archive:
+        from src.pci_archive import ArchiveWriter  # pylint: disable=import-outside-toplevel
+        # Set before the recovery of unfinished files, which only runs on the target archive
+        sinks.append(ArchiveWriter(args.target_archive))
+
+    source_packed = args.source_packed
+    if source_packed is None:
+        source_packed = sql_connection.settings.status_packed
+    if args.source == 'sql':
+        columns = (args.source_columns.split(',') if args.source_columns
+                   else sql_connection.settings.columns)
+        rows = sql_rows(sql_connection, args.source_table or sql_connection.settings.table,
+                        columns, args.start, args.end)
+    else:
+        rows = archive_rows(args.archive_dir, args.start, args.end)
+
+    try:
+        batch_writer = BatchSQLWriter(sql_connection, args.batch_size, args.target_table,
+                                      dry_run=not args.target_table)
+        stats = Replayer(modbus_connection, opcua_connection, source_packed).run(
+            rows, batch_writer, sinks)
+    finally:
+        for sink in sinks:
+            sink.close()
+        sql_connection.close()
+
+    print(f"Replayed {stats['rows']} rows in {stats['duration']:.1f} s "
+          f"({stats['rows_per_s']:.0f} rows/s), written: {stats['written']}, "
+          f"failed: {stats['failed']}")
+    return 0 if stats['failed'] == 0 else 1
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    sys.exit(main())
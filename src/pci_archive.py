@@ -0,0 +1,310 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_archive.py:
+> Implements the local columnar archive, which stores the process data in Parquet files of one
+  record batch each, grouped by hour or day, alongside the SQL database
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=no-member, broad-exception-caught, broad-exception-raised
+
+import os
+import json
+import logging
+import threading
+from typing import Any, Iterable, Iterator, Optional
+from datetime import datetime
+
+import yaml
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+INDEX_FILE = "index.json"   # Time range index of the closed Parquet files
+TEMP_SUFFIX = ".tmp"        # Suffix of a Parquet file being written (renamed when it is closed)
+
+class ArchiveWriter:
+    """ Buffers process data rows in Arrow record batches and writes them to Parquet files. """
+    def __init__(self, archive_dir: Optional[str] = None) -> None:
+        """
+            :param archive_dir: Directory of the Parquet files (None for ARCHIVE_DIR), e.g. the
+                                target archive of a replay, which must not clean up the files
+                                of the running service
+        """
+        try:
+            # Load archive configuration and the column names of the SQL table
+            with open("config/config_archive.yaml", "r", encoding="utf-8") as env_file:
+                self.archive_config = yaml.safe_load(env_file)
+            if archive_dir is not None:
+                self.archive_config['ARCHIVE_DIR'] = archive_dir
+            with open("config/config_sql.yaml", "r", encoding="utf-8") as env_file:
+                self.columns = yaml.safe_load(env_file)['DB_COLUMNS']
+            self.schema = self.build_schema()
+            self.buffer = [[] for _ in self.columns]    # Column-wise buffer of the current batch
+            self.period = None                          # Period key of the current batch
+            self.file_counter = 0                       # Next file number of the period
+            self.file_range = None                      # [first, last timestamp, row count]
+            self.lock = threading.Lock()
+            self.recover_index()
+        except Exception as e:
+            logging.error("Failed to load archive configuration: %s", e)
+
+    def build_schema(self) -> pa.Schema:
+        """
+            Builds the Arrow schema from the column names and the encoding lists in the config.
+            :return: Arrow schema of the archive files
+        """
+        dictionary_columns = set(self.archive_config['DICTIONARY_COLUMNS'])
+        delta_columns = set(self.archive_config['DELTA_COLUMNS'])
+        fields = [pa.field(self.columns[0], pa.timestamp('ms'))]
+        for column in self.columns[1:]:
+            if column in dictionary_columns:
+                fields.append(pa.field(column, pa.int8()))
+            elif column in delta_columns:
+                fields.append(pa.field(column, pa.int32()))
+            else:
+                fields.append(pa.field(column, pa.float64()))
+        return pa.schema(fields)
+
+    def period_key(self, timestamp: datetime) -> str:
+        """
+            Returns the key of the archive period (file names) containing the timestamp.
+            :param timestamp: Timestamp of the row
+            :return: Period key, e.g. '20250101_13' (hourly) or '20250101' (daily)
+        """
+        if self.archive_config['ROTATION'] == 'daily':
+            return timestamp.strftime('%Y%m%d')
+        return timestamp.strftime('%Y%m%d_%H')
+
+    def write_row(self, timestamp: datetime, values: Iterable[Any]) -> None:
+        """
+            Appends one row to the current record batch and writes the batch if it is full or
+            the row starts a new period.
+            :param timestamp: Timestamp of the row (also used for the SQL database)
+            :param values: Process values in the order of DB_COLUMNS (without the timestamp)
+        """
+        try:
+            with self.lock:
+                period = self.period_key(timestamp)
+                if period != self.period:
+                    self.write_batch()
+                    self.period = period
+                    self.file_counter = 0
+
+                self.buffer[0].append(timestamp)
+                for column, value in zip(self.buffer[1:], values):
+                    column.append(value)
+
+                if self.file_range is None:
+                    self.file_range = [timestamp, timestamp, 0]
+                self.file_range[1] = timestamp
+                self.file_range[2] += 1
+
+                if len(self.buffer[0]) >= self.archive_config['BATCH_SIZE']:
+                    self.write_batch()
+        except Exception as e:
+            logging.error("Error writing data to the archive: %s", e)
+
+    def write_batch(self) -> None:
+        """
+            Converts the buffered rows into an Arrow record batch and writes it to a Parquet file
+            of its own, which is closed, renamed to its final name, and added to the index right
+            away, so that the written rows survive a killed process. The buffer is reset in any
+            case, so that invalid values cannot block the archive.
+        """
+        if not self.buffer[0]:
+            return
+        file_range = self.file_range
+        try:
+            batch = pa.RecordBatch.from_arrays(
+                [self.to_array(column, field) for column, field in zip(self.buffer, self.schema)],
+                schema=self.schema
+            )
+        finally:
+            self.buffer = [[] for _ in self.columns]
+            self.file_range = None
+
+        os.makedirs(self.archive_config['ARCHIVE_DIR'], exist_ok=True)
+        file_name = self.new_file_name()
+        path = os.path.join(self.archive_config['ARCHIVE_DIR'], file_name)
+        delta_columns = [self.columns[0]] + self.archive_config['DELTA_COLUMNS']
+        # Written under a temporary name until it is closed, so that a killed process leaves
+        # no file without Parquet footer under the archive names
+        with pq.ParquetWriter(
+                path + TEMP_SUFFIX,
+                self.schema,
+                compression=self.archive_config['COMPRESSION'],
+                use_dictionary=self.archive_config['DICTIONARY_COLUMNS'],
+                column_encoding={column: 'DELTA_BINARY_PACKED' for column in delta_columns}
+            ) as writer:
+            writer.write_batch(batch)
+        os.replace(path + TEMP_SUFFIX, path)
+        self.update_index(file_name, *file_range)
+        logging.debug("Archived %s rows to %s", file_range[2], file_name)
+
+    @staticmethod
+    def to_array(values: list, field: pa.Field) -> pa.Array:
+        """
+            Converts the buffered values of one column, storing values that do not fit the
+            column type (e.g. a string or an out-of-range integer) as null.
+            :param values: Buffered values of the column
+            :param field: Arrow field of the column
+            :return: Arrow array of the column
+        """
+        try:
+            return pa.array(values, type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+            pass
+        coerced = []
+        for value in values:
+            try:
+                coerced.append(pa.scalar(value, type=field.type).as_py())
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+                logging.warning("Archive: invalid value %r of %s stored as null", value, field.name)
+                coerced.append(None)
+        return pa.array(coerced, type=field.type)
+
+    def new_file_name(self) -> str:
+        """
+            Returns an unused file name for the current period. (Each record batch is written
+            to an additional file, since Parquet files cannot be appended)
+            :return: File name of the Parquet file
+        """
+        while True:
+            counter = self.file_counter
+            self.file_counter += 1
+            file_name = (f"pycomint_{self.period}_{counter}.parquet" if counter
+                         else f"pycomint_{self.period}.parquet")
+            if not os.path.exists(os.path.join(self.archive_config['ARCHIVE_DIR'], file_name)):
+                return file_name
+
+    def recover_index(self) -> None:
+        """
+            Cleans up after a killed process: removes the unfinished file (no Parquet footer)
+            and adds the closed files missing in the index (killed between rename and index).
+        """
+        archive_dir = self.archive_config['ARCHIVE_DIR']
+        if not os.path.isdir(archive_dir):
+            return
+        indexed = {entry['file'] for entry in load_index(archive_dir)}
+        for file_name in sorted(os.listdir(archive_dir)):
+            if file_name.endswith(".parquet" + TEMP_SUFFIX):
+                logging.warning("Archive: removing unfinished file %s", file_name)
+                os.remove(os.path.join(archive_dir, file_name))
+            elif file_name.endswith(".parquet") and file_name not in indexed:
+                try:
+                    timestamps = pq.read_table(os.path.join(archive_dir, file_name),
+                                               columns=[self.columns[0]]).column(0)
+                    if len(timestamps) > 0:
+                        logging.warning("Archive: adding %s to the index", file_name)
+                        self.update_index(file_name, pc.min(timestamps).as_py(),
+                                          pc.max(timestamps).as_py(), len(timestamps))
+                except Exception as e:
+                    logging.error("Archive: cannot index %s: %s", file_name, e)
+
+    def update_index(self, file_name: str, start: datetime, end: datetime, rows: int) -> None:
+        """
+            Adds a closed Parquet file to the time range index.
+            :param file_name: Name of the Parquet file
+            :param start: First timestamp in the file
+            :param end: Last timestamp in the file
+            :param rows: Number of rows in the file
+        """
+        index_path = os.path.join(self.archive_config['ARCHIVE_DIR'], INDEX_FILE)
+        index = load_index(self.archive_config['ARCHIVE_DIR'])
+        index.append({'file': file_name, 'start': start.isoformat(),
+                      'end': end.isoformat(), 'rows': rows})
+        # Replace the index atomically, so that readers never see a partially written file
+        with open(index_path + ".tmp", "w", encoding="utf-8") as fptr:
+            json.dump(index, fptr, indent=1)
+        os.replace(index_path + ".tmp", index_path)
+
+    def close(self) -> None:
+        """
+            Writes the buffered rows to a last Parquet file.
+        """
+        try:
+            with self.lock:
+                self.write_batch()
+        except Exception as e:
+            logging.error("Error closing the archive: %s", e)
+
+def load_index(archive_dir: str) -> list[dict[str, Any]]:
+    """
+        Loads the time range index of the archive.
+        :param archive_dir: Directory of the archive
+        :return: List of files with their first and last timestamp and row count
+    """
+    index_path = os.path.join(archive_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "r", encoding="utf-8") as fptr:
+        return json.load(fptr)
+
+def read_archive(
+        archive_dir: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Optional[pa.Table]:
+    """
+        Reads the archived process data within a time range. Only the files overlapping the
+        range (according to the index) are opened, using memory mapping.
+        :param archive_dir: Directory of the archive
+        :param start: First timestamp to include (None for no lower bound)
+        :param end: Last timestamp to include (None for no upper bound)
+        :return: Arrow table with the process data or None if no file matches
+    """
+    tables = []
+    for entry in load_index(archive_dir):
+        if start is not None and datetime.fromisoformat(entry['end']) < start:
+            continue
+        if end is not None and datetime.fromisoformat(entry['start']) > end:
+            continue
+        table = pq.read_table(os.path.join(archive_dir, entry['file']), memory_map=True)
+        timestamp_type = table.schema.field(0).type
+        if start is not None:
+            table = table.filter(pc.greater_equal(table.column(0),
+                                                  pa.scalar(start, timestamp_type)))
+        if end is not None:
+            table = table.filter(pc.less_equal(table.column(0), pa.scalar(end, timestamp_type)))
+        tables.append(table)
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+def iter_archive(
+        archive_dir: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = 65536
+    ) -> Iterator[pa.RecordBatch]:
+    """
+        Reads the archived process data within a time range batch by batch, so that long
+        ranges are not loaded into memory at once.
+        :param archive_dir: Directory of the archive
+        :param start: First timestamp to include (None for no lower bound)
+        :param end: Timestamps before this one are included (None for no upper bound)
+        :param batch_size: Maximum number of rows per record batch
+        :return: Iterator over the record batches in the order of the index
+    """
+    for entry in load_index(archive_dir):
+        if start is not None and datetime.fromisoformat(entry['end']) < start:
+            continue
+        if end is not None and datetime.fromisoformat(entry['start']) >= end:
+            continue
+        parquet_file = pq.ParquetFile(os.path.join(archive_dir, entry['file']), memory_map=True)
+        timestamp_type = parquet_file.schema_arrow.field(0).type
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            mask = None
+            if start is not None:
+                mask = pc.greater_equal(batch.column(0), pa.scalar(start, timestamp_type))
+            if end is not None:
+                before_end = pc.less(batch.column(0), pa.scalar(end, timestamp_type))
+                mask = before_end if mask is None else pc.and_(mask, before_end)
+            if mask is not None:
+                batch = batch.filter(mask)
+            if batch.num_rows:
+                yield batch
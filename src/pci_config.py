@@ -0,0 +1,368 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_config.py:
+> Implements the validation of the configuration files and their compilation into immutable
+  settings with precomputed addresses, counts, and column mappings (used by the connections
+  instead of dictionary lookups in every cycle, compiled once per loaded or reloaded
+  configuration)
+----------------------------------------------------------------------------------------------------
+"""
+
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Optional
+from dataclasses import dataclass
+
+import yaml
+
+from src.pci_row import STATUS_BITS, RowLayout
+from src.pci_scan import ScanGroup, MAX_REGISTER_COUNT
+from src.pci_transport import TRANSPORTS
+
+CONFIG_FILES = {
+    'gen': "config/config_gen.yaml",
+    'modbus': "config/config_modbus.yaml",
+    'opcua': "config/config_opcua.yaml",
+    'sql': "config/config_sql.yaml"
+}
+GEN_REQUIRED_KEYS = ('PEMEL_CONTROL_INTERVAL', 'DATA_STORAGE_INTERVAL', 'RECONNECTION_INTERVAL')
+# Optional intervals read by the running threads (a zero or non-numeric value would end them)
+GEN_OPTIONAL_INTERVALS = ('JITTER_REPORT_INTERVAL', 'RECONNECTION_BACKOFF_MIN',
+                          'RECONNECTION_BACKOFF_MAX', 'CONFIG_POLL_INTERVAL',
+                          'TRACE_EXPORT_INTERVAL', 'LOG_RATE_LIMIT_WINDOW')
+MODBUS_REQUIRED_KEYS = ('IP_ADDRESS', 'PORT', 'SLAVE_ID', 'BASE_REGISTER_OFFSET', 'PEMEL_STATUS',
+                        'PROCESS_VALUES', 'WRITE_REGISTER', 'MAX_RETRIES', 'RETRY_INTERVAL',
+                        'TIMEOUT', 'MAX_CURRENT', 'MIN_CURRENT', 'H2_FLOW_ARRAY')
+OPCUA_REQUIRED_KEYS = ('URL', 'USERNAME', 'PASSWORD', 'OPCUA_NODE_IDs', 'H2_FLOW_ID')
+SQL_REQUIRED_KEYS = ('DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_TABLE',
+                     'DB_COLUMNS')
+# Defaults of the optional connection pool settings in config_sql.yaml
+POOL_DEFAULTS = {'POOL_SIZE': 2, 'POOL_PROBE_AFTER_IDLE': 30, 'POOL_CHECKOUT_TIMEOUT': 5}
+MAX_ADDRESS = 0xFFFF    # Highest Modbus register address on the wire
+MAX_SLAVE_ID = 247      # Highest Modbus unicast slave ID
+
+def validate_config(config: Any, required_keys: Iterable[str], name: str) -> None:
+    """
+        Checks that a configuration contains all required keys.
+        :param config: Loaded YAML configuration
+        :param required_keys: Keys that must be present
+        :param name: Name of the configuration for the error message
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"{name} configuration is not a mapping")
+    missing = [key for key in required_keys if key not in config]
+    if missing:
+        raise ValueError(f"{name} configuration is missing {missing}")
+
+def require(condition: bool, name: str, message: str) -> None:
+    """
+        Raises a ValueError naming the configuration if a check failed.
+        :param condition: Result of the check
+        :param name: Name of the configuration for the error message
+        :param message: Description of the invalid setting
+    """
+    if not condition:
+        raise ValueError(f"{name} configuration: {message}")
+
+def is_number(value: Any) -> bool:
+    """
+        :param value: Configuration value
+        :return: True for int and float values (booleans excluded)
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def is_integer(value: Any) -> bool:
+    """
+        :param value: Configuration value
+        :return: True for int values (booleans excluded)
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@dataclass(frozen=True, slots=True)
+class ModbusSettings:
+    """ Compiled Modbus configuration with the register addresses on the wire. """
+    slave_id: int
+    base_offset: int
+    status_address: int         # PEMEL_STATUS ADDRESS without BASE_REGISTER_OFFSET
+    process_address: int        # PROCESS_VALUES ADDRESS without BASE_REGISTER_OFFSET
+    process_count: int
+    process_names: tuple        # Names of the process values (REG_i, None if not named)
+    process_index: Mapping      # Position of each named process value
+    max_retries: int
+    retry_interval: float
+    timeout: float
+    min_current: int
+    max_current: int
+    h2_flow_array: str
+    h2_flow_resolution: float
+    write_read_back: bool
+
+@dataclass(frozen=True, slots=True)
+class OPCUASettings:
+    """ Compiled OPC UA configuration with the node ID lists. """
+    url: str
+    username: str
+    node_ids: tuple
+    h2_flow_ids: tuple          # H2_FLOW_ID as tuple (a single node ID in the YAML file)
+    mirror_nodes: tuple         # MIRROR_NODES as (process value name, node ID)
+    write_deadband: float
+
+@dataclass(frozen=True, slots=True)
+class SQLSettings:
+    """ Compiled SQL configuration with the column mapping of DB_TABLE. """
+    table: str
+    columns: tuple
+    column_index: Mapping       # Position of each column in DB_COLUMNS
+    status_packed: bool
+    status_column: str
+    events_table: str
+    events_columns: tuple
+
+def compile_gen_config(config: Any) -> tuple[ScanGroup, ...]:
+    """
+        Validates the general configuration (config_gen.yaml). (The threads read the shared
+        dictionary in every cycle for hot reload)
+        :param config: Loaded YAML configuration
+        :return: Scan groups of SCAN_GROUPS (empty if not configured)
+    """
+    name = "General"
+    validate_config(config, GEN_REQUIRED_KEYS, name)
+    for key in GEN_REQUIRED_KEYS:
+        require(is_number(config[key]) and config[key] > 0, name, f"{key} must be positive")
+    for key in GEN_OPTIONAL_INTERVALS:
+        if key in config:
+            require(is_number(config[key]) and config[key] > 0, name, f"{key} must be positive")
+    require(config.get('RECONNECTION_BACKOFF_MIN', 1) <= config.get('RECONNECTION_BACKOFF_MAX', 60),
+            name, "RECONNECTION_BACKOFF_MIN must not exceed RECONNECTION_BACKOFF_MAX")
+    row_buffer_size = config.get('ROW_BUFFER_SIZE', 8640)
+    require(is_integer(row_buffer_size) and row_buffer_size > 0, name,
+            "ROW_BUFFER_SIZE must be a positive integer")
+    shutdown_timeout = config.get('SHUTDOWN_TIMEOUT', 8)
+    require(is_number(shutdown_timeout) and shutdown_timeout >= 0, name,
+            "SHUTDOWN_TIMEOUT must not be negative")
+    require(config.get('LOG_FORMAT', 'json') in ('json', 'text'), name,
+            "LOG_FORMAT must be 'json' or 'text'")
+    require(config.get('LOG_ROTATION', 'size') in ('size', 'time'), name,
+            "LOG_ROTATION must be 'size' or 'time'")
+    scan_groups = config.get('SCAN_GROUPS') or []
+    require(isinstance(scan_groups, list), name, "SCAN_GROUPS must be a list")
+    try:
+        groups = tuple(ScanGroup(group) for group in scan_groups)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{name} configuration: invalid scan group ({e!r})") from e
+    return groups
+
+def compile_modbus_config(config: Any) -> ModbusSettings:
+    """
+        Validates the Modbus configuration (config_modbus.yaml, with the CONTROL_CONNECTION
+        profile already applied for the control connection).
+        :param config: Loaded YAML configuration
+        :return: Modbus settings
+    """
+    name = "Modbus"
+    validate_config(config, MODBUS_REQUIRED_KEYS, name)
+    transport = config.get('TRANSPORT', 'tcp')
+    require(transport in TRANSPORTS, name, f"TRANSPORT must be one of {TRANSPORTS}")
+    if transport == 'serial':
+        require(isinstance(config.get('SERIAL'), dict) and 'PORT' in config['SERIAL'], name,
+                "SERIAL with PORT is required for the serial transport")
+    require(is_integer(config['SLAVE_ID']) and 0 <= config['SLAVE_ID'] <= MAX_SLAVE_ID, name,
+            f"SLAVE_ID must be an integer in 0 - {MAX_SLAVE_ID}")
+    base_offset = config['BASE_REGISTER_OFFSET']
+    require(is_integer(base_offset), name, "BASE_REGISTER_OFFSET must be an integer")
+
+    def wire_address(key: str, address: Any, count: int = 1) -> int:
+        require(is_integer(address), name, f"{key} must be an integer address")
+        require(0 <= address - base_offset and address - base_offset + count - 1 <= MAX_ADDRESS,
+                name, f"{key} {address:#x} is out of range with BASE_REGISTER_OFFSET")
+        return address - base_offset
+
+    status = config['PEMEL_STATUS']
+    process = config['PROCESS_VALUES']
+    require(isinstance(status, dict) and isinstance(process, dict), name,
+            "PEMEL_STATUS and PROCESS_VALUES must be mappings")
+    process_count = process.get('COUNT')
+    require(is_integer(process_count) and 1 <= process_count <= MAX_REGISTER_COUNT, name,
+            f"PROCESS_VALUES COUNT must be an integer in 1 - {MAX_REGISTER_COUNT}")
+    status_address = wire_address("PEMEL_STATUS ADDRESS", status.get('ADDRESS'))
+    process_address = wire_address("PROCESS_VALUES ADDRESS", process.get('ADDRESS'),
+                                   process_count)
+    wire_address("WRITE_REGISTER", config['WRITE_REGISTER'])
+    set_points = config.get('SET_POINTS') or {}
+    require(isinstance(set_points, dict), name, "SET_POINTS must be a mapping")
+    for set_point, address in set_points.items():
+        wire_address(f"SET_POINTS {set_point}", address)
+
+    require(is_integer(config['MAX_RETRIES']) and config['MAX_RETRIES'] >= 1, name,
+            "MAX_RETRIES must be at least 1")
+    require(is_number(config['RETRY_INTERVAL']) and config['RETRY_INTERVAL'] >= 0, name,
+            "RETRY_INTERVAL must not be negative")
+    require(is_number(config['TIMEOUT']) and config['TIMEOUT'] > 0, name,
+            "TIMEOUT must be positive")
+    require(is_integer(config['MIN_CURRENT']) and is_integer(config['MAX_CURRENT'])
+            and 0 <= config['MIN_CURRENT'] <= config['MAX_CURRENT'], name,
+            "MIN_CURRENT and MAX_CURRENT must be integers with 0 <= MIN_CURRENT <= MAX_CURRENT")
+    resolution = config.get('H2_FLOW_RESOLUTION', 0)
+    require(is_number(resolution) and resolution >= 0, name,
+            "H2_FLOW_RESOLUTION must not be negative")
+
+    process_names = tuple(process.get(f"REG_{i}") for i in range(process_count))
+    return ModbusSettings(
+        slave_id=config['SLAVE_ID'],
+        base_offset=base_offset,
+        status_address=status_address,
+        process_address=process_address,
+        process_count=process_count,
+        process_names=process_names,
+        process_index=MappingProxyType({pv_name: i for i, pv_name in enumerate(process_names)
+                                        if pv_name is not None}),
+        max_retries=config['MAX_RETRIES'],
+        retry_interval=config['RETRY_INTERVAL'],
+        timeout=config['TIMEOUT'],
+        min_current=config['MIN_CURRENT'],
+        max_current=config['MAX_CURRENT'],
+        h2_flow_array=str(config['H2_FLOW_ARRAY']),
+        h2_flow_resolution=resolution,
+        write_read_back=bool(config.get('WRITE_READ_BACK', False))
+    )
+
+def compile_opcua_config(config: Any) -> OPCUASettings:
+    """
+        Validates the OPC UA configuration (config_opcua.yaml).
+        :param config: Loaded YAML configuration
+        :return: OPC UA settings
+    """
+    name = "OPC UA"
+    validate_config(config, OPCUA_REQUIRED_KEYS, name)
+    node_ids = config['OPCUA_NODE_IDs']
+    require(isinstance(node_ids, list) and all(isinstance(n, str) for n in node_ids), name,
+            "OPCUA_NODE_IDs must be a list of node IDs")
+    h2_flow_ids = config['H2_FLOW_ID']
+    if isinstance(h2_flow_ids, str):
+        h2_flow_ids = [h2_flow_ids]
+    require(isinstance(h2_flow_ids, list) and len(h2_flow_ids) == 1
+            and isinstance(h2_flow_ids[0], str), name, "H2_FLOW_ID must be one node ID")
+    mirror_nodes = config.get('MIRROR_NODES') or {}
+    require(isinstance(mirror_nodes, dict), name, "MIRROR_NODES must be a mapping")
+    deadband = config.get('WRITE_DEADBAND', 0)
+    require(is_number(deadband) and deadband >= 0, name, "WRITE_DEADBAND must not be negative")
+    return OPCUASettings(
+        url=config['URL'],
+        username=config['USERNAME'],
+        node_ids=tuple(node_ids),
+        h2_flow_ids=tuple(h2_flow_ids),
+        mirror_nodes=tuple(mirror_nodes.items()),
+        write_deadband=deadband
+    )
+
+def compile_sql_config(config: Any) -> SQLSettings:
+    """
+        Validates the SQL configuration (config_sql.yaml).
+        :param config: Loaded YAML configuration
+        :return: SQL settings
+    """
+    name = "SQL"
+    validate_config(config, SQL_REQUIRED_KEYS, name)
+    columns = config['DB_COLUMNS']
+    require(isinstance(columns, list) and len(columns) > 1
+            and all(isinstance(c, str) for c in columns), name,
+            "DB_COLUMNS must be a list of column names starting with the timestamp")
+    require(len(set(columns)) == len(columns), name, "DB_COLUMNS contains duplicates")
+    status_packed = bool(config.get('STATUS_PACKED', False))
+    status_column = config.get('STATUS_COLUMN', 'status_word')
+    if status_packed:
+        require(status_column in columns, name,
+                f"STATUS_COLUMN '{status_column}' is missing in DB_COLUMNS")
+    pool_size = config.get('POOL_SIZE', POOL_DEFAULTS['POOL_SIZE'])
+    require(is_integer(pool_size) and pool_size > 0, name, "POOL_SIZE must be a positive integer")
+    checkout_timeout = config.get('POOL_CHECKOUT_TIMEOUT', POOL_DEFAULTS['POOL_CHECKOUT_TIMEOUT'])
+    require(is_number(checkout_timeout) and checkout_timeout > 0, name,
+            "POOL_CHECKOUT_TIMEOUT must be positive")
+    probe_after_idle = config.get('POOL_PROBE_AFTER_IDLE', POOL_DEFAULTS['POOL_PROBE_AFTER_IDLE'])
+    require(is_number(probe_after_idle) and probe_after_idle >= 0, name,
+            "POOL_PROBE_AFTER_IDLE must not be negative")
+    return SQLSettings(
+        table=config['DB_TABLE'],
+        columns=tuple(columns),
+        column_index=MappingProxyType({column: i for i, column in enumerate(columns)}),
+        status_packed=status_packed,
+        status_column=status_column,
+        events_table=config.get('EVENTS_TABLE') or '',
+        events_columns=tuple(config.get('EVENTS_COLUMNS') or ())
+    )
+
+def row_layout(modbus: ModbusSettings, opcua: OPCUASettings, sql: SQLSettings) -> RowLayout:
+    """
+        :param modbus: Modbus settings
+        :param opcua: OPC UA settings
+        :param sql: SQL settings
+        :return: Row layout of the data storage
+    """
+    return RowLayout(len(opcua.node_ids), modbus.process_count, sql.status_packed)
+
+def check_columns(layout: RowLayout, sql: SQLSettings) -> None:
+    """
+        Checks that DB_COLUMNS has one column per value of the row layout.
+        :param layout: Row layout of the data storage
+        :param sql: SQL settings
+    """
+    status_count = 1 if layout.packed else STATUS_BITS
+    require(len(sql.columns) == layout.width, "SQL",
+            f"{len(sql.columns)} DB_COLUMNS do not match the timestamp, "
+            f"{layout.status - layout.opcua} OPCUA_NODE_IDs, {status_count} status columns, and "
+            f"{layout.width - layout.process} PROCESS_VALUES")
+
+def load_yaml(path: str) -> Any:
+    """
+        :param path: Path of the configuration file
+        :return: Loaded YAML configuration
+    """
+    with open(path, "r", encoding="utf-8") as env_file:
+        return yaml.safe_load(env_file)
+
+def check_configs(configs: dict[str, Any]) -> None:
+    """
+        Checks the consistency between the configuration files (at startup and before a
+        reloaded file is applied).
+        :param configs: Configurations by name ('gen', 'modbus', 'opcua', 'sql')
+    """
+    # A request still running on shutdown must end within SHUTDOWN_TIMEOUT (the retries end
+    # with the stop event), so that the buffered rows can be drained afterwards
+    shutdown_timeout = configs['gen'].get('SHUTDOWN_TIMEOUT', 8)
+    if shutdown_timeout > 0:
+        require(configs['modbus']['TIMEOUT'] < shutdown_timeout, 'modbus',
+                f"TIMEOUT must be below SHUTDOWN_TIMEOUT ({shutdown_timeout} s)")
+    # DB_COLUMNS is only used by the data storage (scan groups have their own columns)
+    if not configs['gen'].get('SCAN_GROUPS'):
+        sql = compile_sql_config(configs['sql'])
+        check_columns(row_layout(compile_modbus_config(configs['modbus']),
+                                 compile_opcua_config(configs['opcua']), sql), sql)
+
+def load_configs(files: Optional[dict[str, str]] = None) -> dict[str, Any]:
+    """
+        Loads and validates all configuration files at startup, so that configuration errors
+        stop the service instead of failing in the threads.
+        :param files: Paths of the configuration files by name (None for CONFIG_FILES)
+        :return: Validated configurations by name ('gen', 'modbus', 'opcua', 'sql')
+    """
+    files = files or CONFIG_FILES
+
+    def compile_modbus_profiles(config: Any) -> ModbusSettings:
+        modbus = compile_modbus_config(config)
+        if config.get('CONTROL_CONNECTION'):    # Profile of the PEMEL control connection
+            compile_modbus_config({**config, **config['CONTROL_CONNECTION']})
+        return modbus
+
+    compilers = {'gen': compile_gen_config, 'modbus': compile_modbus_profiles,
+                 'opcua': compile_opcua_config, 'sql': compile_sql_config}
+    configs = {}
+    for name, compiler in compilers.items():
+        try:
+            configs[name] = load_yaml(files[name])
+            compiler(configs[name])
+        except (OSError, yaml.YAMLError, ValueError) as e:
+            raise ValueError(f"Invalid configuration file {files[name]}: {e}") from e
+    check_configs(configs)
+    return configs
@@ -0,0 +1,126 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_control.py:
+> Implements the low-latency executor of the PEMEL control loop with fixed-period scheduling
+  and cycle-to-cycle jitter monitoring
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Optional
+from collections import deque
+
+JITTER_SAMPLES = 1000   # Number of cycles used for the jitter percentiles
+
+class ControlExecutor:
+    """ Runs the control cycle with a fixed period and monitors its timing. """
+    def __init__(
+            self,
+            gen_config: dict[str, Any],
+            clock: Callable[[], float] = time.monotonic
+        ) -> None:
+        """
+            :param gen_config: General configuration with PEMEL_CONTROL_INTERVAL in [s] and the
+                               optional JITTER_REPORT_INTERVAL in [s] (read in every cycle for
+                               hot reload)
+            :param clock: Monotonic clock in [s] of the schedule (replaceable for tests)
+        """
+        self.gen_config = gen_config
+        self.clock = clock
+        self.jitter = deque(maxlen=JITTER_SAMPLES)  # Cycle-to-cycle jitter in [ms]
+        self.durations = deque(maxlen=JITTER_SAMPLES)   # Duration of the cycle function in [ms]
+        self.overruns = 0   # Number of cycles that exceeded the control interval
+        self.last_start = None
+        self.last_report = clock()
+        self.wake_event = threading.Event()
+
+    def wake(self) -> None:
+        """
+            Runs the next cycle immediately instead of at its deadline (e.g. on a status event).
+            (Thread-safe)
+        """
+        self.wake_event.set()
+
+    def run(
+            self,
+            cycle: Callable[[], Any],
+            cycles: Optional[int] = None,
+            stop_event: Optional[threading.Event] = None
+        ) -> None:
+        """
+            Calls the cycle function at fixed deadlines (start + n * interval) instead of
+            sleeping for the interval after each cycle, so that the cycle duration does not
+            add up to a drift. Cycles missed due to an overrun are skipped.
+            :param cycle: Control cycle function
+            :param cycles: Number of cycles to run (None for an infinite loop)
+            :param stop_event: Event ending the loop after the current cycle
+        """
+        deadline = self.clock()
+        while (cycles is None or cycles > 0) and not (stop_event and stop_event.is_set()):
+            delay = deadline - self.clock()
+            if delay > 0 and self.wake_event.wait(delay):
+                deadline = self.clock()     # Woken up early, restart the schedule
+                self.last_start = None
+            self.wake_event.clear()
+
+            start = self.clock()
+            interval = self.gen_config['PEMEL_CONTROL_INTERVAL']
+            if self.last_start is not None:
+                self.jitter.append(abs(start - self.last_start - interval) * 1000)
+            self.last_start = start
+
+            try:
+                cycle()
+            except Exception as e:
+                # A failed cycle must not end the schedule of the following cycles
+                logging.error("Error in PEMEL control cycle: %s", e)
+
+            end = self.clock()
+            self.durations.append((end - start) * 1000)
+            deadline += interval
+            if deadline < end:
+                self.overruns += 1
+                # Skip the missed cycles and restart the schedule (the late start of the next
+                # cycle is recorded as jitter)
+                deadline = end
+            if end - self.last_report >= self.gen_config.get('JITTER_REPORT_INTERVAL', 60):
+                self.report()
+                self.last_report = end
+            if cycles is not None:
+                cycles -= 1
+
+    @staticmethod
+    def percentiles(samples: deque) -> dict[str, float]:
+        """
+            Computes the percentiles of timing samples (nearest rank).
+            :param samples: Timing samples in [ms]
+            :return: Dictionary with p50, p95, p99, and max in [ms]
+        """
+        if not samples:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+        return {
+            'p50': ordered[round(0.50 * last)],
+            'p95': ordered[round(0.95 * last)],
+            'p99': ordered[round(0.99 * last)],
+            'max': ordered[last],
+        }
+
+    def report(self) -> None:
+        """
+            Logs the jitter and duration percentiles of the recent control cycles.
+        """
+        jitter = self.percentiles(self.jitter)
+        durations = self.percentiles(self.durations)
+        logging.info("PEMEL control timing over %s cycles - jitter p50/p95/p99/max: "
+                     "%.1f/%.1f/%.1f/%.1f ms, duration p50/p99: %.1f/%.1f ms, overruns: %s",
+                     len(self.durations), jitter['p50'], jitter['p95'], jitter['p99'],
+                     jitter['max'], durations['p50'], durations['p99'], self.overruns)
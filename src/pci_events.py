@@ -0,0 +1,173 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_events.py:
+> Implements the edge-triggered status change events: the status words read from the PEMEL are
+  compared with the previous word (XOR) and only the flipped bits are emitted as timestamped
+  events to the subscribers (e.g. the events table and the PEMEL control loop)
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Optional
+from datetime import datetime
+
+from src.pci_row import Row
+
+COOLING_TEMPERATURE_BIT = 10    # Hydrogen cooling temperature reached (required for PEMEL control)
+EVENTS_QUEUE_SIZE = 1000        # Maximum number of status events waiting for the database
+EVENTS_RETRY_INTERVAL = 1       # Time between the inserts of the kept events in [s]
+
+class StatusEvent:
+    """ Change of one PEMEL status bit. """
+    __slots__ = ('timestamp', 'bit', 'name', 'value')
+
+    def __init__(self, timestamp: datetime, bit: int, name: str, value: int) -> None:
+        """
+            :param timestamp: Time of the status read that detected the change
+            :param bit: Number of the bit
+            :param name: Name of the bit (from PEMEL_STATUS)
+            :param value: New value of the bit (1: set, 0: cleared)
+        """
+        self.timestamp = timestamp
+        self.bit = bit
+        self.name = name
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"StatusEvent({self.timestamp.isoformat()}, {self.name}={self.value})"
+
+class StatusChangeDetector:
+    """ Detects flipped status bits and notifies the subscribers. """
+    def __init__(self, bit_names: list[str]) -> None:
+        """
+            :param bit_names: Names of the bits 0 - 15 (see pci_status.status_bit_names())
+        """
+        self.bit_names = bit_names
+        self.previous = None    # Last status word (None until the first read)
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[StatusEvent], None]) -> None:
+        """
+            Registers a function called with each status event. (Called in the thread that
+            read the status word, so it must not block)
+            :param callback: Function receiving a StatusEvent
+        """
+        self.subscribers.append(callback)
+
+    def update(self, word: int, timestamp: Optional[datetime] = None) -> list[StatusEvent]:
+        """
+            Compares a status word with the previous one and emits the flipped bits.
+            (The status is read by several threads, the detector is shared between them)
+            :param word: Status word read from the PEMEL
+            :param timestamp: Time of the read (None for the current time)
+            :return: List of the status events (empty if no bit changed or on the first read)
+        """
+        with self.lock:
+            previous, self.previous = self.previous, word
+        if previous is None:
+            return []
+        changed = previous ^ word
+        if not changed:
+            return []
+
+        if timestamp is None:
+            timestamp = datetime.now()
+        events = []
+        for bit, name in enumerate(self.bit_names):
+            if changed >> bit & 1:
+                events.append(StatusEvent(timestamp, bit, name, word >> bit & 1))
+        for event in events:
+            logging.info("PEMEL status changed: %s = %s", event.name, event.value)
+            for callback in self.subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logging.error("Error in status event subscriber: %s", e)
+        return events
+
+class EventWriter:
+    """ Writes the status events to the events table without blocking the reading threads. """
+    def __init__(
+            self,
+            sql_connection: Any,
+            table: str,
+            columns: list[str],
+            capacity: int = EVENTS_QUEUE_SIZE
+        ) -> None:
+        """
+            :param sql_connection: SQL connection providing insert_rows()
+            :param table: Events table (EVENTS_TABLE)
+            :param columns: Columns of the events table: timestamp, bit, name, value
+            :param capacity: Maximum number of events waiting for the database (e.g. during an
+                             SQL outage), further events are dropped
+        """
+        self.sql_connection = sql_connection
+        self.table = table
+        self.columns = columns
+        self.queue = queue.Queue(maxsize=capacity)
+        self.dropped = 0    # Number of events dropped because the queue was full
+
+    def __call__(self, event: StatusEvent) -> None:
+        """
+            Subscriber function queueing an event for the writer thread.
+            :param event: Status event
+        """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if (self.dropped - 1) % self.queue.maxsize == 0:    # Once per queue length
+                logging.warning("Status event queue full, %s events dropped", self.dropped)
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        """
+            Contains the thread function for writing the queued events to the events table.
+            The events are kept queued while the SQL connection is lost and are written in one
+            transaction once it is up again.
+            :param stop_event: Event ending the loop once the queue is empty (None to run until
+                               the process exits)
+        """
+        pending = []
+        while True:
+            if not pending:
+                try:
+                    pending.append(self.queue.get(timeout=1))
+                except queue.Empty:
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    continue
+            while len(pending) < self.queue.maxsize:
+                try:
+                    pending.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self.sql_connection.insert_rows([self.row(event) for event in pending],
+                                               table=self.table, columns=self.columns):
+                pending = []
+            elif stop_event is None:
+                time.sleep(EVENTS_RETRY_INTERVAL)
+            elif stop_event.is_set():
+                logging.error("Stopped with %s status events not stored", len(pending))
+                return
+            else:
+                stop_event.wait(EVENTS_RETRY_INTERVAL)  # Last attempt after the stop
+
+    @staticmethod
+    def row(event: StatusEvent) -> Row:
+        """
+            :param event: Status event
+            :return: Row record of the events table
+        """
+        row = Row(4)
+        row.stamp(event.timestamp)
+        row.values[1:] = [event.bit, event.name, event.value]
+        return row
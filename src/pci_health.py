@@ -0,0 +1,180 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_health.py:
+> Implements the event-driven connection supervision: one reconnect worker per connection,
+  triggered by failures on the hot path, with exponential backoff and health states that the
+  data storage and control loops can wait on
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import logging
+import threading
+from typing import Any, Iterable, Optional
+
+UP = 'up'               # Connected
+DEGRADED = 'degraded'   # Failure reported, reconnecting
+DOWN = 'down'           # Reconnect failed, retrying with backoff
+
+class ConnectionHealth:
+    """ Health state and reconnect worker of one connection. """
+    def __init__(
+            self,
+            name: str,
+            connection: Any,
+            gen_config: dict[str, Any],
+            condition: threading.Condition,
+            stop_event: Optional[threading.Event] = None
+        ) -> None:
+        """
+            :param name: Name of the connection for logging
+            :param connection: Connection providing connect() and is_connected()
+            :param gen_config: General configuration with RECONNECTION_INTERVAL,
+                               RECONNECTION_BACKOFF_MIN, and RECONNECTION_BACKOFF_MAX in [s]
+                               (read in every cycle for hot reload)
+            :param condition: Condition shared by the connections, notified on state changes
+            :param stop_event: Event ending the worker (None to run until the process exits)
+        """
+        self.name = name
+        self.connection = connection
+        self.gen_config = gen_config
+        self.condition = condition
+        self.state = DOWN
+        self.trigger = threading.Event()
+        self.trigger.set()  # Check the connection as soon as the worker starts
+        self.reconnect_requested = False    # Set by a configuration change (see request_reconnect)
+        self.stop_event = stop_event or threading.Event()
+
+    def set_state(self, state: str) -> None:
+        """
+            Changes the health state and wakes the threads waiting for it.
+            :param state: UP, DEGRADED, or DOWN
+        """
+        with self.condition:
+            if state == self.state:
+                return
+            self.state = state
+            self.condition.notify_all()
+        logging.log(logging.INFO if state == UP else logging.WARNING,
+                    "Connection %s is %s", self.name, state)
+
+    def report_failure(self) -> None:
+        """
+            Reports a failed call on the hot path (called by the connection), so that the worker
+            reconnects immediately instead of at the next periodic check.
+        """
+        if self.state == UP:
+            self.set_state(DEGRADED)
+            self.trigger.set()
+
+    def request_reconnect(self) -> None:
+        """
+            Requests a reconnect of a working connection after a configuration change (called by
+            the config watcher), so that only the worker replaces the client of the connection.
+        """
+        self.reconnect_requested = True
+        self.trigger.set()
+
+    def run(self) -> None:
+        """
+            Contains the thread function of the reconnect worker: checks the connection every
+            RECONNECTION_INTERVAL (or immediately on a failure) and reconnects with backoff.
+        """
+        backoff = self.gen_config.get('RECONNECTION_BACKOFF_MIN', 1)
+        while not self.stop_event.is_set():
+            try:
+                timeout = (self.gen_config['RECONNECTION_INTERVAL'] if self.state == UP
+                           else backoff)
+                self.trigger.wait(timeout)
+                self.trigger.clear()
+                if self.stop_event.is_set():
+                    break
+
+                if self.reconnect_requested or not self.connection.is_connected():
+                    self.reconnect_requested = False
+                    if self.state == UP:
+                        self.set_state(DEGRADED)
+                    logging.warning("Reconnecting %s...", self.name)
+                    self.connection.connect()
+                if self.connection.is_connected():
+                    self.set_state(UP)
+                    backoff = self.gen_config.get('RECONNECTION_BACKOFF_MIN', 1)
+                else:
+                    self.set_state(DOWN)
+                    backoff = min(backoff * 2, self.gen_config.get('RECONNECTION_BACKOFF_MAX', 60))
+            except Exception as e:
+                logging.error("Error in reconnect worker of %s: %s", self.name, e)
+
+class Supervisor:
+    """ Starts the reconnect workers and provides the health states of the connections. """
+    def __init__(
+            self,
+            gen_config: dict[str, Any],
+            connections: dict[str, Any],
+            stop_event: Optional[threading.Event] = None
+        ) -> None:
+        """
+            :param gen_config: General configuration with the reconnection settings
+            :param connections: Connections by name (each gets a health attribute)
+            :param stop_event: Event ending the workers (see stop())
+        """
+        self.condition = threading.Condition()
+        self.health = {}
+        self.threads = []   # Started reconnect workers
+        for name, connection in connections.items():
+            health = ConnectionHealth(name, connection, gen_config, self.condition, stop_event)
+            connection.health = health
+            self.health[name] = health
+
+    def start(self, *names: str) -> None:
+        """
+            Starts one reconnect worker thread per connection, so that a blocking connect()
+            does not delay the recovery of the other connections.
+            :param names: Connections to supervise (e.g. once their initial connect finished),
+                          all connections if none are given
+        """
+        for name in names or self.health:
+            health = self.health[name]
+            thread = threading.Thread(target=health.run, name=f"reconnect-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        """
+            Wakes the workers, so that they end once the stop event is set.
+        """
+        for health in self.health.values():
+            health.trigger.set()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+            Waits for the reconnect workers after the stop event was set.
+            :param timeout: Maximum waiting time per worker in [s] (None for no limit)
+        """
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def states(self) -> dict[str, str]:
+        """
+            :return: Health states by connection name
+        """
+        return {name: health.state for name, health in self.health.items()}
+
+def wait_up(connections: Iterable[Any], timeout: Optional[float] = None) -> bool:
+    """
+        Waits until all connections are up (instead of polling them).
+        :param connections: Connections (without a health attribute, they count as up)
+        :param timeout: Maximum waiting time in [s] (None for no limit)
+        :return: True if all connections are up, False on timeout
+    """
+    healths = [connection.health for connection in connections
+               if getattr(connection, 'health', None) is not None]
+    if not healths:
+        return True
+    condition = healths[0].condition
+    with condition:
+        return condition.wait_for(lambda: all(h.state == UP for h in healths), timeout)
@@ -0,0 +1,343 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_history.py:
+> Implements the in-memory history of the recent process data (ring buffer over HISTORY_WINDOW
+  with a time index for binary search) and its local HTTP/JSON API with optional downsampling,
+  so that dashboards and the optimizer do not query the SQL database for recent data
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import os
+import json
+import math
+import logging
+import threading
+from array import array
+from datetime import datetime
+from typing import Any, Iterable, Optional, Sequence
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from src.pci_config import load_yaml
+
+HISTORY_CONFIG_FILE = "config/config_history.yaml"
+
+class HistoryBuffer:
+    """ Ring buffer of the recent rows with a shared time index of all tags (DB_COLUMNS). """
+    def __init__(self, columns: Sequence[str], window: float, capacity: int) -> None:
+        """
+            :param columns: Column names of the rows (DB_COLUMNS), the first is the timestamp
+            :param window: Time window of the history in [s]
+            :param capacity: Maximum number of rows, e.g. HISTORY_WINDOW / DATA_STORAGE_INTERVAL
+                             (if the interval is reduced at runtime, the oldest rows are dropped
+                             before the window is reached)
+        """
+        self.tags = tuple(columns[1:])
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+        self.window = window
+        self.capacity = max(1, capacity)
+        # Timestamps in [s] since the epoch, ascending from the oldest row at 'start'
+        self.times = array('d', bytes(8 * self.capacity))
+        self.values = [[None] * self.capacity for _ in self.tags]     # Column-wise values
+        self.start = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def write_row(self, timestamp: datetime, values: Iterable[Any]) -> None:
+        """
+            Appends one row and drops the rows outside the window (data sink interface).
+            :param timestamp: Timestamp of the row
+            :param values: Process values in the order of DB_COLUMNS (without the timestamp)
+        """
+        try:
+            time = timestamp.timestamp()
+            with self.lock:
+                if self.count and time <= self.times[(self.start + self.count - 1)
+                                                     % self.capacity]:
+                    # Keeps the time index sorted (e.g. clock set back)
+                    logging.warning("History: row of %s is not newer than the last row, skipped",
+                                    timestamp)
+                    return
+                while self.count and self.times[self.start] < time - self.window:
+                    self.drop_oldest()
+                if self.count == self.capacity:
+                    self.drop_oldest()
+                position = (self.start + self.count) % self.capacity
+                self.times[position] = time
+                for column, value in zip(self.values, values):
+                    column[position] = value
+                self.count += 1
+        except Exception as e:
+            logging.error("Error writing data to the history: %s", e)
+
+    def drop_oldest(self) -> None:
+        """ Drops the oldest row (the values are overwritten by the next rows). """
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def bisect(self, time: float) -> int:
+        """
+            :param time: Time in [s] since the epoch
+            :return: Position of the first row at or after the time (relative to the oldest row)
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[(self.start + middle) % self.capacity] < time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def columns_of(self, tags: Optional[Sequence[str]]) -> list[int]:
+        """
+            :param tags: Requested tags (None for all)
+            :return: Column indices of the tags
+        """
+        if not tags:
+            return list(range(len(self.tags)))
+        unknown = [tag for tag in tags if tag not in self.tag_index]
+        if unknown:
+            raise ValueError(f"Unknown tags: {', '.join(unknown)}")
+        return [self.tag_index[tag] for tag in tags]
+
+    def select(
+            self,
+            start: float,
+            end: float,
+            tags: Optional[Sequence[str]] = None
+        ) -> tuple[list[float], dict[str, list]]:
+        """
+            Copies the rows of a time range (binary search of both ends in the time index).
+            :param start: Start of the range in [s] since the epoch (inclusive)
+            :param end: End of the range in [s] since the epoch (exclusive)
+            :param tags: Requested tags (None for all)
+            :return: Timestamps in [s] and the values by tag
+        """
+        columns = self.columns_of(tags)
+        with self.lock:
+            first, last = self.bisect(start), self.bisect(end)
+            positions = [(self.start + i) % self.capacity for i in range(first, last)]
+            times = [self.times[p] for p in positions]
+            values = {self.tags[c]: [self.values[c][p] for p in positions] for c in columns}
+        return times, values
+
+    def latest(self, tags: Optional[Sequence[str]] = None) -> tuple[Optional[float], dict]:
+        """
+            :param tags: Requested tags (None for all)
+            :return: Timestamp in [s] and the values by tag of the last row (None if empty)
+        """
+        columns = self.columns_of(tags)
+        with self.lock:
+            if not self.count:
+                return None, {}
+            position = (self.start + self.count - 1) % self.capacity
+            return self.times[position], {self.tags[c]: self.values[c][position]
+                                          for c in columns}
+
+    def time_range(self) -> tuple[Optional[float], Optional[float], int]:
+        """
+            :return: Timestamps of the oldest and the last row in [s] and the number of rows
+        """
+        with self.lock:
+            if not self.count:
+                return None, None, 0
+            return (self.times[self.start],
+                    self.times[(self.start + self.count - 1) % self.capacity], self.count)
+
+    def close(self) -> None:
+        """ Stops the API (data sink interface). """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def downsample(
+        times: list[float],
+        values: dict[str, list],
+        step: float,
+        max_buckets: Optional[int] = None
+    ) -> tuple[list[float], dict[str, dict[str, list]]]:
+    """
+        Aggregates the rows into buckets of the step, aligned to multiples of the step.
+        :param times: Timestamps in [s] (ascending)
+        :param values: Values by tag (None and NaN values are ignored)
+        :param step: Bucket size in [s]
+        :param max_buckets: Maximum number of buckets (None for no limit)
+        :return: Bucket start times in [s] and min, max, and avg per bucket by tag
+    """
+    buckets = []
+    bounds = []     # Row positions where each bucket starts
+    for i, time in enumerate(times):
+        bucket = math.floor(time / step) * step
+        if not buckets or bucket != buckets[-1]:
+            buckets.append(bucket)
+            bounds.append(i)
+    if max_buckets is not None and len(buckets) > max_buckets:
+        raise ValueError(f"{len(buckets)} buckets exceed HISTORY_MAX_POINTS ({max_buckets}), "
+                         "use a larger 'step'")
+    bounds.append(len(times))
+    result = {}
+    for tag, column in values.items():
+        aggregates = {'min': [], 'max': [], 'avg': []}
+        for first, last in zip(bounds, bounds[1:]):
+            bucket_values = [value for value in column[first:last]
+                             if value is not None and value == value]   # Not NaN
+            aggregates['min'].append(min(bucket_values) if bucket_values else None)
+            aggregates['max'].append(max(bucket_values) if bucket_values else None)
+            aggregates['avg'].append(sum(bucket_values) / len(bucket_values)
+                                     if bucket_values else None)
+        result[tag] = aggregates
+    return buckets, result
+
+def json_value(value: Any) -> Any:
+    """
+        :param value: Value of a response (also nested lists and dictionaries)
+        :return: Value with NaN and infinite values replaced by None (null in JSON)
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_value(item) for item in value]
+    return value
+
+def parse_time(value: str) -> float:
+    """
+        :param value: Time in ISO format (local time like the row timestamps) or in [s] since
+                      the epoch
+        :return: Time in [s] since the epoch
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def format_time(time: Optional[float]) -> Optional[str]:
+    """
+        :param time: Time in [s] since the epoch
+        :return: Local time in ISO format (like the row timestamps)
+    """
+    if time is None:
+        return None
+    return datetime.fromtimestamp(time).isoformat(timespec='milliseconds')
+
+class HistoryRequestHandler(BaseHTTPRequestHandler):
+    """ Serves the GET requests of the history API as JSON. """
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """ Dispatches the endpoints /tags, /latest, and /range. """
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        tags = [tag for tag in params.get('tags', '').split(',') if tag] or None
+        history = self.server.history
+        try:
+            if url.path == '/tags':
+                first, last, count = history.time_range()
+                self.send_json(200, {'columns': list(history.tags), 'window': history.window,
+                                     'first': format_time(first), 'last': format_time(last),
+                                     'rows': count})
+            elif url.path == '/latest':
+                time, values = history.latest(tags)
+                self.send_json(200, {'time': format_time(time), 'values': values})
+            elif url.path == '/range':
+                self.send_json(200, self.range_response(params, tags))
+            else:
+                self.send_json(404, {'error': f"Unknown endpoint {url.path}"})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            logging.error("History API request %s failed: %s", self.path, e)
+            self.send_json(500, {'error': str(e)})
+
+    def range_response(self, params: dict[str, str], tags: Optional[list[str]]) -> dict:
+        """
+            :param params: Query parameters 'start' and 'end' or 'last' in [s], and 'step' in
+                           [s] for downsampling
+            :param tags: Requested tags (None for all)
+            :return: Response with the rows or buckets of the range
+        """
+        history = self.server.history
+        end = parse_time(params['end']) if 'end' in params else math.inf
+        if 'last' in params:
+            _, last, _ = history.time_range()
+            start = (last or 0) - float(params['last'])
+        else:
+            start = parse_time(params['start']) if 'start' in params else -math.inf
+        times, values = history.select(start, end, tags)
+        if 'step' in params:
+            step = float(params['step'])
+            if step <= 0:
+                raise ValueError("step must be positive")
+            buckets, aggregates = downsample(times, values, step, self.server.max_points)
+            return {'step': step, 'time': [format_time(t) for t in buckets],
+                    'values': aggregates}
+        if len(times) > self.server.max_points:
+            raise ValueError(f"{len(times)} rows exceed HISTORY_MAX_POINTS "
+                             f"({self.server.max_points}), use 'step' to downsample")
+        return {'time': [format_time(t) for t in times], 'values': values}
+
+    def send_json(self, status: int, body: dict) -> None:
+        """
+            :param status: HTTP status code
+            :param body: Response body
+        """
+        data = json.dumps(json_value(body), allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """ Logs the requests at debug level instead of stderr. """
+        logging.debug("History API: " + format, *args)
+
+class HistoryServer(ThreadingHTTPServer):
+    """ Local HTTP server of the history API. """
+    daemon_threads = True
+
+    def __init__(self, history: HistoryBuffer, host: str, port: int, max_points: int) -> None:
+        """
+            :param history: History served by the API
+            :param host: Address of the API
+            :param port: Port of the API (0 for a free port)
+            :param max_points: Maximum number of rows of one raw response
+        """
+        super().__init__((host, port), HistoryRequestHandler)
+        self.history = history
+        self.max_points = max_points
+
+def load_history(
+        gen_config: dict[str, Any],
+        sql_config: dict[str, Any]
+    ) -> Optional[HistoryBuffer]:
+    """
+        Creates the history as data sink and starts its API, if the history is enabled.
+        :param gen_config: General configuration with DATA_STORAGE_INTERVAL in [s]
+        :param sql_config: Validated SQL configuration with the columns (DB_COLUMNS)
+        :return: History providing write_row() and close(), or None if disabled (also if
+                 config_history.yaml does not exist)
+    """
+    if not os.path.exists(HISTORY_CONFIG_FILE):
+        return None
+    history_config = load_yaml(HISTORY_CONFIG_FILE) or {}
+    if not history_config.get('HISTORY_ENABLED'):
+        return None
+    columns = sql_config['DB_COLUMNS']
+    window = history_config['HISTORY_WINDOW']
+    history = HistoryBuffer(columns, window,
+                            math.ceil(window / gen_config['DATA_STORAGE_INTERVAL']) + 1)
+    history.server = HistoryServer(history, history_config['HISTORY_HOST'],
+                                   history_config['HISTORY_PORT'],
+                                   history_config.get('HISTORY_MAX_POINTS', 10000))
+    threading.Thread(target=history.server.serve_forever, name="history-api",
+                     daemon=True).start()
+    logging.info("History API listening on http://%s:%s", *history.server.server_address[:2])
+    return history
@@ -0,0 +1,190 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_logging.py:
+> Implements the asynchronous logging pipeline: the threads only put records into a queue,
+  while a listener thread writes them as structured JSON lines into the rotating log file
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import sys
+import copy
+import json
+import queue
+import logging
+import threading
+import logging.handlers
+from typing import Any
+from datetime import datetime
+
+import yaml
+
+# Defaults, if config_gen.yaml cannot be loaded
+LOG_DEFAULTS = {
+    'LOG_FILE': 'PyComInt.log',
+    'LOG_LEVEL': 'INFO',
+    'LOG_FORMAT': 'json',
+    'LOG_ROTATION': 'size',
+    'LOG_MAX_BYTES': 10485760,
+    'LOG_WHEN': 'midnight',
+    'LOG_BACKUP_COUNT': 7,
+    'LOG_RATE_LIMIT_WINDOW': 60,
+}
+
+class RateLimitFilter(logging.Filter):
+    """
+        Suppresses repeated warnings and errors (same call site, level, and message template)
+        within a time window. Records below WARNING always pass, so that e.g. events are never
+        muted.
+    """
+    def __init__(self, window: float) -> None:
+        """
+            :param window: Minimum time between two identical messages in [s]
+        """
+        super().__init__()
+        self.window = window
+        # [time of the last passed record, suppressed count, time of the last record] by source
+        self.sources = {}
+        self.next_prune = 0.0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+            Passes the first occurrence of a message per window and attaches the number of
+            suppressed repetitions to it. The template is compared instead of the formatted
+            message, so that varying arguments (e.g. error texts) cannot grow the sources.
+            :param record: Log record
+            :return: True if the record is logged, False if it is suppressed
+        """
+        record.suppressed = 0
+        record.repeats = ""
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno, record.levelno, str(record.msg))
+        with self.lock:
+            if record.created >= self.next_prune:
+                self.prune(record.created)
+            entry = self.sources.get(key)
+            if entry is not None and record.created - entry[0] < self.window:
+                entry[1] += 1
+                entry[2] = record.created
+                return False
+            record.suppressed = entry[1] if entry is not None else 0
+            self.sources[key] = [record.created, 0, record.created]
+        if record.suppressed:
+            record.repeats = f" (suppressed {record.suppressed} repeats)"
+        return True
+
+    def prune(self, now: float) -> None:
+        """
+            Removes the sources without a record within the last window (at most once per
+            window, called with the lock held).
+            :param now: Time of the current record
+        """
+        self.sources = {key: entry for key, entry in self.sources.items()
+                        if now - entry[2] < self.window}
+        self.next_prune = now + self.window
+
+class ExceptionQueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler keeping the formatted traceback of a record as exc_text. """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+            Merges the message arguments and formats the exception before enqueueing (the
+            traceback cannot be passed to the listener thread), while the listener's
+            formatter still writes the traceback separately (e.g. the 'exception' field).
+            :param record: Log record
+            :return: Copy of the record for the queue
+        """
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+class JSONFormatter(logging.Formatter):
+    """ Formats log records as one JSON object per line. """
+    def format(self, record: logging.LogRecord) -> str:
+        """
+            :param record: Log record
+            :return: JSON line with time, level, source, thread, and message
+        """
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'source': f"{record.module}:{record.lineno}",
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:   # Formatted by ExceptionQueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def load_log_config() -> dict[str, Any]:
+    """
+        Loads the logging settings from the general configuration.
+        :return: Logging settings (defaults for missing values)
+    """
+    log_config = dict(LOG_DEFAULTS)
+    try:
+        with open("config/config_gen.yaml", "r", encoding="utf-8") as env_file:
+            gen_config = yaml.safe_load(env_file)
+        log_config.update({key: gen_config[key] for key in LOG_DEFAULTS if key in gen_config})
+    except Exception as e:
+        # Logging is not set up yet
+        sys.stderr.write(f"Failed to load logging configuration, using defaults: {e}\n")
+    return log_config
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+        Sets up logging via a queue: the calling threads only enqueue the (rate-limited)
+        records, the file I/O and formatting happen in the listener thread.
+        :return: Started queue listener (stop() flushes the remaining records)
+    """
+    log_config = load_log_config()
+
+    if log_config['LOG_ROTATION'] == 'time':
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_config['LOG_FILE'], when=log_config['LOG_WHEN'],
+            backupCount=log_config['LOG_BACKUP_COUNT'], encoding="utf-8"
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_config['LOG_FILE'], maxBytes=log_config['LOG_MAX_BYTES'],
+            backupCount=log_config['LOG_BACKUP_COUNT'], encoding="utf-8"
+        )
+    if log_config['LOG_FORMAT'] == 'json':
+        file_handler.setFormatter(JSONFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(message)s%(repeats)s", datefmt="%Y-%m-%d %H:%M:%S"
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ExceptionQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(log_config['LOG_RATE_LIMIT_WINDOW']))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(log_config['LOG_LEVEL'])
+
+    # Suppress INFO logs from third-party libraries
+    logging.getLogger("pymodbus").setLevel(logging.ERROR)
+    logging.getLogger("opcua").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
@@ -0,0 +1,82 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_lookup.py:
+> Implements the curve of the PEMEL current over the hydrogen flow rate (H2_FLOW_ARRAY), loaded
+  once and optionally precomputed as a lookup table on a quantized flow grid, so that each
+  set point conversion is a single index into the table
+----------------------------------------------------------------------------------------------------
+"""
+
+import math
+from array import array
+from typing import Callable, Iterable
+
+# Set points are rounded down to the grid (tolerating floating point errors of grid values), so
+# that the table does not exceed the interpolated current on rising segments, e.g. at MIN_CURRENT
+GRID_TOLERANCE = 1e-9
+
+class H2CurrentCurve:
+    """ Conversion of hydrogen flow rate set points into PEMEL currents. """
+    def __init__(
+            self,
+            path: str,
+            interpolate: Callable[[list[int], list[float], float], int],
+            resolution: float = 0
+        ) -> None:
+        """
+            :param path: File with the currents in [A] and the H2 flow rates in [Nl/min]
+                         (header line, then 'current;flow rate' per line)
+            :param interpolate: Function interpolating a flow rate on the curve, including the
+                                MIN_CURRENT/MAX_CURRENT handling (ModbusConnection.interpolate_h2_flow)
+            :param resolution: Grid spacing of the lookup table in [Nl/min] (0 to interpolate
+                               each set point)
+        """
+        with open(path, "r", encoding="utf-8") as fptr:
+            data = [line.strip().split(';') for line in fptr.readlines()[1:] if line.strip()]
+        self.currents = [int(row[0]) for row in data]
+        self.flows = [float(row[1]) for row in data]
+        self.interpolate = interpolate
+        self.resolution = resolution
+        self.max_flow = max(self.flows)
+        self.table = None
+        if resolution > 0:
+            # The grid values use the same interpolation as single set points, so that
+            # non-monotonic segments and the current limits are resolved identically
+            size = math.ceil(self.max_flow / resolution) + 1
+            self.table = array('H', (interpolate(self.currents, self.flows,
+                                                 min(i * resolution, self.max_flow))
+                                     for i in range(size)))
+            self.below = interpolate(self.currents, self.flows, -math.inf)
+            self.above = interpolate(self.currents, self.flows, self.max_flow)
+
+    def convert(self, set_h2_flow: float) -> int:
+        """
+            Converts a hydrogen flow rate set point into the PEMEL current.
+            :param set_h2_flow: Hydrogen flow rate set point in [Nl/min]
+            :return: Current set point in [A]
+        """
+        if self.table is None:
+            return self.interpolate(self.currents, self.flows, set_h2_flow)
+        if set_h2_flow >= self.max_flow:
+            return self.above
+        if set_h2_flow < 0:
+            return self.below
+        return self.table[int(set_h2_flow / self.resolution + GRID_TOLERANCE)]
+
+    def convert_many(self, set_h2_flows: Iterable[float]) -> list[int]:
+        """
+            Converts a series of set points (e.g. an optimizer schedule or a day-ahead plan).
+            :param set_h2_flows: Hydrogen flow rate set points in [Nl/min]
+            :return: Current set points in [A]
+        """
+        if self.table is None:
+            return [self.convert(flow) for flow in set_h2_flows]
+        table, resolution, max_flow = self.table, self.resolution, self.max_flow
+        last = len(table) - 1
+        return [self.above if flow >= max_flow else
+                self.below if flow < 0 else
+                table[min(int(flow / resolution + GRID_TOLERANCE), last)]
+                for flow in set_h2_flows]
@@ -10,45 +10,79 @@ pci_modbus.py:
 
 # pylint: disable=no-member, broad-exception-caught, broad-exception-raised
 
+import os
 import time
 import logging
-from typing import Optional
+from typing import Iterable, Optional
 
 import yaml
-from pymodbus.client import ModbusTcpClient
+
+from src.pci_reload import diff_config
+from src.pci_config import compile_modbus_config
+from src.pci_trace import span, traced
+from src.pci_write import WritePlanner, set_point_addresses, CURRENT_SET_POINT
+from src.pci_transport import create_client, get_gateway, endpoint
+from src.pci_lookup import H2CurrentCurve
 
 class ModbusConnection:
     """ Handles the Modbus connection and operations. """
-    def __init__(self) -> None:
+
+    def __init__(self, control: bool = False, modbus_config: Optional[dict] = None) -> None:
+        """
+            :param control: Dedicated PEMEL control connection using the low-latency profile
+                            CONTROL_CONNECTION (short timeout, no retry sleeps)
+            :param modbus_config: Validated Modbus configuration (None to load the file)
+        """
         try:
+            self.control = control
             # Load Modbus configuration
-            with open("config/config_modbus.yaml", "r", encoding="utf-8") as env_file:
-                self.modbus_config = yaml.safe_load(env_file)
+            if modbus_config is None:
+                with open("config/config_modbus.yaml", "r", encoding="utf-8") as env_file:
+                    modbus_config = yaml.safe_load(env_file)
+            self.modbus_config = self.apply_profile(modbus_config)
+            # Compiled settings with the register addresses on the wire (used by the requests)
+            self.settings = compile_modbus_config(self.modbus_config)
             self.client = None
             self.connected = False
+            self.status_detector = None     # Shared StatusChangeDetector (optional)
+            self.health = None              # ConnectionHealth of the supervisor (optional)
+            self.stop_event = None          # Stop event of the service (ends the retries)
+            # Set points queued by the control strategy and written together in one flush
+            self.write_planner = WritePlanner(set_point_addresses(self.modbus_config))
+            self.h2_curve = None    # Loaded H2CurrentCurve with the settings it was built for
+            self.h2_curve_key = None
         except Exception as e:
             logging.error("Failed to load Modbus configuration: %s", e)
 
+    @traced("modbus.connect")
     def connect(self) -> None:
         """
-            Establishes the connection to the Modbus server. 
+            Establishes the connection to the Modbus server via the configured TRANSPORT.
             (Uses several attempts, since the Modbus connection is deemed less reliable)
+            With GATEWAY_SHARED, the connections with the same endpoint share one transport.
         """
         for attempt in range(self.modbus_config['MAX_RETRIES']):
             try:
-                self.client = ModbusTcpClient(
-                    self.modbus_config['IP_ADDRESS'],
-                    port=self.modbus_config['PORT']
-                )
-                self.connected = self.client.connect()
+                if self.client is not None:
+                    self.client.close()
+                if self.modbus_config.get('GATEWAY_SHARED', False):
+                    self.client = get_gateway(self.modbus_config).channel(
+                        self.modbus_config['SLAVE_ID'], self.modbus_config['TIMEOUT'])
+                else:
+                    self.client = create_client(self.modbus_config)
+                with span("modbus.tcp_connect"):
+                    self.connected = self.client.connect()
                 if self.connected:
-                    logging.info("Connected to Modbus server at %s: %s",
-                                 self.modbus_config['IP_ADDRESS'], self.modbus_config['PORT'])
+                    logging.info("Connected to Modbus server at %s (%s, slave %s)",
+                                 ':'.join(map(str, endpoint(self.modbus_config)[1:])),
+                                 self.modbus_config.get('TRANSPORT', 'tcp'),
+                                 self.modbus_config['SLAVE_ID'])
                     return
             except Exception as e:
                 logging.warning("Attempt %s / %s - Modbus connection failed: %s",
                                 (attempt + 1), self.modbus_config['MAX_RETRIES'], e)
-            time.sleep(self.modbus_config['RETRY_INTERVAL'])
+            if not self.retry_wait(self.modbus_config['RETRY_INTERVAL']):
+                break
         logging.error("Failed to connect to Modbus server after %s attempts.",
                       self.modbus_config['MAX_RETRIES'])
         self.connected = False
@@ -60,76 +94,201 @@ class ModbusConnection:
         """
         return self.connected and self.client and self.client.is_socket_open()
 
-    def read_pemel_status(self) -> Optional[list[int]]:
+    def retry_wait(self, interval: float) -> bool:
+        """
+            Waits before the next attempt of a request, so that the retries end on shutdown
+            within SHUTDOWN_TIMEOUT.
+            :param interval: Waiting time in [s] (RETRY_INTERVAL)
+            :return: False if the service is stopping (no further attempts), True otherwise
+        """
+        if self.stop_event is None:
+            time.sleep(interval)
+            return True
+        return not self.stop_event.wait(interval)
+
+    def mark_dead(self, error: Exception) -> None:
+        """
+            Marks the connection as lost if the socket was closed by a failed request,
+            so that the supervisor reconnects immediately.
+            :param error: Exception of the failed request
+        """
+        if self.connected and self.client is not None and not self.client.is_socket_open():
+            logging.warning("Modbus connection lost: %s", error)
+            self.connected = False
+            if self.health is not None:
+                self.health.report_failure()
+
+    def apply_profile(self, config: dict) -> dict:
+        """
+            Overrides the retry and timeout settings with the CONTROL_CONNECTION profile for
+            the dedicated PEMEL control connection.
+            :param config: Modbus configuration
+            :return: Modbus configuration of this connection
+        """
+        if self.control:
+            return {**config, **config.get('CONTROL_CONNECTION', {})}
+        return config
+
+    def reload_config(self, new_config: dict) -> None:
+        """
+            Applies a changed Modbus configuration at runtime. The connection is only
+            re-established if the server address changed (register map changes keep the socket),
+            by the reconnect worker if the connection is supervised.
+            :param new_config: New Modbus configuration
+        """
+        new_config = self.apply_profile(new_config)
+        settings = compile_modbus_config(new_config)   # Rejects an invalid configuration
+        changed = diff_config(self.modbus_config, new_config)
+        self.modbus_config = new_config
+        self.settings = settings
+        self.write_planner.set_addresses(set_point_addresses(new_config))
+        if changed & {'IP_ADDRESS', 'PORT', 'TIMEOUT', 'TRANSPORT', 'SERIAL', 'GATEWAY_SHARED'}:
+            logging.info("Modbus server address changed, reconnecting...")
+            if self.health is not None:
+                self.health.request_reconnect()     # The worker owns connect()
+            else:
+                self.connect()
+
+    @traced("modbus.read_pemel_status")
+    def read_pemel_status(
+            self,
+            out: Optional[list] = None,
+            offset: int = 0,
+            packed: bool = False
+        ) -> Optional[list[int]]:
         """
             Reads the Modbus register for PEMEL status with retry logic
-            :return: One-hot-encoded array (status_one_hot) with status signals 
+            :param out: Row values to fill in place (None for a new list)
+            :param offset: Position of the first status bit in out
+            :param packed: True to return the raw status word instead of the bits (the bits
+                           are decoded on read, see pci_status.py)
+            :return: One-hot-encoded array (status_one_hot) with status signals (or out)
                      if the reading was successful or None if not
         """
-        max_retries = self.modbus_config['MAX_RETRIES']
+        settings = self.settings
         retries = 0
-        while retries < max_retries:
+        while retries < settings.max_retries:
             try:
                 # Read the Modbus register for PEMEL status
-                response = self.client.read_holding_registers(
-                    (self.modbus_config['PEMEL_STATUS']['ADDRESS'] -
-                     self.modbus_config['BASE_REGISTER_OFFSET']),
-                     count=1,  # PEMEL status is located in one register
-                     slave=self.modbus_config['SLAVE_ID'] # Updated argument for slave ID
-                )
+                with span("modbus.transaction", function="read_holding_registers"):
+                    response = self.client.read_holding_registers(
+                         settings.status_address,
+                         count=1,  # PEMEL status is located in one register
+                         slave=settings.slave_id # Updated argument for slave ID
+                    )
                 if response.isError():
                     raise Exception("Error reading PEMEL status - "
-                                    f"{self.modbus_config['PEMEL_STATUS']['ADDRESS']}: {response}")
-                status_one_hot = self.convert_bits(response.registers[0])
+                                    f"{settings.status_address + settings.base_offset}: "
+                                    f"{response}")
+                word = response.registers[0]
+                if self.status_detector is not None:
+                    self.status_detector.update(word)   # Status change events
+                if packed:
+                    if out is None:
+                        return [word]
+                    out[offset] = word
+                    return out
+                status_one_hot = self.convert_bits(word, out=out, offset=offset)
                 retries += 1
                 return status_one_hot  # Return processed data if successful
             except Exception as e:
                 logging.error("Reading the PEMEL status register failed: %s", e)
+                self.mark_dead(e)
                 retries += 1
-                time.sleep(self.modbus_config['RETRY_INTERVAL'])
+                if not self.retry_wait(settings.retry_interval):
+                    break
 
         return None  # Return None if all retries failed
 
-    def read_pemel_process_values(self) -> Optional[list[int]]:
+    @traced("modbus.read_pemel_process_values")
+    def read_pemel_process_values(
+            self,
+            out: Optional[list] = None,
+            offset: int = 0
+        ) -> Optional[list[int]]:
         """
             Reads the Modbus registers for PEMEL process values with retry logic
-            :return: Array with process values (pv_values) if the reading was successful or
-                     None if not
+            :param out: Row values to fill in place (None for a new list)
+            :param offset: Position of the first process value in out
+            :return: Array with process values (pv_values, or out) if the reading was
+                     successful or None if not
         """
-        max_retries = self.modbus_config['MAX_RETRIES']
+        settings = self.settings
         retries = 0
-        while retries < max_retries:
+        while retries < settings.max_retries:
             try:
                 # Read the Modbus register for PEMEL status
-                response = self.client.read_holding_registers(
-                    (self.modbus_config['PROCESS_VALUES']['ADDRESS'] -
-                     self.modbus_config['BASE_REGISTER_OFFSET']),
-                     count=self.modbus_config['PROCESS_VALUES']['COUNT'], # Read important registers
-                     slave=self.modbus_config['SLAVE_ID'] # Updated argument for slave ID
-                )
+                with span("modbus.transaction", function="read_holding_registers"):
+                    response = self.client.read_holding_registers(
+                         settings.process_address,
+                         count=settings.process_count, # Important registers
+                         slave=settings.slave_id # Updated argument for slave ID
+                    )
 
                 if response.isError():
                     raise Exception("Error reading PEMEL process values - "
-                                    f"{self.modbus_config['PROCESS_VALUES']['ADDRESS']}:{response}")
-                registers = list(response.registers)
-                pv_values = self.convert_process_values(registers)
+                                    f"{settings.process_address + settings.base_offset}:"
+                                    f"{response}")
+                pv_values = self.convert_process_values(response.registers, out=out,
+                                                        offset=offset)
                 retries += 1
                 return pv_values  # Return processed data if successful
             except Exception as e:
                 logging.error("Reading the PEMEL process values registers failed: %s", e)
+                self.mark_dead(e)
+                retries += 1
+                if not self.retry_wait(settings.retry_interval):
+                    break
+
+        return None  # Return None if all retries failed
+
+    @traced("modbus.read_registers")
+    def read_registers(self, address: int, count: int) -> Optional[list[int]]:
+        """
+            Reads a range of holding registers with retry logic (used by the scan groups)
+            :param address: Start address of the range (without BASE_REGISTER_OFFSET)
+            :param count: Number of registers to read
+            :return: List with the register values if the reading was successful or None if not
+        """
+        settings = self.settings
+        retries = 0
+        while retries < settings.max_retries:
+            try:
+                with span("modbus.transaction", function="read_holding_registers"):
+                    response = self.client.read_holding_registers(
+                        address - settings.base_offset,
+                        count=count,
+                        slave=settings.slave_id
+                    )
+                if response.isError():
+                    raise Exception(f"Error reading registers - {address} ({count}): {response}")
+                return list(response.registers)
+            except Exception as e:
+                logging.error("Reading the registers %s - %s failed: %s",
+                              address, address + count - 1, e)
+                self.mark_dead(e)
                 retries += 1
-                time.sleep(self.modbus_config['RETRY_INTERVAL'])
+                if not self.retry_wait(settings.retry_interval):
+                    break
 
         return None  # Return None if all retries failed
 
-    def convert_bits(self, value: int, bit_length: int = 16) -> list[int]:
+    def convert_bits(
+            self,
+            value: int,
+            bit_length: int = 16,
+            out: Optional[list] = None,
+            offset: int = 0
+        ) -> list[int]:
         """
             Converts a binary number to one-hot encoded array and interpret meanings
             from YAML config.
             :param value: The value read from the Modbus register.
             :bit_length: The length of the binary number (default is 16).
+            :param out: Row values to fill in place (None for a new list)
+            :param offset: Position of the first bit in out
             :return one_hot: A one-hot encoded array representing the active/inactive 
-                             state of each bit.
+                             state of each bit (or out).
         """
         # # Convert the value to a binary string with leading zeros
         # binary_representation = f"{value:0{bit_length}b}"
@@ -140,11 +299,14 @@ class ModbusConnection:
         # status_config = self.modbus_config.get("PEMEL_STATUS", {})
 
         # One-hot encoded array for the bit values
-        one_hot = [0] * bit_length
+        if out is None:
+            out = [0] * bit_length
+            offset = 0
+        one_hot = out
 
         for i in range(bit_length):
             bit_status = (value >> i) & 1                               # Extract each bit
-            one_hot[i] = bit_status                                     # Update the one-hot array
+            one_hot[offset + i] = bit_status                            # Update the one-hot array
 
             # Get the bit description from the Modbus config
             # bit_description = status_config.get(f"BIT_{i}", "Undefined")
@@ -153,12 +315,23 @@ class ModbusConnection:
 
         return one_hot
 
-    def convert_process_values(self, registers: list[int]) -> list[int]:
+    def convert_process_values(
+            self,
+            registers: list[int],
+            out: Optional[list] = None,
+            offset: int = 0
+        ) -> list[int]:
         """
             Returns the process values of the PEMEL.
             :param register: The Modbus register.
-            :return pv_values: Process values in an array.
+            :param out: Row values to fill in place (None for a new list)
+            :param offset: Position of the first process value in out
+            :return pv_values: Process values in an array (or out).
         """
+        if out is not None:
+            out[offset:offset + len(registers)] = registers
+            return out
+
         # process_values = self.modbus_config.get("PROCESS_VALUES", {})
         # count = process_values.get("COUNT")
         # variable_names = [process_values.get(f"REG_{i}", f"Unknown_{i}") for i in range(count)]
@@ -175,6 +348,7 @@ class ModbusConnection:
 
         return pv_values
 
+    @traced("modbus.write_pemel_current")
     def write_pemel_current(self, set_h2_flow: float) -> None:
         """
             Converts the hydrogen volume flow rate set point to the PEMEL's electrical current
@@ -183,51 +357,157 @@ class ModbusConnection:
         """
         # Calculate PEEL current set point according to the desired H2 flow rate
         set_current = self.convert_h2_flow_to_current(set_h2_flow)
+        if set_current is None:
+            return
+        self.write_current(set_current)
 
-        max_retries = self.modbus_config['MAX_RETRIES']
+    def write_current(self, set_current: int) -> bool:
+        """
+            Writes the electrical current set point to the respective register
+            (e.g. 0 A to stop the PEMEL on a status event), together with the other queued
+            set points
+            :param set_current: Electrical current set point in [A]
+            :return: True if all set points were written, False otherwise
+        """
+        return self.write_set_points({CURRENT_SET_POINT: set_current})
+
+    def queue_set_point(self, name: str, value: int) -> None:
+        """
+            Queues a set point (e.g. valve or pump mode) for the next write of the set points,
+            so that several outputs per cycle share the write requests.
+            :param name: Name of the set point (key of SET_POINTS in config_modbus.yaml)
+            :param value: Register value
+        """
+        self.write_planner.queue(name, value)
+
+    @traced("modbus.write_set_points")
+    def write_set_points(self, set_points: Optional[dict[str, int]] = None) -> bool:
+        """
+            Writes the queued set points with one request per contiguous register range
+            (write_registers, FC 16) and confirms them with a read-back of each range if
+            WRITE_READ_BACK is enabled. Set points of failed requests are queued again.
+            :param set_points: Additional set points by name (queued before the write)
+            :return: True if all set points were written (and confirmed), False otherwise
+        """
+        for name, value in (set_points or {}).items():
+            self.write_planner.queue(name, value)
+        requests = self.write_planner.plan()
+        written = []
+        for address, values in requests:
+            if self.write_registers(address, values):
+                written.append((address, values))
+            else:
+                self.write_planner.requeue(address, values)
+        if len(written) < len(requests):
+            return False
+        if written and self.settings.write_read_back:
+            return self.confirm_writes(written)
+        return True
+
+    def write_registers(self, address: int, values: list[int]) -> bool:
+        """
+            Writes a contiguous range of holding registers with retry logic
+            (a single register is written with write_register, FC 6)
+            :param address: Start address of the range (without BASE_REGISTER_OFFSET)
+            :param values: Register values
+            :return: True if the writing was successful, False otherwise
+        """
+        settings = self.settings
         retries = 0
-        while retries < max_retries:
+        while retries < settings.max_retries:
             try:
-                # Write the Modbus register for PEMEL current
-                write_result = self.client.write_register(
-                    self.modbus_config['WRITE_REGISTER'],
-                    set_current
-                )
+                with span("modbus.transaction", function="write_registers", count=len(values)):
+                    if len(values) == 1:
+                        write_result = self.client.write_register(
+                            address - settings.base_offset,
+                            values[0],
+                            slave=settings.slave_id
+                        )
+                    else:
+                        write_result = self.client.write_registers(
+                            address - settings.base_offset,
+                            values,
+                            slave=settings.slave_id
+                        )
                 if write_result.isError():
-                    raise Exception(f"Error writing value {set_current} to register "
-                                    f"{self.modbus_config['WRITE_REGISTER']}")
-                retries += 1
+                    raise Exception(f"Error writing values {values} to registers {address} - "
+                                    f"{address + len(values) - 1}: {write_result}")
+                return True
             except Exception as e:
-                logging.error("Writing the PEMEL current registers failed: %s", e)
+                logging.error("Writing the set point registers %s - %s failed: %s",
+                              address, address + len(values) - 1, e)
+                self.mark_dead(e)
                 retries += 1
-                time.sleep(self.modbus_config['RETRY_INTERVAL'])
+                if not self.retry_wait(settings.retry_interval):
+                    break
+
+        return False
+
+    def confirm_writes(self, written: list[tuple[int, list[int]]]) -> bool:
+        """
+            Reads the written registers back with one request per written range (the gaps
+            between the ranges are not read, since they may hold no registers) and compares
+            them with the written values.
+            :param written: Write requests as (start address, register values)
+            :return: True if all registers hold the written values, False otherwise
+        """
+        confirmed = True
+        for address, values in written:
+            registers = self.read_registers(address, len(values))
+            if registers is None:
+                logging.error("Read-back of the set point registers %s - %s failed",
+                              address, address + len(values) - 1)
+                return False
+            for i, (register, value) in enumerate(zip(registers, values)):
+                if register != value:
+                    logging.error("Set point register %s holds %s instead of %s",
+                                  address + i, register, value)
+                    confirmed = False
+        return confirmed
+
+    def get_h2_curve(self) -> H2CurrentCurve:
+        """
+            Returns the curve of H2_FLOW_ARRAY, which is only reloaded (and its lookup table
+            rebuilt) if the file or the conversion settings changed.
+            :return: Curve of the PEMEL current over the H2 flow rate
+        """
+        settings = self.settings
+        path = settings.h2_flow_array
+        key = (path, os.stat(path).st_mtime, settings.h2_flow_resolution, settings.min_current,
+               settings.max_current)
+        if key != self.h2_curve_key:
+            self.h2_curve = H2CurrentCurve(path, self.interpolate_h2_flow, key[2])
+            self.h2_curve_key = key
+        return self.h2_curve
 
     def convert_h2_flow_to_current(self, set_h2_flow: float) -> Optional[int]:
         """
-            Converts H2 flow rate to current by reading from a file and interpolating.
+            Converts H2 flow rate to current by interpolating the curve of H2_FLOW_ARRAY
+            (or by one index into its lookup table if H2_FLOW_RESOLUTION is set).
             :param set_value: Input H2 flow value
             :return: Converted electrical current value
         """
         try:
-            with open(self.modbus_config['H2_FLOW_ARRAY'], "r", encoding="utf-8") as fptr:
-                # Skip the header and read the data
-                lines = fptr.readlines()
-                data = [line.strip().split(';') for line in lines[1:]]  # Read and split data
-
-                # Parsing the data into lists
-                current_array = [int(row[0]) for row in data]
-                h2_flowrate_array = [float(row[1]) for row in data]
-                # Interpolate H2 flow to current
-                set_current = self.interpolate_h2_flow(
-                    current_array, h2_flowrate_array, set_h2_flow
-                )
-
-                return set_current
+            return self.get_h2_curve().convert(set_h2_flow)
         except Exception as e:
             logging.error("Error occurred while converting the hydrogen flow rate into "
                           "electrical current: %s", e)
         return None
 
+    def convert_h2_flows_to_currents(self, set_h2_flows: Iterable[float]) -> Optional[list[int]]:
+        """
+            Converts a series of H2 flow rate set points (e.g. for replaying optimizer
+            schedules or simulating day-ahead plans).
+            :param set_h2_flows: H2 flow rate set points
+            :return: Converted electrical current values (None if the conversion failed)
+        """
+        try:
+            return self.get_h2_curve().convert_many(set_h2_flows)
+        except Exception as e:
+            logging.error("Error occurred while converting the hydrogen flow rates into "
+                          "electrical currents: %s", e)
+        return None
+
     def interpolate_h2_flow(
             self,
             current_array: list[int],
@@ -241,7 +521,7 @@ class ModbusConnection:
             :return: Interpolated current value
         """
         if set_h2_flow >= max(h2_flowrate_array):    # If the input exceeds the maximum array value
-            return self.modbus_config['MAX_CURRENT']
+            return self.settings.max_current
         if set_h2_flow < min(h2_flowrate_array):     # If the input is below the minimum array value
             return 0
 
@@ -255,7 +535,7 @@ class ModbusConnection:
                          (h2_flowrate_array[i + 1] - h2_flowrate_array[i]))
                 current_value = current_array[i] + slope * (set_h2_flow - h2_flowrate_array[i])
                 # If the input is below the minimum electrical current
-                if current_value < self.modbus_config['MIN_CURRENT']:
+                if current_value < self.settings.min_current:
                     return 0
                 else:
-                    return round(current_value)
+                    return min(round(current_value), self.settings.max_current)
@@ -10,71 +10,283 @@ pci_opcua.py:
 
 # pylint: disable=no-member, broad-exception-caught, broad-exception-raised
 
+import asyncio
 import logging
 from typing import Optional
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
 
 import yaml
-from opcua import Client
+
+from src.pci_reload import diff_config
+from src.pci_config import compile_opcua_config
+from src.pci_trace import span, traced
+
+SERVER_STATE_NODE = "i=2259"    # Server_ServerStatus_State (0: Running)
+# Status codes of service faults indicating a lost session or channel (instead of a bad node)
+SESSION_ERRORS = {'BadSessionIdInvalid', 'BadSessionClosed', 'BadSessionNotActivated',
+                  'BadSecureChannelIdInvalid', 'BadSecureChannelClosed', 'BadConnectionClosed',
+                  'BadNotConnected', 'BadServerNotConnected', 'BadTimeout',
+                  'BadCommunicationError', 'BadShutdown', 'BadServerHalted'}
+
+def is_connection_error(error: Exception) -> bool:
+    """
+        Distinguishes connection failures from errors of single nodes (e.g. BadNodeIdUnknown).
+        :param error: Exception raised by the OPC UA client
+        :return: True if the session or the socket is lost
+    """
+    # Socket errors, timeouts, closed socket (the timeouts of the synchronous client are no
+    # subclasses of OSError before Python 3.11)
+    if isinstance(error, (OSError, CancelledError, FutureTimeoutError, asyncio.TimeoutError)):
+        return True
+    return type(error).__name__ in SESSION_ERRORS
 
 class OPCUAConnection:
     """ Handles the OPCUA connection and operations. """
-    def __init__(self) -> None:
+
+    def __init__(self, opcua_config: Optional[dict] = None) -> None:
+        """
+            :param opcua_config: Validated OPC UA configuration (None to load the file)
+        """
         try:
             # Load OPCUA configuration
-            with open("config/config_opcua.yaml", "r", encoding="utf-8") as env_file:
-                self.opcua_config = yaml.safe_load(env_file)
+            if opcua_config is None:
+                with open("config/config_opcua.yaml", "r", encoding="utf-8") as env_file:
+                    opcua_config = yaml.safe_load(env_file)
+            self.opcua_config = opcua_config
+            # Compiled settings with the node ID lists (used by the reads and writes)
+            self.settings = compile_opcua_config(self.opcua_config)
             self.client = None
+            self.node_cache = {}    # Node objects by node ID
+            self.variant_types = {} # Data types of the written nodes by node ID
+            self.written = {}       # Last written values by node ID (change detection)
+            self.alive = False      # Cleared by failed calls and probes, set by connect()
+            self.health = None      # ConnectionHealth of the supervisor (optional)
         except Exception as e:
             logging.error("Failed to load OPCUA configuration: %s", e)
 
+    @traced("opcua.connect")
     def connect(self) -> None:
         """
             Establishes the connection to the OPCUA server.
         """
         try:
+            # Imported on first use, so that deployments without OPC UA do not load opcua
+            # (and cryptography)
+            from opcua import Client  # pylint: disable=import-outside-toplevel
+
+            self.disconnect()   # Release the socket and threads of a lost session
+            self.node_cache = {}
+            self.written = {}   # Rewrite all values after a reconnect (e.g. PLC restart)
             self.client = Client(self.opcua_config['URL'])
             # Set user credentials directly
             self.client.set_user(self.opcua_config['USERNAME'])
             self.client.set_password(self.opcua_config['PASSWORD'])
 
             self.client.connect()
+            self.alive = True
             logging.info("Connected to OPC UA server at %s as %s",
                          self.opcua_config['URL'], self.opcua_config['USERNAME'])
         except Exception as e:
             logging.error("OPC UA connection failed: %s", e)
             self.client = None  # Mark as unavailable
+            self.alive = False
+
+    def disconnect(self) -> None:
+        """
+            Closes the session of the client (errors of an already lost session are ignored).
+        """
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except Exception as e:
+                logging.warning("OPC UA disconnect failed: %s", e)
+            self.client = None
+        self.alive = False
+
+    def mark_dead(self, error: Exception) -> None:
+        """
+            Marks the connection as lost if a failed call indicates a connection failure,
+            so that the following reads fail fast and the supervisor reconnects.
+            :param error: Exception raised by the OPC UA client
+        """
+        if self.alive and is_connection_error(error):
+            logging.warning("OPC UA connection lost: %s", error)
+            self.alive = False
+            if self.health is not None:
+                self.health.report_failure()
 
     def is_connected(self) -> bool:
         """
-            Checks if the OPCUA connection is active.
+            Checks if the OPCUA connection is active: failed calls on the hot path mark it as
+            lost, otherwise the server state (ServerStatus) is read as a watchdog.
             :return: True if connected, False otherwise.
         """
-        return self.client is not None
+        if self.client is None or not self.alive:
+            return False
+        try:
+            with span("opcua.probe"):
+                state = self.get_node(SERVER_STATE_NODE).get_value()
+        except Exception as e:
+            logging.warning("OPC UA server status check failed: %s", e)
+            self.alive = False
+            return False
+        if state != 0:  # ServerState other than Running (e.g. Shutdown, CommunicationFault)
+            logging.warning("OPC UA server state is %s", state)
+            self.alive = False
+            return False
+        return True
+
+    def reload_config(self, new_config: dict) -> None:
+        """
+            Applies a changed OPC UA configuration at runtime. Node list changes only rebuild
+            the node cache, the session is re-established only if the server or user changed
+            (by the reconnect worker if the connection is supervised).
+            :param new_config: New OPC UA configuration
+        """
+        settings = compile_opcua_config(new_config)   # Rejects an invalid configuration
+        changed = diff_config(self.opcua_config, new_config)
+        self.opcua_config = new_config
+        self.settings = settings
+        if changed & {'URL', 'USERNAME', 'PASSWORD'}:
+            logging.info("OPC UA server or user changed, reconnecting...")
+            if self.health is not None:
+                self.health.request_reconnect()     # The worker owns connect()
+            else:
+                self.connect()
+        elif changed & {'OPCUA_NODE_IDs', 'H2_FLOW_ID', 'MIRROR_NODES'}:
+            self.node_cache = {}
+            self.variant_types = {}
 
-    def read_node_values(self, node_type: str = 'AllNodes') -> dict[str, Optional[object]]:
+    def get_node(self, node_id: str) -> object:
+        """
+            Returns the node object of a node ID from the node cache.
+            :param node_id: Node ID
+            :return: Node object of the OPC UA client
+        """
+        node = self.node_cache.get(node_id)
+        if node is None:
+            node = self.client.get_node(node_id)
+            self.node_cache[node_id] = node
+        return node
+
+    @traced("opcua.read_node_values")
+    def read_node_values(
+            self,
+            node_type: str = 'AllNodes',
+            out: Optional[list] = None,
+            offset: int = 0
+        ) -> dict[str, Optional[object]]:
         """
             Reads the values of multiple nodes using their NodeIDs.
             :param type: Reading type > either 'AllNodes' for reading all OPCUA nodes or
                          'H2' for reading only the hydrogen volume flow rate (for PEMEL control)
+            :param out: Row values to fill in place in the order of the node IDs (None for
+                        returning a dictionary)
+            :param offset: Position of the first node value in out
             :return values: Dictionary with node IDs as keys and their corresponding values 
-                            (or errors) as values.
+                            (or errors) as values (or out).
         """
         if node_type == 'AllNodes':
-            node_ids = self.opcua_config['OPCUA_NODE_IDs']
+            node_ids = self.settings.node_ids
         elif node_type == 'H2':
-            node_ids = self.opcua_config['H2_FLOW_ID']
+            node_ids = self.settings.h2_flow_ids
         else:
             logging.error("Invalid node_type '%s' provided. Must be 'AllNodes' or 'H2'.", node_type)
             raise ValueError('Wrong node_type for choosing the node IDs. node_type must match'
                              ' "AllNodes" or "H2"!')
 
         values = {}
-        for node_id in node_ids:
-            try:
-                node = self.client.get_node(node_id)  # Use the NodeID
-                value = node.get_value()  # Read the value of the node
+        for i, node_id in enumerate(node_ids):
+            value = None  # Return None for failed reads (without waiting for timeouts if lost)
+            if self.alive:
+                try:
+                    node = self.get_node(node_id)  # Use the NodeID
+                    with span("opcua.read", node_id=node_id):
+                        value = node.get_value()  # Read the value of the node
+                except Exception as e:
+                    logging.error("Error reading node %s: %s", node_id, e)
+                    self.mark_dead(e)
+            if out is None:
                 values[node_id] = value
-            except Exception as e:
-                logging.error("Error reading node %s: %s", node_id, e)
-                values[node_id] = None  # Return None for failed reads
-        return values
+            else:
+                out[offset + i] = value
+        return values if out is None else out
+
+    @traced("opcua.read_nodes")
+    def read_nodes(self, node_ids: list[str]) -> dict[str, Optional[object]]:
+        """
+            Reads the values of several nodes in one round trip (used by the scan groups).
+            :param node_ids: List of node IDs
+            :return values: Dictionary with node IDs as keys and their corresponding values 
+                            (or None if the read failed) as values.
+        """
+        if not node_ids:
+            return {}
+        if not self.alive:
+            return dict.fromkeys(node_ids)
+        try:
+            nodes = [self.get_node(node_id) for node_id in node_ids]
+            with span("opcua.read", nodes=len(nodes)):
+                values = self.client.get_values(nodes)
+            return dict(zip(node_ids, values))
+        except Exception as e:
+            logging.error("Error reading nodes %s: %s", node_ids, e)
+            self.mark_dead(e)
+            return dict.fromkeys(node_ids)
+
+    def changed_values(self, values: dict[str, object]) -> dict[str, object]:
+        """
+            Filters the values that differ from the last written values by more than
+            WRITE_DEADBAND (numeric values) or at all (other values).
+            :param values: Values by node ID
+            :return: Changed values by node ID
+        """
+        deadband = self.settings.write_deadband
+        changed = {}
+        for node_id, value in values.items():
+            if value is None or node_id not in self.written:
+                if value is not None:
+                    changed[node_id] = value
+                continue
+            previous = self.written[node_id]
+            if isinstance(value, (int, float)) and isinstance(previous, (int, float)):
+                if abs(value - previous) > deadband:
+                    changed[node_id] = value
+            elif value != previous:
+                changed[node_id] = value
+        return changed
+
+    @traced("opcua.write_node_values")
+    def write_node_values(self, values: dict[str, object]) -> bool:
+        """
+            Writes the changed values of several nodes with a single Write service call
+            (e.g. process values mirrored to the PLC, see MIRROR_NODES).
+            :param values: Values by node ID (None values are skipped)
+            :return: True if all changed values were written (or nothing changed), False otherwise
+        """
+        changed = self.changed_values(values)
+        if not changed:
+            return True
+        if not self.alive:
+            return False
+        # Imported on use, like the client in connect()
+        from opcua import ua  # pylint: disable=import-outside-toplevel
+
+        try:
+            nodes = [self.get_node(node_id) for node_id in changed]
+            data_values = []
+            for node, (node_id, value) in zip(nodes, changed.items()):
+                if node_id not in self.variant_types:   # Read once, e.g. Float for PLC REALs
+                    self.variant_types[node_id] = node.get_data_type_as_variant_type()
+                # Without source timestamp, which many PLC servers do not accept
+                data_values.append(ua.DataValue(ua.Variant(value, self.variant_types[node_id])))
+            with span("opcua.write", nodes=len(nodes)):
+                self.client.set_values(nodes, data_values)
+            self.written.update(changed)
+            return True
+        except Exception as e:
+            logging.error("Error writing nodes %s: %s", list(changed), e)
+            for node_id in changed:
+                self.written.pop(node_id, None)
+            self.mark_dead(e)
+            return False
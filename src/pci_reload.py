@@ -0,0 +1,143 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_reload.py:
+> Implements the hot reload of the YAML configuration files at runtime (mtime polling)
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import os
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+import yaml
+
+from src.pci_scan import ScanScheduler
+from src.pci_trace import configure_tracing
+from src.pci_config import compile_gen_config
+
+def diff_config(old_config: dict[str, Any], new_config: dict[str, Any]) -> set[str]:
+    """
+        Returns the top-level keys whose values differ between two configurations.
+        :param old_config: Currently applied configuration
+        :param new_config: New configuration
+        :return: Set of changed, added, or removed keys
+    """
+    return {key for key in old_config.keys() | new_config.keys()
+            if old_config.get(key) != new_config.get(key)}
+
+def apply_gen_config(
+        gen_config: dict[str, Any],
+        scan_scheduler: Optional[ScanScheduler],
+        new_config: dict[str, Any]
+    ) -> None:
+    """
+        Applies a changed general configuration. The threads read their intervals from the
+        shared gen_config dictionary in every cycle, so it is updated in place.
+        (Switching between data storage and scan groups requires a restart)
+        :param gen_config: Shared general configuration of the running threads
+        :param scan_scheduler: Scheduler of the scan groups (None if not configured)
+        :param new_config: New general configuration
+    """
+    # Validates all settings and builds the scan groups first, so that an invalid
+    # configuration keeps the previous one
+    scan_groups = compile_gen_config(new_config)
+    changed = diff_config(gen_config, new_config)
+    if 'SCAN_GROUPS' in changed and scan_scheduler is not None:
+        scan_scheduler.set_groups(list(scan_groups))
+    gen_config.update(new_config)
+    for key in changed - new_config.keys():
+        gen_config.pop(key, None)
+    configure_tracing(gen_config)   # Tracing can be switched on at runtime
+    logging.info("Applied general configuration changes: %s", sorted(changed))
+
+class ConfigWatcher:
+    """ Polls the modification times of the configuration files and applies changes. """
+    def __init__(
+            self,
+            handlers: dict[str, Callable[[dict[str, Any]], None]],
+            poll_interval: float,
+            check: Optional[Callable[[dict[str, dict[str, Any]]], None]] = None
+        ) -> None:
+        """
+            :param handlers: Functions validating and applying a new configuration by file path
+            :param poll_interval: Interval for checking the files in [s]
+            :param check: Function checking the new configurations by file path together
+                          before any of them is applied (e.g. DB_COLUMNS against the node and
+                          register lists, which are changed in several files at once)
+        """
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self.consistency_check = check
+        self.mtimes = {path: self.get_mtime(path) for path in handlers}
+        self.rejected = set()   # Paths of rejected files, retried with the next changed file
+
+    @staticmethod
+    def get_mtime(path: str) -> Optional[float]:
+        """
+            Returns the modification time of a file.
+            :param path: Path of the file
+            :return: Modification time or None if the file does not exist
+        """
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def check(self) -> None:
+        """
+            Reloads the changed configuration files. The files changed since the last poll
+            and the previously rejected files are checked together, so that a change spanning
+            several files is applied once all of them are saved. Invalid files are rejected
+            and the previous configuration is kept.
+        """
+        changed = set()
+        for path in self.handlers:
+            mtime = self.get_mtime(path)
+            if mtime is not None and mtime != self.mtimes[path]:
+                self.mtimes[path] = mtime
+                changed.add(path)
+        if not changed:
+            return
+
+        new_configs = {}
+        for path in self.handlers:
+            if path in changed or path in self.rejected:
+                try:
+                    with open(path, "r", encoding="utf-8") as env_file:
+                        new_configs[path] = yaml.safe_load(env_file)
+                except Exception as e:
+                    logging.error("Rejected configuration %s, keeping the previous one: %s",
+                                  path, e)
+                    self.rejected.add(path)
+        if self.consistency_check is not None and new_configs:
+            try:
+                self.consistency_check(new_configs)
+            except Exception as e:
+                logging.error("Rejected configuration %s, keeping the previous one (retried "
+                              "when another file changes): %s", ', '.join(new_configs), e)
+                self.rejected.update(new_configs)
+                return
+        for path, new_config in new_configs.items():
+            try:
+                self.handlers[path](new_config)
+                self.rejected.discard(path)
+                logging.info("Reloaded configuration %s", path)
+            except Exception as e:
+                logging.error("Rejected configuration %s, keeping the previous one: %s", path, e)
+                self.rejected.add(path)
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> None:
+        """
+            Contains the thread function for watching the configuration files.
+            :param stop_event: Event ending the loop (None to run until the process exits)
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        while not stop_event.wait(self.poll_interval):
+            self.check()
@@ -0,0 +1,283 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_replay.py:
+> Implements the replay of recorded process data (SQL table or archive) through the decoding and
+  storage path of the data storage thread at maximum speed, e.g. for testing conversion changes
+  or backfilling a new table after changing the register map or the schema
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+import logging
+from typing import Any, Iterator, Optional, Sequence
+from datetime import datetime, timedelta
+
+from src.pci_modbus import ModbusConnection
+from src.pci_opcua import OPCUAConnection
+from src.pci_sql import SQLConnection
+from src.pci_row import STATUS_BITS, Row, RowBuffer
+from src.pci_config import row_layout
+from src.pci_threads import data_trans_func
+
+class RecordedResponse:
+    """ Read response of the recorded Modbus client. """
+    def __init__(self, registers: list[Any]) -> None:
+        self.registers = registers
+
+    def isError(self) -> bool:  # pylint: disable=invalid-name
+        """ Recorded reads never fail. """
+        return False
+
+class RecordedModbusClient:
+    """ Serves the register snapshot of the current recorded row in place of the Modbus client. """
+    def __init__(self) -> None:
+        self.registers = {}     # Register values by (client-side) address
+
+    def read_holding_registers(self, address: int, count: int = 1, **_: Any) -> RecordedResponse:
+        """
+            :param address: Start address of the range
+            :param count: Number of registers
+            :return: Response with the recorded register values
+        """
+        return RecordedResponse([self.registers.get(address + i) for i in range(count)])
+
+    def is_socket_open(self) -> bool:
+        """ The recorded client is always available. """
+        return True
+
+    def close(self) -> None:
+        """ Nothing to close. """
+
+class RecordedNode:
+    """ Node of the recorded OPC UA client. """
+    def __init__(self, client: "RecordedOPCUAClient", node_id: str) -> None:
+        self.client = client
+        self.node_id = node_id
+
+    def get_value(self) -> Any:
+        """ :return: Recorded value of the node in the current row """
+        return self.client.values.get(self.node_id)
+
+class RecordedOPCUAClient:
+    """ Serves the node values of the current recorded row in place of the OPC UA client. """
+    def __init__(self) -> None:
+        self.values = {}    # Node values by node ID
+
+    def get_node(self, node_id: str) -> RecordedNode:
+        """
+            :param node_id: Node ID
+            :return: Node returning the recorded value
+        """
+        return RecordedNode(self, node_id)
+
+    def get_values(self, nodes: Sequence[RecordedNode]) -> list[Any]:
+        """
+            :param nodes: Nodes to read
+            :return: Recorded values of the nodes
+        """
+        return [node.get_value() for node in nodes]
+
+    def disconnect(self) -> None:
+        """ Nothing to disconnect. """
+
+class BatchSQLWriter:
+    """ Defers the inserts of the data transfer function until a full batch of rows is pending. """
+    def __init__(
+            self,
+            sql_connection: SQLConnection,
+            batch_size: int,
+            table: Optional[str] = None,
+            dry_run: bool = False
+        ) -> None:
+        """
+            :param sql_connection: SQL connection of the target database
+            :param batch_size: Number of rows per transaction
+            :param table: Target table (None for DB_TABLE)
+            :param dry_run: True to discard the rows instead of writing them
+        """
+        self.sql_connection = sql_connection
+        self.settings = sql_connection.settings     # Row layout of the target table
+        self.batch_size = batch_size
+        self.table = table
+        self.dry_run = dry_run
+        self.written = 0    # Number of rows written to the database
+        self.failed = 0     # Number of rows of failed batches
+
+    def insert_rows(
+            self,
+            rows: Sequence[Row],
+            table: Optional[str] = None,    # pylint: disable=unused-argument
+            columns: Optional[Sequence[str]] = None     # pylint: disable=unused-argument
+        ) -> bool:
+        """
+            Same signature as SQLConnection.insert_rows(). The rows stay pending in the row
+            buffer until the batch is full.
+            :param rows: Pending row records
+            :return: True if the rows were handled and can be reused, False if not
+        """
+        if len(rows) < self.batch_size:
+            return False
+        self.flush(rows)
+        return True
+
+    def flush(self, rows: Sequence[Row]) -> None:
+        """
+            Writes the rows in one transaction.
+            :param rows: Row records
+        """
+        if not rows:
+            return
+        if self.dry_run:
+            self.written += len(rows)
+        elif self.sql_connection.insert_rows(rows, self.table):
+            self.written += len(rows)
+        else:
+            self.failed += len(rows)
+
+class Replayer:
+    """ Feeds recorded rows through the Modbus and OPC UA decoding and the storage path. """
+    def __init__(
+            self,
+            modbus_connection: ModbusConnection,
+            opcua_connection: OPCUAConnection,
+            source_packed: bool = False
+        ) -> None:
+        """
+            :param modbus_connection: Modbus connection (its client is replaced by the recording)
+            :param opcua_connection: OPC UA connection (its client is replaced by the recording)
+            :param source_packed: True if the recorded rows contain the packed status word
+                                  instead of the status bits (STATUS_PACKED of the source)
+        """
+        self.modbus_connection = modbus_connection
+        self.opcua_connection = opcua_connection
+        self.source_packed = source_packed
+        self.modbus_client = RecordedModbusClient()
+        self.opcua_client = RecordedOPCUAClient()
+        modbus_connection.client = self.modbus_client
+        modbus_connection.connected = True
+        opcua_connection.client = self.opcua_client
+        opcua_connection.node_cache = {}
+        opcua_connection.alive = True
+
+    def load_row(self, values: Sequence[Any]) -> None:
+        """
+            Restores the Modbus registers and OPC UA values of a recorded row. The row has the
+            layout of DB_COLUMNS: OPC UA values, status bits (or the packed status word, see
+            source_packed), and process value registers.
+            :param values: Recorded values (without the timestamp)
+        """
+        modbus_config = self.modbus_connection.modbus_config
+        node_ids = self.opcua_connection.opcua_config['OPCUA_NODE_IDs']
+        nodes = len(node_ids)
+        process = nodes + (1 if self.source_packed else STATUS_BITS)
+        self.opcua_client.values = dict(zip(node_ids, values[:nodes]))
+
+        if self.source_packed:
+            status_word = int(values[nodes] or 0)
+        else:
+            status_word = 0
+            for bit, value in enumerate(values[nodes:process]):
+                if value:
+                    status_word |= 1 << bit
+        offset = modbus_config['BASE_REGISTER_OFFSET']
+        registers = {modbus_config['PEMEL_STATUS']['ADDRESS'] - offset: status_word}
+        address = modbus_config['PROCESS_VALUES']['ADDRESS'] - offset
+        for i, value in enumerate(values[process:]):
+            registers[address + i] = None if value is None else int(value)
+        self.modbus_client.registers = registers
+
+    def run(
+            self,
+            rows: Iterator[tuple[datetime, Sequence[Any]]],
+            writer: BatchSQLWriter,
+            sinks: Optional[Sequence[Any]] = None,
+            report_interval: float = 10.0
+        ) -> dict[str, float]:
+        """
+            Replays the rows without waiting between them.
+            :param rows: Recorded rows as (timestamp, values)
+            :param writer: Batch writer of the target table
+            :param sinks: Additional data sinks providing write_row() (e.g. a new archive)
+            :param report_interval: Interval for logging the progress in [s]
+            :return: Dictionary with the number of rows, the duration in [s], and rows/s
+        """
+        row_buffer = RowBuffer(row_layout(self.modbus_connection.settings,
+                                          self.opcua_connection.settings, writer.settings),
+                               writer.batch_size)
+        start = time.perf_counter()
+        last_report = start
+        count = 0
+        for timestamp, values in rows:
+            self.load_row(values)
+            data_trans_func(self.modbus_connection, self.opcua_connection, writer, sinks,
+                            timestamp=timestamp, row_buffer=row_buffer)
+            count += 1
+            now = time.perf_counter()
+            if now - last_report >= report_interval:
+                logging.info("Replayed %s rows (%.0f rows/s), last timestamp %s",
+                             count, count / (now - start), timestamp)
+                last_report = now
+        writer.flush(row_buffer.snapshot())
+        duration = time.perf_counter() - start
+        return {'rows': count, 'written': writer.written, 'failed': writer.failed,
+                'duration': duration, 'rows_per_s': count / duration if duration > 0 else 0.0}
+
+def sql_rows(
+        sql_connection: SQLConnection,
+        table: str,
+        columns: Sequence[str],
+        start: datetime,
+        end: datetime,
+        window: timedelta = timedelta(days=1)
+    ) -> Iterator[tuple[datetime, list[Any]]]:
+    """
+        Reads the recorded rows of a table in time windows, so that years of data are not
+        loaded into memory at once.
+        :param sql_connection: SQL connection of the source database
+        :param table: Source table
+        :param columns: Columns of the source table in the order of DB_COLUMNS, starting with
+                        the timestamp (status bits or packed status word)
+        :param start: First timestamp to include
+        :param end: Timestamps before this one are included
+        :param window: Time range per query
+        :return: Iterator over the rows as (timestamp, values)
+    """
+    # Explicit columns, so that added columns of the source table do not shift the values
+    query = (f"SELECT {', '.join(columns)} FROM {table} WHERE {columns[0]} >= %s "
+             f"AND {columns[0]} < %s ORDER BY {columns[0]}")
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        with sql_connection.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, (window_start, window_end))
+            result = cursor.fetchall()
+            cursor.close()
+            connection.rollback()   # End the read transaction
+        for row in result:
+            yield row[0], list(row[1:])
+        window_start = window_end
+
+def archive_rows(
+        archive_dir: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Iterator[tuple[datetime, list[Any]]]:
+    """
+        Reads the recorded rows of the local archive record batch by record batch, so that
+        long time ranges are not loaded into memory at once.
+        :param archive_dir: Directory of the archive
+        :param start: First timestamp to include (None for no lower bound)
+        :param end: Timestamps before this one are included (None for no upper bound)
+        :return: Iterator over the rows as (timestamp, values)
+    """
+    # Imported on use, since pyarrow is only required if the archive is enabled
+    from src.pci_archive import iter_archive  # pylint: disable=import-outside-toplevel
+
+    for batch in iter_archive(archive_dir, start, end):
+        columns = [column.to_pylist() for column in batch.columns]
+        for row in zip(*columns):
+            yield row[0], list(row[1:])
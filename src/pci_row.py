@@ -0,0 +1,160 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_row.py:
+> Implements the compact row records of the data storage path: preallocated rows with a fixed
+  layout, filled in place by the readers and reused after they have been stored
+----------------------------------------------------------------------------------------------------
+"""
+
+import logging
+import threading
+from typing import Any, Iterator, Optional
+from datetime import datetime
+from itertools import islice
+from collections import deque
+
+STATUS_BITS = 16    # Number of PEMEL status bits (one column per bit)
+
+class RowLayout:
+    """ Positions of the value groups in a row (in the order of DB_COLUMNS). """
+    __slots__ = ('width', 'opcua', 'status', 'process', 'packed')
+
+    def __init__(self, node_count: int, process_count: int, packed: bool = False) -> None:
+        """
+            :param node_count: Number of OPC UA values (OPCUA_NODE_IDs)
+            :param process_count: Number of PEMEL process value registers (PROCESS_VALUES COUNT)
+            :param packed: True to store the status word in one column instead of 16 bits
+        """
+        self.packed = packed
+        self.opcua = 1                          # Index 0 holds the timestamp
+        self.status = self.opcua + node_count
+        self.process = self.status + (1 if packed else STATUS_BITS)
+        self.width = self.process + process_count
+
+    @classmethod
+    def from_configs(
+            cls,
+            modbus_config: dict,
+            opcua_config: dict,
+            sql_config: Optional[dict] = None
+        ) -> "RowLayout":
+        """
+            Derives the layout from the Modbus, OPC UA, and SQL configuration.
+            :param modbus_config: Modbus configuration with PROCESS_VALUES
+            :param opcua_config: OPC UA configuration with OPCUA_NODE_IDs
+            :param sql_config: SQL configuration with STATUS_PACKED (None for status bits)
+            :return: Row layout
+        """
+        return cls(len(opcua_config['OPCUA_NODE_IDs']), modbus_config['PROCESS_VALUES']['COUNT'],
+                   bool((sql_config or {}).get('STATUS_PACKED', False)))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RowLayout) and (self.status, self.process, self.width) == (
+            other.status, other.process, other.width)
+
+    def __hash__(self) -> int:
+        return hash((self.status, self.process, self.width))
+
+class Row:
+    """ Row record with the SQL parameters of one data storage cycle. """
+    __slots__ = ('timestamp', 'values')
+
+    def __init__(self, width: int) -> None:
+        """
+            :param width: Number of columns including the timestamp
+        """
+        self.timestamp = None
+        self.values = [None] * width    # SQL parameters in the order of DB_COLUMNS
+
+    def stamp(self, timestamp: datetime) -> None:
+        """
+            Sets the timestamp of the row.
+            :param timestamp: Timestamp of the values
+        """
+        self.timestamp = timestamp
+        self.values[0] = timestamp.isoformat(sep=' ', timespec='seconds')
+
+    def fields(self) -> Iterator[Any]:
+        """
+            :return: Iterator over the process values without the timestamp (for the sinks)
+        """
+        return islice(self.values, 1, None)
+
+class RowBuffer:
+    """ Preallocated rows, which are reused after they have been stored in the database. """
+    def __init__(self, layout: RowLayout, capacity: int) -> None:
+        """
+            :param layout: Layout of the rows
+            :param capacity: Maximum number of rows waiting for the database (e.g. during an
+                             SQL outage), the oldest rows are dropped if it is exceeded
+        """
+        self.capacity = capacity
+        self.layout = layout
+        self.free = deque(Row(layout.width) for _ in range(capacity))
+        self.pending = deque()  # Filled rows waiting for the database (oldest first)
+        self.dropped = 0        # Number of rows dropped because the buffer was full
+        self.lock = threading.Lock()
+
+    def set_layout(self, layout: RowLayout) -> None:
+        """
+            Reallocates the rows for a changed layout (e.g. after a configuration reload).
+            Pending rows of the previous layout are dropped.
+            :param layout: New layout of the rows
+        """
+        with self.lock:
+            if self.pending:
+                logging.warning("Dropping %s buffered rows after a change of the row layout",
+                                len(self.pending))
+                self.dropped += len(self.pending)
+            self.layout = layout
+            self.free = deque(Row(layout.width) for _ in range(self.capacity))
+            self.pending = deque()
+
+    def acquire(self) -> Row:
+        """
+            Returns a free row to be filled. If all rows are pending, the oldest pending
+            row is dropped and reused.
+            :return: Row record (with the values of its previous use)
+        """
+        with self.lock:
+            if self.free:
+                return self.free.popleft()
+            self.dropped += 1
+            if (self.dropped - 1) % self.capacity == 0:    # Once per buffer length
+                logging.warning("Row buffer full, dropped %s rows in total", self.dropped)
+            return self.pending.popleft()
+
+    def discard(self, row: Row) -> None:
+        """
+            Returns an acquired row that could not be filled.
+            :param row: Row record
+        """
+        with self.lock:
+            self.free.appendleft(row)
+
+    def push(self, row: Row) -> None:
+        """
+            Adds a filled row to the rows waiting for the database.
+            :param row: Row record
+        """
+        with self.lock:
+            self.pending.append(row)
+
+    def snapshot(self) -> list[Row]:
+        """
+            :return: List of the pending rows (oldest first)
+        """
+        with self.lock:
+            return list(self.pending)
+
+    def release(self, count: int) -> None:
+        """
+            Marks the oldest pending rows as stored, so that they can be reused.
+            :param count: Number of stored rows
+        """
+        with self.lock:
+            for _ in range(min(count, len(self.pending))):
+                self.free.append(self.pending.popleft())
@@ -0,0 +1,123 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_scan.py:
+> Implements scan groups for multi-rate data acquisition and the scheduler combining the reads
+  of groups that are due at the same tick
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+from typing import Any
+
+MAX_REGISTER_COUNT = 125    # Maximum number of holding registers per Modbus read request
+
+class ScanGroup:
+    """ Set of Modbus registers and OPC UA nodes sampled with a common interval. """
+    def __init__(self, group_config: dict[str, Any]) -> None:
+        self.name = group_config['NAME']
+        self.interval = float(group_config['INTERVAL'])
+        # Modbus register ranges as (start address, count)
+        self.ranges = [(r['ADDRESS'], r['COUNT']) for r in group_config.get('MODBUS_RANGES', [])]
+        self.nodes = list(group_config.get('OPCUA_NODES', []))
+        # Destination of the rows in the SQL database
+        self.table = group_config['DB_TABLE']
+        self.columns = group_config['DB_COLUMNS']
+        # Milliseconds are only stored for sub-second intervals (seconds as in the main table)
+        self.timespec = 'milliseconds' if self.interval < 1 else 'seconds'
+        self.next_due = 0.0
+
+        value_count = len(self.nodes) + sum(count for _, count in self.ranges)
+        if len(self.columns) != value_count + 1:    # +1 for the timestamp
+            raise ValueError(f"Scan group '{self.name}': {len(self.columns)} DB_COLUMNS do not "
+                             f"match {value_count} values + timestamp")
+
+    def build_row(
+            self,
+            registers: dict[int, int],
+            node_values: dict[str, Any]
+        ) -> list[Any]:
+        """
+            Collects the values of the group from the shared read results.
+            :param registers: Register values of the merged reads by address
+            :param node_values: OPC UA values of the combined read by node ID
+            :return: Row with the OPC UA values followed by the register values
+        """
+        row = [node_values.get(node_id) for node_id in self.nodes]
+        for address, count in self.ranges:
+            row.extend(registers.get(address + i) for i in range(count))
+        return row
+
+class ScanScheduler:
+    """ Determines the scan groups due at each tick and combines their reads. """
+    def __init__(self, groups: list[ScanGroup]) -> None:
+        self.groups = []
+        self.set_groups(groups)
+
+    def set_groups(self, groups: list[ScanGroup]) -> None:
+        """
+            Replaces the scan groups (e.g. after a configuration reload). The new groups are
+            due immediately.
+            :param groups: New list of scan groups
+        """
+        start = time.monotonic()
+        for group in groups:
+            group.next_due = start
+        self.groups = groups
+
+    def time_to_next_tick(self) -> float:
+        """
+            Returns the time until the next scan group is due.
+            :return: Waiting time in [s] (0 if a group is already due)
+        """
+        if not self.groups:     # All groups removed by a configuration reload
+            return 1.0
+        return max(0.0, min(group.next_due for group in self.groups) - time.monotonic())
+
+    def due_groups(self) -> list[ScanGroup]:
+        """
+            Returns the scan groups due at the current tick and schedules their next scan.
+            (Missed ticks are skipped instead of being read in a burst)
+            :return: List of due scan groups
+        """
+        now = time.monotonic()
+        due = []
+        for group in self.groups:
+            if group.next_due <= now:
+                due.append(group)
+                group.next_due += group.interval
+                if group.next_due <= now:
+                    group.next_due = now + group.interval
+        return due
+
+    @staticmethod
+    def merge_ranges(groups: list[ScanGroup]) -> list[tuple[int, int]]:
+        """
+            Merges the overlapping and contiguous Modbus register ranges of several groups
+            into as few read requests as possible, each of at most MAX_REGISTER_COUNT registers.
+            :param groups: Scan groups to be read together
+            :return: List of merged ranges as (start address, count)
+        """
+        ranges = sorted(r for group in groups for r in group.ranges)
+        merged = []
+        for address, count in ranges:
+            if merged:
+                start, merged_count = merged[-1]
+                if address <= start + merged_count:
+                    merged[-1] = (start, max(start + merged_count, address + count) - start)
+                    continue
+            merged.append((address, count))
+        # Split the ranges exceeding the limit of one read request
+        return [(start + offset, min(MAX_REGISTER_COUNT, count - offset))
+                for start, count in merged for offset in range(0, count, MAX_REGISTER_COUNT)]
+
+    @staticmethod
+    def merge_nodes(groups: list[ScanGroup]) -> list[str]:
+        """
+            Collects the OPC UA nodes of several groups for one combined read.
+            :param groups: Scan groups to be read together
+            :return: List of unique node IDs
+        """
+        return list(dict.fromkeys(node_id for group in groups for node_id in group.nodes))
@@ -0,0 +1,181 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_service.py:
+> Implements the portable service runner (e.g. as a systemd service or in a container): a shared
+  stop event for the thread loops, SIGTERM handling, the systemd notification and watchdog
+  protocol, and the bounded drain of the buffered rows on shutdown
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import os
+import time
+import signal
+import socket
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+def sd_notify(state: str) -> bool:
+    """
+        Sends a state to the service manager via NOTIFY_SOCKET (systemd Type=notify), e.g.
+        'READY=1', 'WATCHDOG=1', or 'STOPPING=1'. (No-op without a service manager)
+        :param state: Notification message
+        :return: True if the notification was sent, False otherwise
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address or not hasattr(socket, 'AF_UNIX'):
+        return False
+    if address.startswith('@'):     # Abstract namespace socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode())
+        return True
+    except Exception as e:
+        logging.warning("Notifying the service manager failed: %s", e)
+        return False
+
+def watchdog_interval() -> Optional[float]:
+    """
+        Derives the interval of the watchdog notifications from WATCHDOG_USEC (systemd
+        WatchdogSec), half of the watchdog timeout.
+        :return: Interval in [s] or None if the watchdog is not enabled for this process
+    """
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1e6 / 2
+
+class ServiceRunner:
+    """ Runs the service threads with a shared stop event and stops them gracefully. """
+    def __init__(self, gen_config: dict[str, Any]) -> None:
+        """
+            :param gen_config: General configuration with SHUTDOWN_TIMEOUT in [s] (time for
+                               stopping the threads and draining the buffered rows)
+        """
+        self.gen_config = gen_config
+        self.stop_event = threading.Event()
+        self.threads = []   # Threads as (thread, critical)
+        self.deadline = None
+        self.exit_code = 0
+
+    def thread(
+            self,
+            name: str,
+            target: Callable[..., Any],
+            *args: Any,
+            critical: bool = True
+        ) -> threading.Thread:
+        """
+            Creates a service thread, which receives the stop event as keyword argument.
+            :param name: Name of the thread
+            :param target: Thread function accepting stop_event
+            :param args: Arguments of the thread function
+            :param critical: True if the service stops when the thread ends unexpectedly
+            :return: Thread (started by the caller)
+        """
+        thread = threading.Thread(target=target, args=args, name=name,
+                                  kwargs={'stop_event': self.stop_event}, daemon=True)
+        self.threads.append((thread, critical))
+        return thread
+
+    def install_signal_handlers(self) -> None:
+        """
+            Stops the service on SIGTERM (service manager, container stop) and SIGINT.
+            (Must be called from the main thread)
+        """
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.stop(signal.Signals(signum).name))
+
+    def stop(self, reason: str) -> None:
+        """
+            Requests the threads to stop.
+            :param reason: Reason for the log
+        """
+        if not self.stop_event.is_set():
+            logging.info("Stopping PyComInt (%s)...", reason)
+            self.stop_event.set()
+
+    def run(self) -> int:
+        """
+            Reports the readiness to the service manager and monitors the critical threads
+            until the service is stopped. The watchdog is only notified while all critical
+            threads are running, so that a hung service is restarted.
+            :return: Exit code (1 if a critical thread ended unexpectedly)
+        """
+        sd_notify("READY=1")
+        interval = watchdog_interval() or 1.0
+        while not self.stop_event.wait(interval):
+            dead = [thread.name for thread, critical in self.threads
+                    if critical and thread.ident is not None and not thread.is_alive()]
+            if dead:
+                logging.error("Service threads ended unexpectedly: %s", dead)
+                self.exit_code = 1
+                self.stop("thread failure")
+                break
+            sd_notify("WATCHDOG=1")
+        return self.exit_code
+
+    def shutdown(self) -> list[str]:
+        """
+            Stops the threads and waits for them until SHUTDOWN_TIMEOUT (the remaining time
+            is available for draining the buffered rows, see remaining()).
+            :return: Names of the threads still running after the timeout
+        """
+        self.stop("shutdown")
+        sd_notify("STOPPING=1")
+        self.deadline = time.monotonic() + self.gen_config.get('SHUTDOWN_TIMEOUT', 8)
+        running = []
+        for thread, _ in self.threads:
+            if thread.ident is not None and thread is not threading.current_thread():
+                thread.join(self.remaining())
+                if thread.is_alive():
+                    logging.warning("Thread %s did not stop in time", thread.name)
+                    running.append(thread.name)
+        return running
+
+    def remaining(self) -> float:
+        """
+            :return: Remaining time until SHUTDOWN_TIMEOUT in [s]
+        """
+        if self.deadline is None:
+            return self.gen_config.get('SHUTDOWN_TIMEOUT', 8)
+        return max(0.0, self.deadline - time.monotonic())
+
+def reconnect(sql_connection: Any) -> bool:
+    """
+        Reconnects the SQL connection (the reconnect workers are already stopped on shutdown).
+        :param sql_connection: SQL connection
+        :return: True if the connection is up again
+    """
+    sql_connection.connect()
+    return sql_connection.alive
+
+def drain_rows(row_buffer: Any, sql_connection: Any, timeout: float) -> int:
+    """
+        Inserts the rows still buffered on shutdown (e.g. after an SQL outage) within the
+        remaining shutdown time. (Only after the storage thread stopped, which owns the buffer)
+        :param row_buffer: RowBuffer of the data storage
+        :param sql_connection: SQL connection providing insert_rows()
+        :param timeout: Maximum time for draining in [s]
+        :return: Number of rows that could not be inserted
+    """
+    deadline = time.monotonic() + timeout
+    rows = row_buffer.snapshot()
+    while rows and time.monotonic() < deadline:
+        if sql_connection.insert_rows(rows):
+            row_buffer.release(len(rows))
+            logging.info("Drained %s buffered rows", len(rows))
+        elif sql_connection.alive or not reconnect(sql_connection):
+            time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+        rows = row_buffer.snapshot()
+    if rows:
+        logging.error("Shutdown timeout: %s buffered rows could not be stored", len(rows))
+    return len(rows)
@@ -10,85 +10,515 @@ pci_sql.py:
 
 # pylint: disable=no-member, broad-exception-caught, broad-exception-raised
 
+import time
 import logging
-from typing import Any, Sequence
+import threading
+from typing import Any, Callable, Iterator, Optional, Sequence
 from datetime import datetime
+from functools import partial
+from contextlib import contextmanager
 
 import yaml
-import pg8000
+
+from src.pci_reload import diff_config
+from src.pci_config import POOL_DEFAULTS, compile_sql_config
+from src.pci_row import Row
+from src.pci_status import status_view_query, load_status_bit_names
+from src.pci_trace import span, traced
+
+MAX_QUERY_PARAMETERS = 32767    # Maximum number of parameters of a PostgreSQL statement
+# SQLSTATE classes of errors caused by the values of a row (data exception, integrity constraint
+# violation), which are dropped instead of keeping the rows buffered
+DATA_ERROR_CLASSES = ('22', '23')
+
+class SQLConnectionLost(Exception):
+    """ Raised if a pooled connection broke during an operation (e.g. closed socket). """
+
+def is_data_error(error: Exception) -> bool:
+    """
+        :param error: Exception raised by the driver
+        :return: True if the values of a row caused the error (e.g. a wrong type, NaN in an
+                 integer column, or a constraint violation), False for connection errors
+    """
+    if isinstance(error, TypeError):
+        return True     # Values the driver cannot convert
+    details = error.args[0] if error.args else None
+    # pg8000 reports server errors with the error fields, e.g. {'C': '22P02', ...}
+    return isinstance(details, dict) and str(details.get('C', ''))[:2] in DATA_ERROR_CLASSES
+
+class SQLConnectionPool:
+    """ Small pool of database connections with liveness probes and transparent reconnect. """
+    def __init__(
+            self,
+            connect_func: Callable[[], Any],
+            size: int,
+            probe_after_idle: float,
+            checkout_timeout: float
+        ) -> None:
+        """
+            :param connect_func: Function opening a new database connection
+            :param size: Maximum number of open connections (concurrent writers)
+            :param probe_after_idle: Idle time in [s] after which a connection is probed
+                                     with 'SELECT 1' on checkout
+            :param checkout_timeout: Maximum waiting time for a free connection in [s]
+        """
+        self.connect_func = connect_func
+        self.size = size
+        self.probe_after_idle = probe_after_idle
+        self.checkout_timeout = checkout_timeout
+        self.idle = []          # Idle connections with the time of their last use
+        self.open_count = 0     # Number of open (idle or checked out) connections
+        self.closed = False
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def probe(connection: Any) -> bool:
+        """
+            Checks whether a connection is alive with a cheap query.
+            :param connection: Database connection
+            :return: True if the connection answered, False otherwise
+        """
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            connection.rollback()   # End the transaction opened by the probe
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def close_connection(connection: Any) -> None:
+        """
+            Closes a connection and ignores errors of already broken connections.
+            :param connection: Database connection
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @traced("sql.checkout")
+    def checkout(self, force_probe: bool = False) -> Any:
+        """
+            Takes a connection from the pool. Idle connections are probed after
+            probe_after_idle and replaced by a new connection if they are broken.
+            :param force_probe: Probe the connection regardless of its idle time
+            :return: Live database connection
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.idle or self.open_count < self.size,
+                                           self.checkout_timeout):
+                raise TimeoutError("No SQL connection available in the pool")
+            if self.idle:
+                connection, last_used = self.idle.pop()
+            else:
+                connection, last_used = None, None
+                self.open_count += 1    # Reserve the slot for a new connection
+
+        idle_time = time.monotonic() - last_used if last_used is not None else 0.0
+        if connection is not None and (force_probe or idle_time >= self.probe_after_idle):
+            if not self.probe(connection):
+                logging.warning("Replacing a broken SQL connection of the pool")
+                self.close_connection(connection)
+                connection = None
+
+        if connection is None:
+            try:
+                connection = self.connect_func()
+            except Exception:
+                self.release_slot()
+                raise
+        return connection
+
+    def checkin(self, connection: Any, broken: bool = False) -> None:
+        """
+            Returns a connection to the pool.
+            :param connection: Database connection from checkout()
+            :param broken: Close the connection instead of reusing it
+        """
+        if broken or self.closed:
+            self.close_connection(connection)
+            self.release_slot()
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def release_slot(self) -> None:
+        """
+            Frees the slot of a closed connection.
+        """
+        with self.condition:
+            self.open_count -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, force_probe: bool = False) -> Iterator[Any]:
+        """
+            Provides a pooled connection for the duration of a with block. If the block fails,
+            the transaction is rolled back; a failing rollback marks the connection as broken.
+            :param force_probe: Probe the connection regardless of its idle time
+        """
+        connection = self.checkout(force_probe)
+        try:
+            yield connection
+        except Exception as e:
+            try:
+                connection.rollback()
+            except Exception:
+                self.checkin(connection, broken=True)
+                raise SQLConnectionLost(str(e)) from e
+            self.checkin(connection)
+            raise
+        self.checkin(connection)
+
+    def close(self) -> None:
+        """
+            Closes all idle connections. (Checked out connections are closed on checkin)
+        """
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.open_count -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self.close_connection(connection)
 
 class SQLConnection:
     """ Handles the SQL connection and operations. """
-    def __init__(self) -> None:
+
+    def __init__(self, sql_config: Optional[dict] = None) -> None:
+        """
+            :param sql_config: Validated SQL configuration (None to load the file)
+        """
         try:
             # Load SQL configuration
-            with open("config/config_sql.yaml", "r", encoding="utf-8") as env_file:
-                self.sql_config = yaml.safe_load(env_file)
-            self.connection = None
+            if sql_config is None:
+                with open("config/config_sql.yaml", "r", encoding="utf-8") as env_file:
+                    sql_config = yaml.safe_load(env_file)
+            self.sql_config = sql_config
+            # Compiled settings with the table and the column mapping (used by the inserts)
+            self.settings = compile_sql_config(self.sql_config)
+            self.pool = None
+            self.queries = {}   # Prepared INSERT statements by (table, columns)
+            self.alive = False  # Cleared by connection failures on the hot path
+            self.health = None  # ConnectionHealth of the supervisor (optional)
+            # Column names of the status bits in STATUS_VIEW (from the validated Modbus
+            # configuration, None to load config_modbus.yaml)
+            self.status_bit_names = None
+            self.network_errors = (OSError, SQLConnectionLost)  # Extended by connect()
         except Exception as e:
             logging.error("Failed to load SQL configuration: %s", e)
 
+    @traced("sql.connect")
     def connect(self) -> None:
         """
-            Establishes a connection to the SQL database.
+            Establishes the connection pool to the SQL database (replacing a previous pool).
         """
         try:
-            self.connection = pg8000.connect(
-                user=self.sql_config['DB_USER'],
-                password=self.sql_config['DB_PASSWORD'],
-                database=self.sql_config['DB_NAME'],
-                host=self.sql_config['DB_HOST'],
-                port=self.sql_config['DB_PORT']
+            self.close()
+            pool = SQLConnectionPool(
+                self.connect_function(),
+                size=self.sql_config.get('POOL_SIZE', POOL_DEFAULTS['POOL_SIZE']),
+                probe_after_idle=self.sql_config.get('POOL_PROBE_AFTER_IDLE',
+                                                     POOL_DEFAULTS['POOL_PROBE_AFTER_IDLE']),
+                checkout_timeout=self.sql_config.get('POOL_CHECKOUT_TIMEOUT',
+                                                     POOL_DEFAULTS['POOL_CHECKOUT_TIMEOUT'])
             )
+            pool.checkin(pool.checkout())   # Open the first connection to test the parameters
+            self.pool = pool
+            self.alive = True
             logging.info("Connected to SQL database <%s> as %s",
                          self.sql_config['DB_NAME'], self.sql_config['DB_USER'])
+            if self.sql_config.get('STATUS_PACKED') and self.sql_config.get('STATUS_VIEW'):
+                self.create_status_view()
             return
         except Exception as e:
             logging.error("SQL connection failed: %s", e)
-            self.connection = None  # Mark as unavailable
+            self.pool = None  # Mark as unavailable
+
+    def connect_function(self) -> Callable[[], Any]:
+        """
+            Returns the function opening a database connection with the connection parameters
+            (replaced by the database stand-in of the soak test, see pci_soak.py).
+            :return: Function opening a new pg8000 connection
+        """
+        # Imported on first use, so that deployments without SQL do not load pg8000
+        import pg8000  # pylint: disable=import-outside-toplevel
+
+        # pg8000 reports socket errors as InterfaceError ('network error')
+        self.network_errors = (OSError, SQLConnectionLost, pg8000.InterfaceError)
+        return partial(
+            pg8000.connect,
+            user=self.sql_config['DB_USER'],
+            password=self.sql_config['DB_PASSWORD'],
+            database=self.sql_config['DB_NAME'],
+            host=self.sql_config['DB_HOST'],
+            port=self.sql_config['DB_PORT'],
+            # Socket timeout, so that a silently dropped connection fails instead of
+            # blocking until the TCP timeout of the OS
+            timeout=self.sql_config.get('DB_TIMEOUT')
+        )
+
+    def create_status_view(self) -> None:
+        """
+            Creates the view exposing the bits of the packed status word (STATUS_COLUMN) as
+            columns named after PEMEL_STATUS in config_modbus.yaml.
+        """
+        view = self.sql_config['STATUS_VIEW']
+        try:
+            bit_names = self.status_bit_names
+            if bit_names is None:
+                bit_names = load_status_bit_names()
+            query = status_view_query(view, self.sql_config['DB_TABLE'],
+                                      self.sql_config['STATUS_COLUMN'], bit_names)
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(query)
+                connection.commit()
+                cursor.close()
+            logging.info("Created status view %s", view)
+        except Exception as e:
+            logging.warning("Could not create the status view %s: %s", view, e)
+
+    def mark_dead(self, error: Exception) -> None:
+        """
+            Marks the connection as lost if a failed call indicates a network failure, so that
+            the following inserts fail fast (the rows stay buffered) and the supervisor
+            reconnects.
+            :param error: Exception raised by the pool or the driver
+        """
+        if self.alive and isinstance(error, self.network_errors):
+            logging.warning("SQL connection lost: %s", error)
+            self.alive = False
+            if self.health is not None:
+                self.health.report_failure()
 
     def is_connected(self) -> bool:
         """
-            Checks if the SQL connection is active.
+            Checks if the SQL connection is active: network errors on the hot path mark it as
+            lost, otherwise a pooled connection is probed with 'SELECT 1' (broken connections
+            are replaced transparently).
             :return: True if connected, False otherwise.
         """
-        return self.connection is not None
+        if self.pool is None or not self.alive:
+            return False
+        try:
+            with self.pool.connection(force_probe=True):
+                return True
+        except Exception as e:
+            logging.warning("SQL connection check failed: %s", e)
+            self.alive = False
+            return False
+
+    def close(self) -> None:
+        """
+            Closes the connections of the pool.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def reload_config(self, new_config: dict) -> None:
+        """
+            Applies a changed SQL configuration at runtime. Table and column changes only
+            rebuild the INSERT statements, the connection is re-established only if the
+            connection parameters changed (by the reconnect worker if it is supervised).
+            :param new_config: New SQL configuration
+        """
+        settings = compile_sql_config(new_config)   # Rejects an invalid configuration
+        changed = diff_config(self.sql_config, new_config)
+        self.sql_config = new_config
+        self.settings = settings
+        self.queries = {}
+        if changed & {'DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_TIMEOUT'}:
+            logging.info("SQL connection parameters changed, reconnecting...")
+            if self.health is not None:
+                self.health.request_reconnect()     # The worker owns connect()
+            else:
+                self.connect()
 
-    def insert_data(self, values: Sequence[Any]) -> None:
+    def get_insert_query(self, table: str, columns: Sequence[str]) -> str:
+        """
+            Returns the INSERT statement for a table from the statement cache.
+            :param table: Table to insert into
+            :param columns: Column names including the timestamp
+            :return: INSERT statement with placeholders for all columns
+        """
+        key = (table, tuple(columns))
+        query = self.queries.get(key)
+        if query is None:
+            placeholders = ', '.join(['%s'] * len(columns))
+            column_names = ', '.join(columns)  # Join the column names with commas
+            query = f"INSERT INTO {table} ({column_names}) VALUES ({placeholders})"
+            self.queries[key] = query
+        return query
+
+    @traced("sql.insert_data")
+    def insert_data(
+            self,
+            values: Sequence[Any],
+            timestamp: Optional[datetime] = None,
+            table: Optional[str] = None,
+            columns: Optional[Sequence[str]] = None,
+            timespec: str = 'seconds'
+        ) -> None:
         """
             Inserts data into PostgreSQL database using pg8000
             :param values: Process values to store in the SQL database
+            :param timestamp: Timestamp of the values (None for the current time)
+            :param table: Table to insert into (None for DB_TABLE, e.g. for scan groups)
+            :param columns: Column names including the timestamp (None for DB_COLUMNS)
+            :param timespec: Resolution of the stored timestamp ('milliseconds' for scan groups
+                             with sub-second intervals)
         """
+        if not self.alive:
+            logging.error("Skipping the insert into %s, SQL connection lost",
+                          table or self.settings.table)
+            return
         try:
             # Get the current timestamp
-            current_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor = self.connection.cursor()
-
-            # Placeholders based on the number of values
-            placeholders = ', '.join(['%s'] * (len(values) + 1))  # +1 for the timestamp
-            columns = ', '.join(self.sql_config['DB_COLUMNS'])  # Join the column names with commas
+            if timestamp is None:
+                timestamp = datetime.now()
+            current_timestamp = timestamp.isoformat(sep=' ', timespec=timespec)
+            if table is None:
+                table = self.settings.table
+                columns = self.settings.columns
 
-            # Check the number of columns and values
-            expected_columns_count = len(self.sql_config['DB_COLUMNS'])
+            # Check the number of columns and values (the column count of DB_COLUMNS is
+            # checked against the row layout at startup, see pci_config.py)
+            expected_columns_count = len(columns)
             actual_values_count = len(values) + 1  # +1 for the current_timestamp
+            if expected_columns_count != actual_values_count:
+                raise ValueError(
+                    f"Column count mismatch: Expected {expected_columns_count}, got "
+                    f"{actual_values_count}. Ensure the number of columns matches the values."
+                )
 
-            assert expected_columns_count == actual_values_count, ValueError(
-                f"Column count mismatch: Expected {expected_columns_count}, got "
-                f"{actual_values_count}. Ensure the number of columns matches the values."
-            )
-
-            query = f"INSERT INTO {self.sql_config['DB_TABLE']} ({columns}) VALUES ({placeholders})"
+            query = self.get_insert_query(table, columns)
 
             # Add the timestamp to the values
-            values_with_timestamp = [current_timestamp] + values
+            values_with_timestamp = [current_timestamp, *values]
 
-            # Execute the query
-            cursor.execute(query, values_with_timestamp)
+            # Retry once with a new connection if the pooled connection was broken
+            for attempt in range(2):
+                try:
+                    with self.pool.connection() as connection:
+                        cursor = connection.cursor()
+                        # Execute the query
+                        with span("sql.execute"):
+                            cursor.execute(query, values_with_timestamp)
+                        # Commit the transaction
+                        with span("sql.commit"):
+                            connection.commit()
+                        # Close the cursor
+                        cursor.close()
+                    break
+                except SQLConnectionLost as e:
+                    if attempt == 1:
+                        raise
+                    logging.warning("SQL connection lost, retrying the insert: %s", e)
+        except Exception as e:
+            logging.error("Error inserting data into PostgreSQL: %s", e)
+            self.mark_dead(e)
 
-            # Commit the transaction
-            self.connection.commit()
+    @traced("sql.insert_rows")
+    def insert_rows(
+            self,
+            rows: Sequence[Row],
+            table: Optional[str] = None,
+            columns: Optional[Sequence[str]] = None
+        ) -> bool:
+        """
+            Inserts row records in one transaction, several rows are combined into multi-row
+            INSERT statements (e.g. rows buffered during an SQL outage, replay and backfill).
+            If the values of a row are invalid, the rows are inserted one by one and the
+            invalid rows are dropped, so that they do not block the storage of the others.
+            :param rows: Row records with the values in the order of the columns
+            :param table: Table to insert into (None for DB_TABLE)
+            :param columns: Column names including the timestamp (None for DB_COLUMNS)
+            :return: True if the rows were inserted (or dropped as invalid), False if they
+                     have to stay buffered (connection errors)
+        """
+        if not rows:
+            return True
+        if not self.alive:
+            return False    # Keep the rows buffered until the supervisor reconnects
+        if table is None:
+            table = self.settings.table
+        if columns is None:
+            columns = self.settings.columns
+        if len(rows[0].values) != len(columns):
+            logging.error("Column count mismatch: Expected %s, got %s. Ensure the number of "
+                          "columns matches the row layout.", len(columns), len(rows[0].values))
+            return False
+        try:
+            # PostgreSQL allows at most 32767 parameters per statement
+            chunk_size = max(1, MAX_QUERY_PARAMETERS // len(columns))
+            placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+            single_query = self.get_insert_query(table, columns)
+            prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
 
-            # Close the cursor
-            cursor.close()
+            # Retry once with a new connection if the pooled connection was broken
+            for attempt in range(2):
+                try:
+                    with self.pool.connection() as connection:
+                        cursor = connection.cursor()
+                        for i in range(0, len(rows), chunk_size):
+                            chunk = rows[i:i + chunk_size]
+                            if len(chunk) == 1:
+                                query, params = single_query, chunk[0].values
+                            else:
+                                query = prefix + ', '.join([placeholders] * len(chunk))
+                                params = [value for row in chunk for value in row.values]
+                            with span("sql.execute", rows=len(chunk)):
+                                cursor.execute(query, params)
+                        with span("sql.commit"):
+                            connection.commit()
+                        cursor.close()
+                    return True
+                except SQLConnectionLost as e:
+                    if attempt == 1:
+                        raise
+                    logging.warning("SQL connection lost, retrying the insert: %s", e)
         except Exception as e:
-            logging.error("Error inserting data into PostgreSQL: %s", e)
+            if is_data_error(e):
+                logging.warning("Invalid values in %s rows, inserting them one by one: %s",
+                                len(rows), e)
+                return self.insert_valid_rows(rows, table, columns)
+            logging.error("Error inserting %s rows into PostgreSQL: %s", len(rows), e)
+            self.mark_dead(e)
+        return False
+
+    def insert_valid_rows(self, rows: Sequence[Row], table: str, columns: Sequence[str]) -> bool:
+        """
+            Inserts the rows one by one in one transaction and drops the rows with invalid
+            values (each row is rolled back to its savepoint), so that a connection error
+            does not leave a part of the rows stored.
+            :param rows: Row records with the values in the order of the columns
+            :param table: Table to insert into
+            :param columns: Column names including the timestamp
+            :return: True if the valid rows were inserted, False on connection errors
+        """
+        query = self.get_insert_query(table, columns)
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                for row in rows:
+                    cursor.execute("SAVEPOINT pycomint_row")
+                    try:
+                        cursor.execute(query, row.values)
+                    except Exception as e:
+                        if not is_data_error(e):
+                            raise
+                        cursor.execute("ROLLBACK TO SAVEPOINT pycomint_row")
+                        logging.error("Dropping the invalid row of %s: %s", row.values[0], e)
+                connection.commit()
+                cursor.close()
+            return True
+        except Exception as e:
+            logging.error("Error inserting %s rows into PostgreSQL: %s", len(rows), e)
+            self.mark_dead(e)
+        return False
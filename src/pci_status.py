@@ -0,0 +1,84 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_status.py:
+> Implements the packed storage of the PEMEL status word: bit column names from PEMEL_STATUS,
+  the generated SQL view exposing the bits, and the vectorized decoding of stored status words
+----------------------------------------------------------------------------------------------------
+"""
+
+import re
+from typing import Any, Optional
+
+import yaml
+
+from src.pci_row import STATUS_BITS
+
+def status_bit_names(modbus_config: dict[str, Any]) -> list[str]:
+    """
+        Derives the column names of the status bits from PEMEL_STATUS, e.g. 'Safety OK' >
+        'safety_ok'. (Bits without a description are named 'bit_<n>')
+        :param modbus_config: Modbus configuration with PEMEL_STATUS
+        :return: Column names of the bits 0 - 15
+    """
+    status_config = modbus_config['PEMEL_STATUS']
+    names = []
+    for bit in range(STATUS_BITS):
+        description = str(status_config.get(f"BIT_{bit}", ""))
+        name = re.sub(r'[^0-9a-z]+', '_', description.lower()).strip('_')
+        names.append(name or f"bit_{bit}")
+    return names
+
+def load_status_bit_names() -> list[str]:
+    """
+        Loads the column names of the status bits from config_modbus.yaml.
+        :return: Column names of the bits 0 - 15
+    """
+    with open("config/config_modbus.yaml", "r", encoding="utf-8") as env_file:
+        return status_bit_names(yaml.safe_load(env_file))
+
+def status_view_query(
+        view: str,
+        table: str,
+        status_column: str,
+        bit_names: list[str]
+    ) -> str:
+    """
+        Generates the view exposing the bits of the packed status word as separate columns
+        (computed on read, so that the table only stores one column).
+        :param view: Name of the view
+        :param table: Table with the packed status word
+        :param status_column: Column of the status word
+        :param bit_names: Column names of the bits 0 - 15
+        :return: CREATE OR REPLACE VIEW statement
+    """
+    bits = ', '.join(f"({status_column} >> {bit}) & 1 AS {name}"
+                     for bit, name in enumerate(bit_names))
+    return f"CREATE OR REPLACE VIEW {view} AS SELECT *, {bits} FROM {table}"
+
+def decode_status(
+        table: Any,
+        status_column: str,
+        bit_names: Optional[list[str]] = None
+    ) -> Any:
+    """
+        Decodes the packed status words of an Arrow table (e.g. from read_archive()) into bit
+        columns with vectorized compute kernels instead of a loop over the rows.
+        :param table: Arrow table with the status word column
+        :param status_column: Column of the status word
+        :param bit_names: Column names of the bits 0 - 15 (None for config_modbus.yaml)
+        :return: Arrow table with additional int8 columns for the bits
+    """
+    # Imported on use, since pyarrow is only required for the archive
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.compute as pc  # pylint: disable=import-outside-toplevel
+
+    if bit_names is None:
+        bit_names = load_status_bit_names()
+    words = pc.cast(table.column(status_column), pa.int32())
+    for bit, name in enumerate(bit_names):
+        bit_values = pc.bit_wise_and(pc.shift_right(words, bit), 1)
+        table = table.append_column(name, pc.cast(bit_values, pa.int8()))
+    return table
@@ -10,41 +10,77 @@ pci_threads.py:
 
 # pylint: disable=no-member, broad-exception-caught, broad-exception-raised
 
-import time
 import logging
+import threading
+from typing import Any, Optional, Sequence
+from datetime import datetime
 
 from src.pci_modbus import ModbusConnection
 from src.pci_opcua import OPCUAConnection
 from src.pci_sql import SQLConnection
+from src.pci_scan import ScanScheduler
+from src.pci_control import ControlExecutor
+from src.pci_row import RowBuffer
+from src.pci_config import row_layout
+from src.pci_events import StatusEvent, COOLING_TEMPERATURE_BIT
+from src.pci_health import wait_up
+from src.pci_trace import traced
 
 def pemel_control(
-        control_interval: float,
+        gen_config: dict[str, Any],
         modbus_connection: ModbusConnection,
-        opcua_connection: OPCUAConnection
+        opcua_connection: OPCUAConnection,
+        stop_event: Optional[threading.Event] = None
     ) -> None:
     """
         Contains the thread function for PEMEL control via OPCUA and Modbus
-        :param control_interval: Interval for PEMEL control in [s]
+        :param gen_config: General configuration with the interval for PEMEL control
+                           PEMEL_CONTROL_INTERVAL in [s] (read in every cycle for hot reload)
+        :param modbus_connection: Dedicated Modbus connection for PEMEL control, so that the
+                                  control path does not share retries with data storage
+        :param stop_event: Event ending the loop (None to run until the process exits)
+        (If the connection has a status change detector, the PEMEL current is set to 0 A
+        immediately when the hydrogen cooling temperature is lost, without waiting for the
+        next cycle, also while OPC UA is down. Cycles are skipped while a supervised connection
+        is not up)
     """
+    # Fixed-period scheduling with jitter monitoring
+    executor = ControlExecutor(gen_config)
+    cooling_lost = threading.Event()
+
+    def on_status_event(event: StatusEvent) -> None:
+        if event.bit == COOLING_TEMPERATURE_BIT and not event.value:
+            cooling_lost.set()
+            executor.wake()
 
-    last_log_time = 0  # Initialize last log time for PEMEL control
+    if modbus_connection.status_detector is not None:
+        modbus_connection.status_detector.subscribe(on_status_event)
 
-    while True:
-        # Call the PEMEL control function and pass the last log time
-        last_log_time = el_control_func(modbus_connection, opcua_connection, last_log_time)
-        time.sleep(control_interval)
+    def control_cycle() -> None:
+        # The safety write only needs Modbus, so that an OPC UA outage does not suppress it
+        # (kept pending while Modbus is down)
+        if cooling_lost.is_set() and wait_up((modbus_connection,), timeout=0):
+            cooling_lost.clear()
+            logging.warning("Hydrogen cooling temperature lost, setting the PEMEL current to 0 A")
+            modbus_connection.write_current(0)
+        # Skipped instead of blocking, so that the cooling check resumes with the next cycle
+        if not wait_up((modbus_connection, opcua_connection), timeout=0):
+            return
+        el_control_func(modbus_connection, opcua_connection)
 
+    executor.run(control_cycle, stop_event=stop_event)
+
+@traced("threads.el_control")
 def el_control_func(
         modbus_connection: ModbusConnection,
-        opcua_connection: OPCUAConnection,
-        last_log_time: float
-    ) -> float:
+        opcua_connection: OPCUAConnection
+    ) -> bool:
     """
         Controls PEMEL via OPCUA and Modbus
+        (Repeated log messages are throttled by the rate limit of the logging pipeline)
         :param opcua_connection: Object with OPCUA connection information
         :param modbus_connection: Object with Modbus connection information
-        :param last_log_time: Timestamp of the last log message
-        :return: Updated timestamp of the last log message
+        :return: True if the set point was written, False otherwise
     """
     try:
         status_one_hot = modbus_connection.read_pemel_status()
@@ -53,82 +89,229 @@ def el_control_func(
         set_h2_flow = opcua_connection.read_node_values(node_type='H2')
         set_h2_flow = list(set_h2_flow.values()) # Extract the value from the dictionary
 
-        current_time = time.time()  # Get the current time
-
         # PEMEL operation is only valid if Hydrogen cooling temperature reached (BIT_10)
         if status_one_hot[10] == 1:
             modbus_connection.write_pemel_current(set_h2_flow[0])
-            # Log only if 10 seconds have passed
-            if current_time - last_log_time >= 10:
-                # logging.info(f"PEMEL control successful: {set_h2_flow[0]} Nl/min")
-                last_log_time = current_time  # Update the last log time
-        else:
-            # Log only if 10 seconds have passed
-            if current_time - last_log_time >= 10:
-                logging.warning("PEMEL control invalid: hydrogen cooling temperature is too high")
-                last_log_time = current_time  # Update the last log time
+            return True
+        logging.warning("PEMEL control invalid: hydrogen cooling temperature is too high")
 
     except Exception as e:
         logging.error("Error in PEMEL control function: %s", e)
 
-    # Return the updated last log time
-    return last_log_time
+    return False
+
+@traced("threads.mirror")
+def mirror_process_values(
+        modbus_connection: ModbusConnection,
+        opcua_connection: OPCUAConnection,
+        pv_values: Sequence[Any]
+    ) -> bool:
+    """
+        Mirrors the PEMEL process values selected in MIRROR_NODES (config_opcua.yaml) to the PLC,
+        so that other tools do not need to poll the PEMEL. The changed values are written in
+        one round trip. Called with each data storage read, so that the mirrored values are
+        updated every DATA_STORAGE_INTERVAL (not with each control cycle).
+        :param modbus_connection: Object with Modbus connection information
+        :param opcua_connection: Object with OPCUA connection information
+        :param pv_values: Process values of the last data storage read (in the order of
+                          PROCESS_VALUES), so that mirroring needs no Modbus request of its own
+        :return: True if the values were mirrored (or none are selected), False otherwise
+    """
+    mirror_nodes = opcua_connection.settings.mirror_nodes
+    if not mirror_nodes:
+        return True
+    try:
+        process_index = modbus_connection.settings.process_index
+        values = {node_id: pv_values[process_index[name]]
+                  for name, node_id in mirror_nodes if name in process_index}
+        return opcua_connection.write_node_values(values)
+    except Exception as e:
+        logging.error("Error in mirroring the process values: %s", e)
+    return False
 
 def data_storage(
-        storage_interval: float,
+        gen_config: dict[str, Any],
         modbus_connection: ModbusConnection,
         opcua_connection: OPCUAConnection,
-        sql_connection: SQLConnection
+        sql_connection: SQLConnection,
+        sinks: Optional[Sequence[Any]] = None,
+        row_buffer: Optional[RowBuffer] = None,
+        stop_event: Optional[threading.Event] = None
     ) -> None:
     """
         Contains the thread function for data transfer via OPCUA and Modbus to SQL
-        :param storage_interval: Data storage interval in [s]
+        :param gen_config: General configuration with the data storage interval
+                           DATA_STORAGE_INTERVAL in [s] (read in every cycle for hot reload)
+        :param sinks: Additional data sinks providing write_row() (e.g. the local archive)
+        :param row_buffer: Preallocated rows, which also keep the rows of failed inserts
+                           (None for a buffer with ROW_BUFFER_SIZE rows)
+        :param stop_event: Event ending the loop (None to run until the process exits)
+        (While the Modbus or OPC UA connection is reconnecting, the thread waits until both are
+        up again. SQL outages are covered by the row buffer)
     """
-    while True:
-        data_trans_func(modbus_connection, opcua_connection, sql_connection)
-        time.sleep(storage_interval)
+    if row_buffer is None:
+        row_buffer = RowBuffer(
+            row_layout(modbus_connection.settings, opcua_connection.settings,
+                       sql_connection.settings),
+            gen_config.get('ROW_BUFFER_SIZE', 8640)
+        )
+    if stop_event is None:
+        stop_event = threading.Event()
+    while not stop_event.is_set():
+        if not wait_up((modbus_connection, opcua_connection), timeout=0):
+            logging.warning("Data storage paused until the Modbus and OPC UA connections are up")
+            while not (wait_up((modbus_connection, opcua_connection), timeout=1)
+                       or stop_event.is_set()):
+                pass
+            continue
+        data_trans_func(modbus_connection, opcua_connection, sql_connection, sinks,
+                        row_buffer=row_buffer)
+        stop_event.wait(gen_config['DATA_STORAGE_INTERVAL'])
 
+@traced("threads.data_transfer")
 def data_trans_func(
         modbus_connection: ModbusConnection,
         opcua_connection: OPCUAConnection,
-        sql_connection: SQLConnection
+        sql_connection: SQLConnection,
+        sinks: Optional[Sequence[Any]] = None,
+        timestamp: Optional[datetime] = None,
+        row_buffer: Optional[RowBuffer] = None
     ) -> None:
     """
         Transfers data via OPCUA and Modbus to SQL
         :param opcua_connection: Object with OPCUA connection information
         :param modbus_connection: Object with Modbus connection information
         :param sql_connection: Object with SQL connection information
+        :param sinks: Additional data sinks providing write_row() (e.g. the local archive)
+        :param timestamp: Timestamp of the row (None for the current time, set for replay)
+        :param row_buffer: Preallocated rows filled in place by the readers. Rows of failed
+                           inserts stay pending and are inserted with the next row.
+                           (None for a single row without buffering)
+        (The process values read are also mirrored to the PLC, see mirror_process_values())
     """
     try:
-        status_one_hot = modbus_connection.read_pemel_status()
-        pemel_values = modbus_connection.read_pemel_process_values()
-        opcua_values = opcua_connection.read_node_values(node_type='AllNodes')
-        opcua_values = list(opcua_values.values()) # Extract the values from the dictionary
+        layout = row_layout(modbus_connection.settings, opcua_connection.settings,
+                            sql_connection.settings)
+        if row_buffer is None:
+            row_buffer = RowBuffer(layout, 1)
+        elif row_buffer.layout != layout:   # Node, register, or status layout reloaded
+            row_buffer.set_layout(layout)
 
-        # Write values into SQL database
-        values = opcua_values + status_one_hot + pemel_values
-        if values is not None:
-            sql_connection.insert_data(values)
+        # The readers write their values directly into the row
+        row = row_buffer.acquire()
+        values = row.values
+        if (modbus_connection.read_pemel_status(values, layout.status, layout.packed) is None
+                or modbus_connection.read_pemel_process_values(values, layout.process) is None
+                or opcua_connection.read_node_values('AllNodes', values, layout.opcua) is None):
+            row_buffer.discard(row)
+            logging.error("Error in data transfer function: incomplete data, row skipped")
+            return
+
+        # Write values into SQL database (with the rows of previously failed inserts)
+        row.stamp(datetime.now() if timestamp is None else timestamp)
+        if timestamp is None:   # Not for replay
+            mirror_process_values(modbus_connection, opcua_connection,
+                                  values[layout.process:layout.width])
+        row_buffer.push(row)
+        pending = row_buffer.snapshot()
+        if sql_connection.insert_rows(pending):
+            row_buffer.release(len(pending))
+        for sink in sinks or ():
+            sink.write_row(row.timestamp, row.fields())
 
         # logging.info("Data transfer successful.")
     except Exception as e:
         logging.error("Error in data transfer function: %s", e)
 
+def data_acquisition(
+        scan_scheduler: ScanScheduler,
+        modbus_connection: ModbusConnection,
+        opcua_connection: OPCUAConnection,
+        sql_connection: SQLConnection,
+        sinks: Optional[Sequence[Any]] = None,
+        stop_event: Optional[threading.Event] = None
+    ) -> None:
+    """
+        Contains the thread function for multi-rate data acquisition with scan groups
+        (replaces data_storage() if SCAN_GROUPS are configured)
+        :param scan_scheduler: Scheduler with the scan groups and their intervals
+        :param sinks: Additional data sinks providing write_row() (e.g. the local archive)
+        :param stop_event: Event ending the loop (None to run until the process exits)
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    while not stop_event.wait(scan_scheduler.time_to_next_tick()):
+        scan_func(scan_scheduler, modbus_connection, opcua_connection, sql_connection, sinks)
+
+@traced("threads.scan")
+def scan_func(
+        scan_scheduler: ScanScheduler,
+        modbus_connection: ModbusConnection,
+        opcua_connection: OPCUAConnection,
+        sql_connection: SQLConnection,
+        sinks: Optional[Sequence[Any]] = None
+    ) -> None:
+    """
+        Reads all scan groups due at the current tick with shared Modbus and OPC UA reads
+        and stores one row per group in its SQL table
+        :param scan_scheduler: Scheduler with the scan groups and their intervals
+        :param opcua_connection: Object with OPCUA connection information
+        :param modbus_connection: Object with Modbus connection information
+        :param sql_connection: Object with SQL connection information
+        :param sinks: Additional data sinks providing write_row(), which receive the rows of
+                      the groups storing DB_COLUMNS into DB_TABLE (the sink layout)
+    """
+    try:
+        groups = scan_scheduler.due_groups()
+        if not groups:
+            return
+
+        # Merged register ranges and one combined OPC UA read for all due groups
+        registers = {}
+        for address, count in scan_scheduler.merge_ranges(groups):
+            values = modbus_connection.read_registers(address, count)
+            if values is not None:
+                registers.update(zip(range(address, address + count), values))
+        node_values = opcua_connection.read_nodes(scan_scheduler.merge_nodes(groups))
+
+        timestamp = datetime.now()
+        settings = sql_connection.settings
+        for group in groups:
+            row = group.build_row(registers, node_values)
+            sql_connection.insert_data(row, timestamp, table=group.table, columns=group.columns,
+                                       timespec=group.timespec)
+            if group.table == settings.table and tuple(group.columns) == settings.columns:
+                for sink in sinks or ():
+                    sink.write_row(timestamp, row)
+    except Exception as e:
+        logging.error("Error in scan group function: %s", e)
+
 def supervisor(
-        reconnection_interval: float,
+        gen_config: dict[str, Any],
         modbus_connection: ModbusConnection,
         opcua_connection: OPCUAConnection,
-        sql_connection: SQLConnection
+        sql_connection: SQLConnection,
+        control_connection: Optional[ModbusConnection] = None,
+        stop_event: Optional[threading.Event] = None
     ) -> None:
     """
         Attempts to reconnect to servers and clients upon connection failure. 
-        :param reconnection_interval: Interval for reconnection
+        :param gen_config: General configuration with the interval for reconnection
+                           RECONNECTION_INTERVAL in [s] (read in every cycle for hot reload)
         :param opcua_connection: Object with OPCUA connection information
         :param modbus_connection: Object with Modbus connection information
         :param sql_connection: Object with SQL connection information
+        :param control_connection: Dedicated Modbus connection for PEMEL control
+        :param stop_event: Event ending the loop (None to run until the process exits)
     """
-    while True:
+    if stop_event is None:
+        stop_event = threading.Event()
+    while not stop_event.is_set():
         try:
+            if control_connection is not None and not control_connection.is_connected():
+                logging.warning("Reconnecting Modbus (PEMEL control)...")
+                control_connection.connect()
+
             if not modbus_connection.is_connected():
                 logging.warning("Reconnecting Modbus...")
                 modbus_connection.connect()
@@ -141,6 +324,6 @@ def supervisor(
                 logging.warning("Reconnecting SQL...")
                 sql_connection.connect()
 
-            time.sleep(reconnection_interval)
+            stop_event.wait(gen_config['RECONNECTION_INTERVAL'])
         except Exception as e:
             logging.error("Error in supervisor function: %s", e)
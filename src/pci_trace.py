@@ -0,0 +1,139 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_trace.py:
+> Implements opt-in tracing of the protocol calls and loop bodies with a local span buffer,
+  exportable as a Chrome trace file (chrome://tracing, Perfetto)
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from typing import Any, Callable, Optional
+from contextlib import nullcontext
+from collections import deque
+
+NULL_SPAN = nullcontext()   # Shared no-op context manager while tracing is disabled
+
+class Span:
+    """ Measures the duration of a traced operation and stores it in the span buffer. """
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = repr(exc)
+        self.tracer.spans.append(
+            (self.name, self.start, end - self.start, threading.get_ident(), self.args)
+        )
+
+class Tracer:
+    """ Collects spans in a bounded buffer (the oldest spans are dropped). """
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans = deque(maxlen=100000)   # (name, start [ns], duration [ns], thread, args)
+
+    def configure(self, enabled: bool, buffer_size: int) -> None:
+        """
+            Switches tracing on or off (also at runtime via the configuration reload).
+            :param enabled: True to record spans
+            :param buffer_size: Maximum number of spans kept in the buffer
+        """
+        if buffer_size != self.spans.maxlen:
+            self.spans = deque(self.spans, maxlen=buffer_size)
+        self.enabled = enabled
+
+    def export_chrome_trace(self, path: str) -> None:
+        """
+            Writes the buffered spans as complete events in the Chrome trace format.
+            :param path: Path of the trace file
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = [
+            {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': start / 1000,
+             'dur': duration / 1000, 'pid': os.getpid(), 'tid': tid, 'args': args}
+            for name, start, duration, tid, args in list(self.spans)
+        ]
+        events.extend(
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+             'args': {'name': thread_names[tid]}}
+            for tid in {event['tid'] for event in events} if tid in thread_names
+        )
+        with open(path + ".tmp", "w", encoding="utf-8") as fptr:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fptr, default=str)
+        os.replace(path + ".tmp", path)
+
+TRACER = Tracer()
+
+def span(name: str, **args: Any) -> Any:
+    """
+        Returns a context manager tracing the enclosed block.
+        :param name: Span name as '<category>.<operation>', e.g. 'modbus.transaction'
+        :param args: Additional attributes of the span
+        :return: Span or a no-op context manager if tracing is disabled
+    """
+    if not TRACER.enabled:
+        return NULL_SPAN
+    return Span(TRACER, name, args)
+
+def traced(name: str) -> Callable:
+    """
+        Decorator tracing each call of a function. (If tracing is disabled, the overhead is
+        one attribute check per call)
+        :param name: Span name as '<category>.<operation>'
+        :return: Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with Span(TRACER, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def configure_tracing(gen_config: dict[str, Any]) -> None:
+    """
+        Applies the tracing settings of the general configuration.
+        :param gen_config: General configuration with TRACE_ENABLED and TRACE_BUFFER_SIZE
+    """
+    TRACER.configure(bool(gen_config.get('TRACE_ENABLED', False)),
+                     gen_config.get('TRACE_BUFFER_SIZE', 100000))
+
+def trace_exporter(
+        gen_config: dict[str, Any],
+        stop_event: Optional[threading.Event] = None
+    ) -> None:
+    """
+        Contains the thread function for writing the span buffer to TRACE_FILE every
+        TRACE_EXPORT_INTERVAL in [s] while tracing is enabled.
+        :param gen_config: General configuration (read in every cycle for hot reload)
+        :param stop_event: Event ending the loop (None to run until the process exits)
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    while not stop_event.wait(gen_config.get('TRACE_EXPORT_INTERVAL', 60)):
+        if TRACER.enabled:
+            try:
+                TRACER.export_chrome_trace(gen_config['TRACE_FILE'])
+            except Exception as e:
+                logging.error("Error exporting the trace file: %s", e)
@@ -0,0 +1,238 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_transport.py:
+> Implements the transports of the Modbus connection (TCP, RTU over TCP, and serial RTU) and the
+  gateway multiplexer sharing one transport between several slaves, e.g. electrolyzers behind
+  one RTU gateway, with round-robin scheduling of their requests
+----------------------------------------------------------------------------------------------------
+"""
+
+import asyncio
+import threading
+from typing import Any, Hashable
+from collections import deque
+from contextlib import contextmanager
+
+TRANSPORTS = ('tcp', 'rtu_over_tcp', 'serial')
+
+def ensure_event_loop() -> None:
+    """
+        Sets an event loop for the calling thread if it has none. The synchronous clients of
+        pymodbus 3.8 create an asyncio future in their constructor, which fails in threads
+        without an event loop (e.g. the concurrent connects at startup and the reconnect workers).
+    """
+    policy = asyncio.get_event_loop_policy()
+    try:
+        policy.get_event_loop()
+    except RuntimeError:
+        policy.set_event_loop(policy.new_event_loop())
+
+def create_client(modbus_config: dict[str, Any]) -> Any:
+    """
+        Creates the pymodbus client of the configured transport.
+        :param modbus_config: Modbus configuration with TRANSPORT ('tcp' if missing), TIMEOUT,
+                              IP_ADDRESS and PORT (TCP transports) or SERIAL (serial transport)
+        :return: Modbus client (not connected)
+    """
+    # Imported on first use, so that deployments without Modbus do not load pymodbus
+    # pylint: disable=import-outside-toplevel
+    from pymodbus import FramerType
+    from pymodbus.client import ModbusTcpClient, ModbusSerialClient
+
+    ensure_event_loop()
+    transport = modbus_config.get('TRANSPORT', 'tcp')
+    # No internal retries of pymodbus (3 by default), the requests are retried by
+    # ModbusConnection with MAX_RETRIES (one attempt with the CONTROL_CONNECTION profile)
+    if transport == 'tcp':
+        return ModbusTcpClient(modbus_config['IP_ADDRESS'], port=modbus_config['PORT'],
+                               timeout=modbus_config['TIMEOUT'], retries=0)
+    if transport == 'rtu_over_tcp':
+        return ModbusTcpClient(modbus_config['IP_ADDRESS'], port=modbus_config['PORT'],
+                               framer=FramerType.RTU, timeout=modbus_config['TIMEOUT'],
+                               retries=0)
+    if transport == 'serial':
+        serial_config = modbus_config['SERIAL']
+        return ModbusSerialClient(
+            serial_config['PORT'],
+            baudrate=serial_config.get('BAUDRATE', 19200),
+            bytesize=serial_config.get('BYTESIZE', 8),
+            parity=serial_config.get('PARITY', 'N'),
+            stopbits=serial_config.get('STOPBITS', 1),
+            timeout=modbus_config['TIMEOUT'],
+            retries=0
+        )
+    raise ValueError(f"Invalid Modbus TRANSPORT '{transport}', must be one of {TRANSPORTS}")
+
+def endpoint(modbus_config: dict[str, Any]) -> tuple:
+    """
+        :param modbus_config: Modbus configuration
+        :return: Key of the device or gateway addressed by the transport
+    """
+    transport = modbus_config.get('TRANSPORT', 'tcp')
+    if transport == 'serial':
+        return (transport, modbus_config['SERIAL']['PORT'])
+    return (transport, modbus_config['IP_ADDRESS'], modbus_config['PORT'])
+
+class RoundRobinScheduler:
+    """ Serializes the requests of several slaves and grants the turns round-robin. """
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.waiting = {}           # Waiting requests (tokens) by slave in arrival order
+        self.rotation = deque()     # Slaves with waiting requests, next turn first
+        self.busy = False
+
+    def _next(self) -> object:
+        return self.waiting[self.rotation[0]][0] if self.rotation else None
+
+    @contextmanager
+    def turn(self, slave: Hashable):
+        """
+            Waits for the turn of a request, so that a slave with many requests (e.g. a slow
+            device with retries) cannot starve the other slaves of the gateway.
+            :param slave: Queue of the request (the channel, so that several connections to
+                          the same slave also take turns)
+        """
+        token = object()
+        with self.condition:
+            self.waiting.setdefault(slave, deque()).append(token)
+            if slave not in self.rotation:
+                self.rotation.append(slave)
+            self.condition.wait_for(lambda: not self.busy and self._next() is token)
+            self.busy = True
+            self.rotation.popleft()
+            self.waiting[slave].popleft()
+            if self.waiting[slave]:
+                self.rotation.append(slave)     # Next request of this slave after the others
+            else:
+                del self.waiting[slave]     # Channels are replaced on reconnects
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+class GatewayMultiplexer:
+    """ One transport shared by the Modbus connections of several slaves. """
+    def __init__(self, modbus_config: dict[str, Any]) -> None:
+        """
+            :param modbus_config: Modbus configuration of the first connection (transport
+                                  settings of the gateway)
+        """
+        self.modbus_config = modbus_config
+        self.client = None
+        self.scheduler = RoundRobinScheduler()
+        self.lock = threading.Lock()
+        self.channels = 0   # Number of open channels (the transport is closed with the last)
+
+    def connect(self) -> bool:
+        """
+            Connects the shared transport if it is not open yet. (In a turn of its own, so that
+            the client is not replaced during a request of another slave)
+            :return: True if connected, False otherwise
+        """
+        with self.scheduler.turn(self), self.lock:
+            if self.client is not None and self.client.is_socket_open():
+                return True
+            if self.client is not None:
+                self.client.close()
+            self.client = create_client(self.modbus_config)
+            return bool(self.client.connect())
+
+    def channel(self, slave_id: int, timeout: float) -> "GatewayChannel":
+        """
+            :param slave_id: Slave ID of the device
+            :param timeout: Timeout of the requests of this slave in [s]
+            :return: Client of one slave on the shared transport
+        """
+        with self.lock:
+            self.channels += 1
+        return GatewayChannel(self, slave_id, timeout)
+
+    def release(self) -> None:
+        """
+            Closes a channel and the transport if no channel is left.
+        """
+        with self.scheduler.turn(self), self.lock:
+            self.channels = max(self.channels - 1, 0)
+            if self.channels == 0 and self.client is not None:
+                self.client.close()
+                self.client = None
+
+    def set_timeout(self, client: Any, timeout: float) -> None:
+        """
+            Sets the receive timeout of the connected client for the next request.
+            :param client: Connected pymodbus client
+            :param timeout: Timeout of the request in [s]
+        """
+        client.comm_params.timeout_connect = timeout    # Read by the TCP client on each receive
+        if self.modbus_config.get('TRANSPORT', 'tcp') == 'serial' and client.socket is not None:
+            client.socket.timeout = timeout     # Timeout of the open serial port (pyserial)
+
+    def execute(self, channel: "GatewayChannel", method: str, *args, **kwargs) -> Any:
+        """
+            Executes a request in the turn of its channel with the timeout of the channel.
+            :param channel: Channel of the request (connection to one slave)
+            :param method: Name of the client method, e.g. 'read_holding_registers'
+            :return: Response of the client
+        """
+        with self.scheduler.turn(channel):
+            client = self.client
+            if client is None:
+                raise ConnectionError("Modbus gateway is not connected")
+            self.set_timeout(client, channel.timeout)
+            return getattr(client, method)(*args, **kwargs)
+
+class GatewayChannel:
+    """ Client of one slave with the interface of the pymodbus client used by ModbusConnection. """
+    def __init__(self, gateway: GatewayMultiplexer, slave_id: int, timeout: float) -> None:
+        self.gateway = gateway
+        self.slave_id = slave_id
+        self.timeout = timeout
+        self.closed = False
+
+    def connect(self) -> bool:
+        """ Connects the shared transport (if not connected by another slave yet). """
+        return self.gateway.connect()
+
+    def is_socket_open(self) -> bool:
+        """ Tests the shared transport. """
+        client = self.gateway.client
+        return not self.closed and client is not None and client.is_socket_open()
+
+    def close(self) -> None:
+        """ Closes the channel (the transport stays open for the other slaves). """
+        if not self.closed:
+            self.closed = True
+            self.gateway.release()
+
+    def read_holding_registers(self, *args, **kwargs) -> Any:
+        """ Reads holding registers in the turn of the channel. """
+        return self.gateway.execute(self, 'read_holding_registers', *args, **kwargs)
+
+    def write_register(self, *args, **kwargs) -> Any:
+        """ Writes a holding register in the turn of the channel. """
+        return self.gateway.execute(self, 'write_register', *args, **kwargs)
+
+    def write_registers(self, *args, **kwargs) -> Any:
+        """ Writes holding registers in the turn of the channel. """
+        return self.gateway.execute(self, 'write_registers', *args, **kwargs)
+
+GATEWAYS = {}           # Shared gateway multiplexers by endpoint
+GATEWAYS_LOCK = threading.Lock()
+
+def get_gateway(modbus_config: dict[str, Any]) -> GatewayMultiplexer:
+    """
+        Returns the multiplexer of the gateway addressed by the configuration (shared by all
+        connections with the same endpoint).
+        :param modbus_config: Modbus configuration
+        :return: Gateway multiplexer
+    """
+    key = endpoint(modbus_config)
+    with GATEWAYS_LOCK:
+        if key not in GATEWAYS:
+            GATEWAYS[key] = GatewayMultiplexer(modbus_config)
+        return GATEWAYS[key]
@@ -0,0 +1,84 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_write.py:
+> Implements the write planner of the Modbus set points: queued set points are coalesced into
+  as few write requests as possible (one per contiguous register range)
+----------------------------------------------------------------------------------------------------
+"""
+
+import threading
+from typing import Any
+
+MAX_WRITE_COUNT = 123   # Maximum number of holding registers per Modbus write request (FC 16)
+CURRENT_SET_POINT = 'EL_CURRENT'    # Set point at WRITE_REGISTER (PEMEL current in [A])
+
+def set_point_addresses(modbus_config: dict[str, Any]) -> dict[str, int]:
+    """
+        Collects the register addresses of the set points declared in the Modbus configuration.
+        :param modbus_config: Modbus configuration with WRITE_REGISTER and SET_POINTS
+        :return: Register addresses by set point name (EL_CURRENT at WRITE_REGISTER)
+    """
+    addresses = {CURRENT_SET_POINT: modbus_config['WRITE_REGISTER']}
+    addresses.update(modbus_config.get('SET_POINTS') or {})
+    return addresses
+
+class WritePlanner:
+    """ Queues set points and plans the write requests of the next flush. """
+    def __init__(self, addresses: dict[str, int]) -> None:
+        """
+            :param addresses: Register addresses by set point name (see set_point_addresses())
+        """
+        self.addresses = addresses
+        self.pending = {}   # Queued register values by address (the last value wins)
+        self.lock = threading.Lock()
+
+    def set_addresses(self, addresses: dict[str, int]) -> None:
+        """
+            Replaces the set point addresses (e.g. after a configuration reload). Queued
+            values are kept, since they are stored by address.
+            :param addresses: Register addresses by set point name
+        """
+        self.addresses = addresses
+
+    def queue(self, name: str, value: int) -> None:
+        """
+            Queues a set point for the next flush (replaces a queued value of the same set point).
+            :param name: Name of the set point (key of SET_POINTS or EL_CURRENT)
+            :param value: Register value
+        """
+        if name not in self.addresses:
+            raise KeyError(f"Unknown set point '{name}', add it to SET_POINTS in "
+                           "config_modbus.yaml")
+        with self.lock:
+            self.pending[self.addresses[name]] = int(value)
+
+    def requeue(self, address: int, values: list[int]) -> None:
+        """
+            Queues the values of a failed write request again, unless newer values have been
+            queued for the same registers in the meantime.
+            :param address: Start address of the request
+            :param values: Register values of the request
+        """
+        with self.lock:
+            for i, value in enumerate(values):
+                self.pending.setdefault(address + i, value)
+
+    def plan(self) -> list[tuple[int, list[int]]]:
+        """
+            Takes the queued set points and merges the contiguous registers into write requests.
+            :return: List of the requests as (start address, register values)
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        requests = []
+        for address in sorted(pending):
+            if requests:
+                start, values = requests[-1]
+                if address == start + len(values) and len(values) < MAX_WRITE_COUNT:
+                    values.append(pending[address])
+                    continue
+            requests.append((address, [pending[address]]))
+        return requests
@@ -8,12 +8,13 @@ conftest.py:
 ----------------------------------------------------------------------------------------------------
 """
 
+import threading
 from pathlib import Path
 from unittest.mock import MagicMock
 
 import pytest
 
-from src import pci_modbus, pci_opcua, pci_sql
+from src import pci_modbus, pci_opcua, pci_sql, pci_archive, pci_write
 
 @pytest.fixture
 def mock_modbus_config(tmp_path: Path) -> dict:
@@ -33,6 +34,7 @@ def mock_modbus_config(tmp_path: Path) -> dict:
         'WRITE_REGISTER': 0x8006,
         'MAX_RETRIES': 2,
         'RETRY_INTERVAL': 0,
+        'TIMEOUT': 3,
         'MAX_CURRENT': 52,
         'MIN_CURRENT': 8,
         'H2_FLOW_ARRAY': str(tmp_path / "PEMEL_Current_H2Flowrate.txt"),
@@ -66,6 +68,9 @@ def mock_sql_config() -> dict:
         'DB_PORT': 5432,
         'DB_TABLE': 'table',
         'DB_COLUMNS': ['timestamp', 'val1', 'val2'],
+        'POOL_SIZE': 2,
+        'POOL_PROBE_AFTER_IDLE': 30,
+        'POOL_CHECKOUT_TIMEOUT': 1,
     }
 
 @pytest.fixture
@@ -80,7 +85,15 @@ def mock_modbus_connection(
     """
     from src import pci_modbus
     conn = pci_modbus.ModbusConnection.__new__(pci_modbus.ModbusConnection)
+    conn.control = False
+    conn.status_detector = None
+    conn.health = None
+    conn.stop_event = None
+    conn.write_planner = pci_write.WritePlanner(pci_write.set_point_addresses(mock_modbus_config))
+    conn.h2_curve = None
+    conn.h2_curve_key = None
     conn.modbus_config = mock_modbus_config
+    conn.settings = pci_modbus.compile_modbus_config(mock_modbus_config)
     conn.client = MagicMock()
     conn.connected = True
     return conn
@@ -98,7 +111,13 @@ def mock_opcua_connection(
     from src import pci_opcua
     conn = pci_opcua.OPCUAConnection.__new__(pci_opcua.OPCUAConnection)
     conn.opcua_config = mock_opcua_config
+    conn.settings = pci_opcua.compile_opcua_config(mock_opcua_config)
     conn.client = MagicMock()
+    conn.node_cache = {}
+    conn.variant_types = {}
+    conn.written = {}
+    conn.alive = True
+    conn.health = None
     return conn
 
 @pytest.fixture
@@ -114,5 +133,43 @@ def mock_sql_connection(
     from src import pci_sql
     conn = pci_sql.SQLConnection.__new__(pci_sql.SQLConnection)
     conn.sql_config = mock_sql_config
-    conn.connection = MagicMock()
+    conn.settings = pci_sql.compile_sql_config(mock_sql_config)
+    conn.status_bit_names = None
+    # Pool handing out one mocked database connection
+    conn.pool = pci_sql.SQLConnectionPool(
+        MagicMock(return_value=MagicMock()),
+        size=mock_sql_config['POOL_SIZE'],
+        probe_after_idle=mock_sql_config['POOL_PROBE_AFTER_IDLE'],
+        checkout_timeout=mock_sql_config['POOL_CHECKOUT_TIMEOUT']
+    )
+    conn.queries = {}
+    conn.alive = True
+    conn.health = None
+    conn.network_errors = (OSError, pci_sql.SQLConnectionLost)
     return conn
+
+@pytest.fixture
+def mock_archive_writer(tmp_path: Path) -> pci_archive.ArchiveWriter:
+    """
+    Provide an ArchiveWriter object writing to a temporary directory.
+    :param tmp_path: pytest fixture for temporary directory
+    :return: ArchiveWriter instance with mock configuration
+    """
+    writer = pci_archive.ArchiveWriter.__new__(pci_archive.ArchiveWriter)
+    writer.archive_config = {
+        'ARCHIVE_ENABLED': True,
+        'ARCHIVE_DIR': str(tmp_path / "archive"),
+        'ROTATION': 'hourly',
+        'BATCH_SIZE': 2,
+        'COMPRESSION': 'zstd',
+        'DICTIONARY_COLUMNS': ['error'],
+        'DELTA_COLUMNS': ['el_power_act'],
+    }
+    writer.columns = ['timestamp', 'real_temperature', 'error', 'el_power_act']
+    writer.schema = writer.build_schema()
+    writer.buffer = [[] for _ in writer.columns]
+    writer.period = None
+    writer.file_counter = 0
+    writer.file_range = None
+    writer.lock = threading.Lock()
+    return writer
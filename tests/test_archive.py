@@ -0,0 +1,87 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_archive.py: 
+> Tests the local columnar archive (Parquet files and time range index)
+----------------------------------------------------------------------------------------------------
+"""
+
+import os
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from src.pci_archive import TEMP_SUFFIX, load_index, read_archive
+
+def test_write_row_rotates_hourly(mock_archive_writer: "pci_archive.ArchiveWriter") -> None:
+    """
+    Test that each record batch is written to a Parquet file of its hour and indexed by time
+    range.
+    :param mock_archive_writer: Fixture providing an ArchiveWriter instance
+    """
+    for minute in (0, 20, 40):
+        mock_archive_writer.write_row(datetime(2025, 1, 1, 13, minute), [20.5, 1, 1000])
+    mock_archive_writer.write_row(datetime(2025, 1, 1, 14, 5), [21.0, 0, 1200])
+    mock_archive_writer.close()
+
+    archive_dir = mock_archive_writer.archive_config['ARCHIVE_DIR']
+    index = load_index(archive_dir)
+    assert [entry['file'] for entry in index] == ['pycomint_20250101_13.parquet',
+                                                  'pycomint_20250101_13_1.parquet',
+                                                  'pycomint_20250101_14.parquet']
+    assert [entry['rows'] for entry in index] == [2, 1, 1]     # BATCH_SIZE of 2 rows
+    assert index[1]['end'] == datetime(2025, 1, 1, 13, 40).isoformat()
+
+    parquet_file = pq.ParquetFile(os.path.join(archive_dir, index[0]['file']))
+    assert parquet_file.metadata.num_row_groups == 1
+    assert str(parquet_file.schema_arrow.field('error').type) == 'int8'
+
+def test_read_archive_time_range(mock_archive_writer: "pci_archive.ArchiveWriter") -> None:
+    """
+    Test reading a time range from the archive.
+    :param mock_archive_writer: Fixture providing an ArchiveWriter instance
+    """
+    for hour in (10, 11, 12):
+        mock_archive_writer.write_row(datetime(2025, 1, 1, hour, 30), [float(hour), 0, hour])
+    mock_archive_writer.close()
+
+    table = read_archive(mock_archive_writer.archive_config['ARCHIVE_DIR'],
+                         start=datetime(2025, 1, 1, 11), end=datetime(2025, 1, 1, 12))
+    assert table.column('real_temperature').to_pylist() == [11.0]
+    assert read_archive(mock_archive_writer.archive_config['ARCHIVE_DIR'],
+                        start=datetime(2026, 1, 1)) is None
+
+def test_invalid_values_and_unfinished_files(
+        mock_archive_writer: "pci_archive.ArchiveWriter"
+    ) -> None:
+    """
+    Test that invalid values are archived as null without blocking the following batches, that
+    a full batch is readable without closing the archive, and that a killed process leaves
+    neither an unfinished file nor a closed file missing in the index.
+    :param mock_archive_writer: Fixture providing an ArchiveWriter instance
+    """
+    archive_dir = mock_archive_writer.archive_config['ARCHIVE_DIR']
+    mock_archive_writer.write_row(datetime(2025, 1, 1, 13, 0), ['n/a', 1, 1000])
+    mock_archive_writer.write_row(datetime(2025, 1, 1, 13, 10), [20.5, 1, 2 ** 40])
+    assert sorted(os.listdir(archive_dir)) == ['index.json', 'pycomint_20250101_13.parquet']
+    assert read_archive(archive_dir).num_rows == 2
+    mock_archive_writer.write_row(datetime(2025, 1, 1, 13, 20), [21.0, 0, 1200])
+    mock_archive_writer.close()
+
+    table = read_archive(archive_dir)
+    assert table.column('real_temperature').to_pylist() == [None, 20.5, 21.0]
+    assert table.column('el_power_act').to_pylist() == [1000, None, 1200]
+
+    # Killed process: unfinished file of the next hour, closed file missing in the index
+    unfinished = os.path.join(archive_dir, 'pycomint_20250101_14.parquet' + TEMP_SUFFIX)
+    with open(unfinished, "wb") as fptr:
+        fptr.write(b"PAR1")
+    os.replace(os.path.join(archive_dir, 'pycomint_20250101_13_1.parquet'),
+               os.path.join(archive_dir, 'pycomint_20250101_15.parquet'))
+    os.remove(os.path.join(archive_dir, 'index.json'))
+    mock_archive_writer.recover_index()
+    assert sorted(os.listdir(archive_dir)) == ['index.json', 'pycomint_20250101_13.parquet',
+                                               'pycomint_20250101_15.parquet']
+    assert [entry['rows'] for entry in load_index(archive_dir)] == [2, 1]
@@ -0,0 +1,90 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_config.py:
+> Tests the validation and compilation of the configuration files
+----------------------------------------------------------------------------------------------------
+"""
+
+from pathlib import Path
+
+import yaml
+import pytest
+
+from src.pci_config import (CONFIG_FILES, load_configs, check_configs, compile_modbus_config,
+                            compile_opcua_config, compile_sql_config)
+
+def test_load_configs_compiles_settings(tmp_path: Path) -> None:
+    """
+    Test that the shipped configuration files compile into settings with the register
+    addresses on the wire, and that a DB_COLUMNS mismatch stops the startup.
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    configs = load_configs()
+    modbus = compile_modbus_config(configs['modbus'])
+    assert modbus.status_address == 0x8061 and modbus.process_count == 14
+    assert modbus.process_index['EL_CalcH2Flow_Act'] == 6
+    assert compile_opcua_config(configs['opcua']).h2_flow_ids == (
+        'ns=7;s=::AsGlobalPV:real_h2_flowrate',)
+    assert compile_sql_config(configs['sql']).column_index['timestamp'] == 0
+    with pytest.raises(AttributeError):
+        modbus.slave_id = 2     # Frozen
+    pool_keys = ('POOL_SIZE', 'POOL_PROBE_AFTER_IDLE', 'POOL_CHECKOUT_TIMEOUT')
+    compile_sql_config({k: v for k, v in configs['sql'].items() if k not in pool_keys})
+    with pytest.raises(ValueError, match="POOL_SIZE"):
+        compile_sql_config(dict(configs['sql'], POOL_SIZE=1.5))
+
+    with open(CONFIG_FILES['sql'], "r", encoding="utf-8") as env_file:
+        sql_config = yaml.safe_load(env_file)
+    sql_config['DB_COLUMNS'] = sql_config['DB_COLUMNS'][:-1]
+    (tmp_path / "config_sql.yaml").write_text(yaml.safe_dump(sql_config), encoding="utf-8")
+    with pytest.raises(ValueError, match="33 DB_COLUMNS do not match"):
+        load_configs(dict(CONFIG_FILES, sql=str(tmp_path / "config_sql.yaml")))
+
+def test_invalid_modbus_config_rejected(
+        mock_modbus_config: dict,
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that invalid Modbus settings are rejected and a reload keeps the previous settings.
+    :param mock_modbus_config: Fixture providing mock Modbus config
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    assert compile_modbus_config(dict(mock_modbus_config, BASE_REGISTER_OFFSET=0x8000)
+                                 ).status_address == 0x61
+    with pytest.raises(ValueError, match="out of range"):
+        compile_modbus_config(dict(mock_modbus_config, BASE_REGISTER_OFFSET=0x8062))
+    with pytest.raises(ValueError, match="MIN_CURRENT"):
+        compile_modbus_config(dict(mock_modbus_config, MIN_CURRENT=60))
+
+    settings = mock_modbus_connection.settings
+    with pytest.raises(ValueError, match="COUNT"):
+        mock_modbus_connection.reload_config(
+            dict(mock_modbus_config, PROCESS_VALUES={'ADDRESS': 0x8065, 'COUNT': 200}))
+    assert mock_modbus_connection.settings is settings
+
+def test_settings_follow_the_configuration(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that the settings are compiled once per configuration and recompiled by a reload, and
+    that a reloaded file must match the other files.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    settings = mock_modbus_connection.settings
+    assert mock_modbus_connection.settings is settings     # Compiled once
+    mock_modbus_connection.reload_config(
+        dict(mock_modbus_connection.modbus_config, PROCESS_VALUES={'ADDRESS': 0x8065, 'COUNT': 5}))
+    assert mock_modbus_connection.settings is not settings
+    assert mock_modbus_connection.settings.process_count == 5
+
+    configs = load_configs()
+    configs['modbus'] = dict(configs['modbus'], PROCESS_VALUES={'ADDRESS': 0x8062, 'COUNT': 15})
+    with pytest.raises(ValueError, match="DB_COLUMNS do not match"):
+        check_configs(configs)
+    configs = load_configs()
+    configs['gen']['SHUTDOWN_TIMEOUT'] = 2
+    with pytest.raises(ValueError, match="TIMEOUT must be below SHUTDOWN_TIMEOUT"):
+        check_configs(configs)
@@ -0,0 +1,91 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_control.py: 
+> Tests the fixed-period executor of the PEMEL control loop and its jitter monitoring
+----------------------------------------------------------------------------------------------------
+"""
+
+import pytest
+
+from src.pci_control import ControlExecutor
+
+class FakeClock:
+    """
+    Clock of the executor advanced by the waits and the cycles instead of the wall clock.
+    """
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.starts = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def wait(self, delay: float) -> bool:
+        self.now += delay
+        return False    # Not woken up
+
+    def clear(self) -> None:
+        pass
+
+    def cycle(self, duration: float) -> "Callable[[], None]":
+        """
+        :param duration: Duration of the cycle in [s]
+        :return: Cycle function recording its start time
+        """
+        def run() -> None:
+            self.starts.append(self.now)
+            self.now += duration
+        return run
+
+def test_control_executor_fixed_period() -> None:
+    """
+    Test that the executor keeps the period despite the cycle duration and records the jitter.
+    """
+    clock = FakeClock()
+    executor = ControlExecutor({'PEMEL_CONTROL_INTERVAL': 0.05, 'JITTER_REPORT_INTERVAL': 60},
+                               clock=clock)
+    executor.wake_event = clock
+    executor.run(clock.cycle(0.01), cycles=10)
+
+    assert clock.starts == pytest.approx([0.05 * i for i in range(10)]), \
+        "Cycle durations must not add to the interval!"
+    assert len(executor.jitter) == 9 and max(executor.jitter) == pytest.approx(0)
+    assert executor.overruns == 0
+
+def test_control_executor_overrun_and_percentiles() -> None:
+    """
+    Test that cycles exceeding the interval are counted, that their late starts are recorded
+    as jitter, and that the percentiles are computed.
+    """
+    clock = FakeClock()
+    executor = ControlExecutor({'PEMEL_CONTROL_INTERVAL': 0.001, 'JITTER_REPORT_INTERVAL': 0},
+                               clock=clock)
+    executor.wake_event = clock
+    executor.run(clock.cycle(0.005), cycles=3)
+    assert executor.overruns == 3
+    assert list(executor.jitter) == pytest.approx([4.0, 4.0])   # 5 ms instead of 1 ms
+
+    stats = ControlExecutor.percentiles([float(i) for i in range(1, 101)])
+    assert stats == {'p50': 51.0, 'p95': 95.0, 'p99': 99.0, 'max': 100.0}
+
+def test_control_executor_survives_failed_cycle() -> None:
+    """
+    Test that an exception in a cycle is logged without ending the schedule, also without a
+    JITTER_REPORT_INTERVAL in the configuration.
+    """
+    clock = FakeClock()
+    executor = ControlExecutor({'PEMEL_CONTROL_INTERVAL': 0.05}, clock=clock)
+    executor.wake_event = clock
+    run = clock.cycle(0.01)
+
+    def cycle() -> None:
+        run()
+        if len(clock.starts) == 2:
+            raise ConnectionError("Lost")
+    executor.run(cycle, cycles=4)
+
+    assert clock.starts == pytest.approx([0.05 * i for i in range(4)])
+    assert len(executor.durations) == 4
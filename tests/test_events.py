@@ -0,0 +1,93 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_events.py: 
+> Tests the edge-triggered status change events
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.pci_events import StatusChangeDetector, EventWriter
+from src.pci_control import ControlExecutor
+
+def test_detector_emits_flipped_bits(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that only the flipped bits of the status words read by the Modbus connection are emitted.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    detector = StatusChangeDetector([f"bit_{i}" for i in range(16)])
+    subscriber = MagicMock()
+    detector.subscribe(subscriber)
+    mock_modbus_connection.status_detector = detector
+    responses = [MagicMock(registers=[word]) for word in (0x0410, 0x0410, 0x0011)]
+    for response in responses:
+        response.isError.return_value = False
+    mock_modbus_connection.client.read_holding_registers.side_effect = responses
+
+    for _ in responses:
+        mock_modbus_connection.read_pemel_status()
+
+    events = [call.args[0] for call in subscriber.call_args_list]
+    assert [(event.bit, event.value) for event in events] == [(0, 1), (10, 0)]
+    assert events[0].timestamp == events[1].timestamp
+
+def test_control_executor_wakes_on_event() -> None:
+    """
+    Test that a woken control executor runs the next cycle without waiting for its deadline.
+    """
+    executor = ControlExecutor({'PEMEL_CONTROL_INTERVAL': 10, 'JITTER_REPORT_INTERVAL': 60})
+    threading.Timer(0.05, executor.wake).start()
+    start = time.monotonic()
+    executor.run(lambda: None, cycles=2)
+    assert time.monotonic() - start < 1.0
+
+def test_event_writer_keeps_events_while_sql_is_down(
+        mock_sql_connection: "pci_sql.SQLConnection",
+        caplog: pytest.LogCaptureFixture
+    ) -> None:
+    """
+    Test that the events are logged at INFO level (not rate-limited), stay queued while the
+    SQL connection is lost and are written once it is up again, and that the queue drops the
+    events beyond its capacity.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    :param caplog: pytest fixture for capturing log records
+    """
+    writer = EventWriter(mock_sql_connection, 'pemel_events',
+                         ['timestamp', 'bit', 'name', 'value'], capacity=3)
+    stored = []
+    mock_sql_connection.insert_rows = MagicMock(
+        side_effect=lambda rows, **kwargs: mock_sql_connection.alive and not stored.extend(rows))
+    mock_sql_connection.alive = False
+    timestamp = datetime(2025, 1, 1)
+    detector = StatusChangeDetector([f"bit_{i}" for i in range(16)])
+    detector.subscribe(writer)
+    with caplog.at_level(logging.INFO):
+        detector.update(0x0000, timestamp)
+        detector.update(0x000f, timestamp)
+    assert [record.levelno for record in caplog.records
+            if record.getMessage().startswith("PEMEL status changed")] == [logging.INFO] * 4
+    assert writer.dropped == 1
+    assert "Status event queue full" in caplog.text
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=writer.run, args=(stop_event,))
+    thread.start()
+    time.sleep(0.2)
+    assert not stored and mock_sql_connection.insert_rows.called
+    mock_sql_connection.alive = True
+    stop_event.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert [row.values for row in stored] == [['2025-01-01 00:00:00', bit, f"bit_{bit}", 1]
+                                              for bit in range(3)]
@@ -0,0 +1,128 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_health.py:
+> Tests the event-driven connection supervision with per-connection reconnect workers
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+import threading
+from unittest.mock import MagicMock
+
+from src.pci_health import Supervisor, wait_up, UP, DOWN
+from src.pci_events import StatusChangeDetector
+from src.pci_threads import pemel_control
+
+def test_failure_triggers_immediate_reconnect(
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test that a connection failure on the hot path wakes the reconnect worker without waiting
+    for the periodic check, that waiting threads resume once the connection is up again, and
+    that a reloaded server address is reconnected by the worker.
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    conn = mock_opcua_connection
+    conn.is_connected = lambda: conn.alive
+    conn.connect = MagicMock(side_effect=lambda: setattr(conn, 'alive', True))
+    stop_event = threading.Event()
+    supervisor = Supervisor({'RECONNECTION_INTERVAL': 60}, {'OPC UA': conn}, stop_event)
+    supervisor.start()
+    try:
+        assert wait_up([conn], timeout=1)
+
+        conn.client.get_node.return_value.get_value.side_effect = ConnectionResetError("Reset")
+        conn.read_node_values('AllNodes')
+
+        start = time.monotonic()
+        assert wait_up([conn], timeout=1)
+        assert time.monotonic() - start < 1
+        assert conn.connect.call_count == 1
+        assert supervisor.states() == {'OPC UA': UP}
+
+        # A server change is reconnected by the worker, not by the config watcher thread
+        conn.reload_config(dict(conn.opcua_config, URL='opc.tcp://10.0.6.66:4840'))
+        deadline = time.monotonic() + 1
+        while conn.connect.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert conn.connect.call_count == 2
+    finally:
+        stop_event.set()
+        supervisor.stop()
+        supervisor.join(2)
+
+def test_reconnect_backoff_and_independent_workers() -> None:
+    """
+    Test that a blocking reconnect of one connection does not delay the others and that
+    failed reconnects are retried with an increasing backoff.
+    """
+    blocked = threading.Event()
+    slow = MagicMock()
+    slow.is_connected.return_value = False
+    slow.connect.side_effect = lambda: blocked.wait(2)
+    failing = MagicMock()
+    failing.is_connected.return_value = False
+    attempts = []
+    failing.connect.side_effect = lambda: attempts.append(time.monotonic())
+    fast = MagicMock()
+    fast.is_connected.return_value = True
+
+    gen_config = {'RECONNECTION_INTERVAL': 60, 'RECONNECTION_BACKOFF_MIN': 0.05,
+                  'RECONNECTION_BACKOFF_MAX': 0.2}
+    stop_event = threading.Event()
+    supervisor = Supervisor(gen_config, {'Modbus': slow, 'SQL': failing, 'OPC UA': fast},
+                            stop_event)
+    supervisor.start()
+    try:
+        assert wait_up([fast], timeout=0.5)
+        assert not wait_up([slow, fast], timeout=0.1)
+        time.sleep(0.6)
+        blocked.set()
+
+        assert supervisor.states()['SQL'] == DOWN
+        gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+        assert len(gaps) >= 2
+        assert gaps[1] > gaps[0]
+        assert max(gaps) < 0.35
+    finally:
+        stop_event.set()
+        supervisor.stop()
+        supervisor.join(2)
+        assert not any(thread.is_alive() for thread in supervisor.threads)
+
+def test_cooling_loss_written_during_opcua_outage(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test that the loss of the hydrogen cooling temperature sets the current to 0 A while the
+    OPC UA connection is down, and that the control cycle itself is skipped.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    condition = threading.Condition()
+    mock_modbus_connection.health = MagicMock(state=UP, condition=condition)
+    mock_opcua_connection.health = MagicMock(state=DOWN, condition=condition)
+    mock_modbus_connection.status_detector = StatusChangeDetector([f"bit_{i}" for i in range(16)])
+    mock_modbus_connection.status_detector.update(0x0400)
+    written = threading.Event()
+    mock_modbus_connection.write_current = MagicMock(side_effect=lambda _: written.set())
+    mock_modbus_connection.read_pemel_status = MagicMock()
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=pemel_control, args=(
+        {'PEMEL_CONTROL_INTERVAL': 0.2, 'JITTER_REPORT_INTERVAL': 60}, mock_modbus_connection,
+        mock_opcua_connection), kwargs={'stop_event': stop_event}, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.1)
+        mock_modbus_connection.status_detector.update(0x0000)   # Cooling temperature lost
+        assert written.wait(1)
+        mock_modbus_connection.write_current.assert_called_once_with(0)
+        assert not mock_modbus_connection.read_pemel_status.called
+    finally:
+        stop_event.set()
+        thread.join(2)
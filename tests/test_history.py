@@ -0,0 +1,135 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_history.py:
+> Tests the in-memory history of the recent process data and its HTTP/JSON API
+----------------------------------------------------------------------------------------------------
+"""
+
+import json
+import math
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import pci_history
+from src.pci_history import HistoryBuffer, HistoryServer
+
+START = datetime(2025, 1, 1, 12, 0)
+
+def test_ring_buffer_window_and_range() -> None:
+    """
+    Test that the history drops the rows outside the window and beyond its capacity, and that
+    range queries return the rows of the time range in order after wrapping around.
+    """
+    history = HistoryBuffer(['timestamp', 'val1', 'val2'], window=60, capacity=5)
+    for second in range(0, 100, 10):
+        history.write_row(START + timedelta(seconds=second), [second, -second])
+    history.write_row(START + timedelta(seconds=50), [0, 0])     # Not newer, skipped
+    first, last, count = history.time_range()
+    assert count == 5 and last - first == 40    # Capacity of 5 rows (window of 60 s)
+
+    times, values = history.select((START + timedelta(seconds=65)).timestamp(),
+                                   (START + timedelta(seconds=90)).timestamp(), ['val2'])
+    assert [t - START.timestamp() for t in times] == [70, 80]
+    assert values == {'val2': [-70, -80]}
+    assert history.latest(['val1'])[1] == {'val1': 90}
+    with pytest.raises(ValueError, match="Unknown tags: val3"):
+        history.select(0, 1, ['val3'])
+
+    history = HistoryBuffer(['timestamp', 'val1'], window=60, capacity=100)
+    for second in range(0, 200, 10):
+        history.write_row(START + timedelta(seconds=second), [second])
+    assert history.time_range()[2] == 7     # Window of 60 s (130 - 190 s)
+
+def test_history_api_downsampling() -> None:
+    """
+    Test the JSON endpoints, the downsampling into min/max/avg buckets, and the errors.
+    """
+    history = HistoryBuffer(['timestamp', 'val1', 'val2'], window=3600, capacity=100)
+    for second in range(0, 60, 5):
+        history.write_row(START + timedelta(seconds=second), [second, None if second else 1])
+    history.server = HistoryServer(history, '127.0.0.1', 0, max_points=10)
+    threading.Thread(target=history.server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{history.server.server_address[1]}"
+
+    def get(path: str) -> dict:
+        with urllib.request.urlopen(url + path, timeout=5) as response:
+            return json.loads(response.read())
+
+    try:
+        assert get("/tags")['columns'] == ['val1', 'val2']
+        assert get("/latest?tags=val1") == {'time': '2025-01-01T12:00:55.000',
+                                            'values': {'val1': 55}}
+        assert get("/range?tags=val1&last=10")['values'] == {'val1': [45, 50, 55]}
+        response = get("/range?start=2025-01-01T12:00:00&end=2025-01-01T12:01:00&step=30")
+        assert response['time'] == ['2025-01-01T12:00:00.000', '2025-01-01T12:00:30.000']
+        assert response['values']['val1'] == {'min': [0, 30], 'max': [25, 55],
+                                              'avg': [12.5, 42.5]}
+        assert response['values']['val2'] == {'min': [1, None], 'max': [1, None],
+                                              'avg': [1.0, None]}
+        for path in ("/range", "/range?tags=val3", "/range?step=0"):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                get(path)
+            assert error.value.code == 400
+    finally:
+        history.close()
+
+def test_history_api_nan_bucket_limit_and_missing_config(tmp_path: Path, monkeypatch) -> None:
+    """
+    Test that NaN values are returned as null and ignored by the aggregates, that the number
+    of buckets is limited by HISTORY_MAX_POINTS, and that the history is disabled without
+    config_history.yaml.
+    :param tmp_path: pytest fixture for temporary directory
+    :param monkeypatch: pytest fixture for monkeypatching
+    """
+    history = HistoryBuffer(['timestamp', 'val1'], window=3600, capacity=100)
+    for second, value in ((0, 1.0), (10, 3.0), (20, math.nan)):
+        history.write_row(START + timedelta(seconds=second), [value])
+    history.server = HistoryServer(history, '127.0.0.1', 0, max_points=2)
+    threading.Thread(target=history.server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{history.server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(url + "/range?last=20&step=60", timeout=5) as response:
+            body = response.read()
+        assert b"NaN" not in body
+        assert json.loads(body)['values']['val1'] == {'min': [1.0], 'max': [3.0], 'avg': [2.0]}
+        with urllib.request.urlopen(url + "/latest", timeout=5) as response:
+            assert json.loads(response.read())['values'] == {'val1': None}
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/range?step=1", timeout=5)
+        assert error.value.code == 400
+    finally:
+        history.close()
+
+    monkeypatch.setattr(pci_history, 'HISTORY_CONFIG_FILE', str(tmp_path / "missing.yaml"))
+    assert pci_history.load_history({'DATA_STORAGE_INTERVAL': 10}, {}) is None
+
+def test_load_history_from_validated_config(
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+    """
+    Test that the history takes its columns from the validated SQL configuration instead of
+    loading config_sql.yaml again.
+    :param tmp_path: pytest fixture for temporary directory
+    :param monkeypatch: pytest fixture for monkeypatching
+    """
+    config_file = tmp_path / "config_history.yaml"
+    config_file.write_text("HISTORY_ENABLED : True\nHISTORY_WINDOW : 60\n"
+                           "HISTORY_HOST : 127.0.0.1\nHISTORY_PORT : 0\n")
+    monkeypatch.setattr(pci_history, 'HISTORY_CONFIG_FILE', str(config_file))
+    monkeypatch.chdir(tmp_path)     # No config_sql.yaml
+    history = pci_history.load_history({'DATA_STORAGE_INTERVAL': 10},
+                                       {'DB_COLUMNS': ['timestamp', 'val1', 'val2']})
+    try:
+        assert history.tags == ('val1', 'val2')
+        assert history.capacity == 7
+    finally:
+        history.close()
@@ -0,0 +1,80 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_logging.py: 
+> Tests the asynchronous logging pipeline with rate limiting and JSON records
+----------------------------------------------------------------------------------------------------
+"""
+
+import sys
+import json
+import queue
+import logging
+
+from src.pci_logging import RateLimitFilter, ExceptionQueueHandler, JSONFormatter
+
+def make_record(
+        message: str,
+        created: float,
+        level: int = logging.ERROR,
+        exc_info: object = None,
+        lineno: int = 100
+    ) -> logging.LogRecord:
+    """
+    Create a log record of a given message, time, level, and line.
+    :return: Log record
+    """
+    record = logging.LogRecord("root", level, "pci_modbus.py", lineno,
+                               "Reading failed: %s", (message,), exc_info)
+    record.created = created
+    return record
+
+def test_rate_limit_filter_per_message() -> None:
+    """
+    Test that repeated warnings and errors of a call site are suppressed within the window and
+    counted (also with other arguments), while other call sites and records below WARNING pass,
+    and that sources without records are forgotten.
+    """
+    rate_limit = RateLimitFilter(window=10)
+    assert rate_limit.filter(make_record("timeout", 0.0))
+    assert not rate_limit.filter(make_record("timeout", 1.0))
+    assert not rate_limit.filter(make_record("refused", 2.0)), "Same template must be muted!"
+    assert rate_limit.filter(make_record("refused", 3.0, lineno=120)), "Other lines must pass!"
+    assert rate_limit.filter(make_record("timeout", 4.0, logging.WARNING))
+    for created in (5.0, 6.0):
+        assert rate_limit.filter(make_record("timeout", created, logging.INFO))
+
+    record = make_record("timeout", 11.0)
+    assert rate_limit.filter(record)
+    assert record.suppressed == 2
+    assert len(rate_limit.sources) == 3
+
+    assert rate_limit.filter(make_record("timeout", 30.0))
+    assert len(rate_limit.sources) == 1
+
+def test_queue_handler_keeps_exception() -> None:
+    """
+    Test that the traceback of a record reaches the JSON formatter of the listener thread.
+    """
+    log_queue = queue.SimpleQueue()
+    try:
+        raise ConnectionResetError("Reset")
+    except ConnectionResetError:
+        ExceptionQueueHandler(log_queue).handle(make_record("reset", 0.0,
+                                                            exc_info=sys.exc_info()))
+    entry = json.loads(JSONFormatter().format(log_queue.get_nowait()))
+    assert entry['message'] == "Reading failed: reset"
+    assert "ConnectionResetError: Reset" in entry['exception']
+
+def test_json_formatter() -> None:
+    """
+    Test that records are formatted as JSON lines with the suppressed count.
+    """
+    record = make_record("timeout", 0.0)
+    record.suppressed = 3
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry['level'] == 'ERROR'
+    assert entry['message'] == "Reading failed: timeout"
+    assert entry['suppressed'] == 3
@@ -8,6 +8,9 @@ test_main.py:
 ----------------------------------------------------------------------------------------------------
 """
 
+import sys
+import subprocess
+from pathlib import Path
 from unittest.mock import patch
 
 def test_multithreading_runs() -> None:
@@ -21,6 +24,8 @@ def test_multithreading_runs() -> None:
          patch("src.pci_threads.pemel_control", return_value=None), \
          patch("src.pci_threads.data_storage", return_value=None), \
          patch("src.pci_threads.supervisor", return_value=None), \
+         patch("src.pci_reload.ConfigWatcher"), \
+         patch("src.pci_trace.trace_exporter"), \
          patch("builtins.open", create=True), \
          patch("yaml.safe_load", return_value={
              'PEMEL_CONTROL_INTERVAL': 0.01,
@@ -33,9 +38,25 @@ def test_multithreading_runs() -> None:
          patch("logging.error"):
 
         import pci_main
-        # Patch time.sleep to break the infinite loop after a short time
-        with patch("time.sleep", side_effect=[None, None, Exception("break")]):
-            try:
-                pci_main.main()
-            except Exception as e:
-                assert str(e) == "break"
+        # Stop the service immediately after the threads have been started
+        # (The validation of the configuration files is tested in test_config.py)
+        with patch.object(pci_main, "load_configs", return_value={
+                 'gen': {'PEMEL_CONTROL_INTERVAL': 0.01, 'DATA_STORAGE_INTERVAL': 0.01,
+                         'RECONNECTION_INTERVAL': 0.01},
+                 'modbus': {}, 'opcua': {}, 'sql': {}}), \
+             patch.object(pci_main.ServiceRunner, "run",
+                          lambda runner: runner.stop_event.set() or 0), \
+             patch.object(pci_main.ServiceRunner, "install_signal_handlers"):
+            assert pci_main.main() == 0
+
+def test_protocol_libraries_imported_lazily() -> None:
+    """
+    Test that importing the main module does not load the protocol libraries.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, pci_main; "
+         "print([m for m in ('pymodbus', 'opcua', 'pg8000', 'pyarrow') if m in sys.modules])"],
+        cwd=Path(__file__).resolve().parents[1], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
@@ -8,7 +8,12 @@ test_modbus.py:
 ----------------------------------------------------------------------------------------------------
 """
 import os
+import socket
 from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+
+from src import pci_write
+from src.pci_config import compile_modbus_config
 
 def test_read_pemel_status(mock_modbus_connection: "pci_modbus.ModbusConnection") -> None:
     """
@@ -48,6 +53,57 @@ def test_write_pemel_current(mock_modbus_connection: "pci_modbus.ModbusConnectio
     mock_modbus_connection.write_pemel_current(10.0)
     mock_modbus_connection.client.write_register.assert_called()
 
+def test_write_set_points_coalesced(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that queued set points are written with one request per contiguous register range,
+    confirmed with one read-back per range (not across the gap), and that a successful write
+    is not repeated.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    conn = mock_modbus_connection
+    conn.modbus_config['SET_POINTS'] = {'EL_VALVE_MODE': 0x8007, 'EL_PUMP_MODE': 0x8008,
+                                        'EL_FAN_MODE': 0x8010}
+    conn.modbus_config['WRITE_READ_BACK'] = True
+    conn.settings = compile_modbus_config(conn.modbus_config)
+    conn.write_planner.set_addresses(pci_write.set_point_addresses(conn.modbus_config))
+    conn.client.write_registers.return_value.isError.return_value = False
+    conn.client.write_register.return_value.isError.return_value = False
+    read_backs = [MagicMock(registers=[30, 1, 2]), MagicMock(registers=[3])]
+    for read_back in read_backs:
+        read_back.isError.return_value = False
+    conn.client.read_holding_registers.side_effect = read_backs
+
+    conn.queue_set_point('EL_PUMP_MODE', 2)
+    conn.queue_set_point('EL_VALVE_MODE', 1)
+    conn.queue_set_point('EL_FAN_MODE', 3)
+    assert conn.write_current(30)
+
+    conn.client.write_registers.assert_called_once_with(0x8006, [30, 1, 2], slave=1)
+    conn.client.write_register.assert_called_once_with(0x8010, 3, slave=1)
+    assert [call.args + (call.kwargs['count'],)
+            for call in conn.client.read_holding_registers.call_args_list] == [
+                (0x8006, 3), (0x8010, 1)]
+    assert conn.write_planner.plan() == []
+
+def test_write_set_points_requeued_on_failure(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that the set points of a failed write are queued again without replacing newer values.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    conn = mock_modbus_connection
+    conn.client.write_register.return_value.isError.return_value = True
+    assert not conn.write_current(20)
+    assert conn.client.write_register.call_count == conn.modbus_config['MAX_RETRIES']
+
+    assert conn.write_planner.plan() == [(0x8006, [20])]
+    conn.write_planner.queue('EL_CURRENT', 25)
+    conn.write_planner.requeue(0x8006, [20])
+    assert conn.write_planner.plan() == [(0x8006, [25])]
+
 def test_convert_bits(mock_modbus_connection: "pci_modbus.ModbusConnection") -> None:
     """
     Test the conversion of an integer to a list of bits.
@@ -64,6 +120,7 @@ def test_convert_h2_flow_to_current(mock_modbus_connection: "pci_modbus.ModbusCo
     mock_modbus_connection.modbus_config['H2_FLOW_ARRAY'] = os.path.join(
         os.path.dirname(__file__), "..", "PEMEL_Current_H2Flowrate.txt"
     )
+    mock_modbus_connection.settings = compile_modbus_config(mock_modbus_connection.modbus_config)
     # Use the path already set in mock_modbus_connection.modbus_config['H2_FLOW_ARRAY']
     result = mock_modbus_connection.convert_h2_flow_to_current(7.5)
     result1 = mock_modbus_connection.convert_h2_flow_to_current(16.7)
@@ -91,3 +148,45 @@ def test_interpolate_h2_flow(mock_modbus_connection: "pci_modbus.ModbusConnectio
     # Below min
     result = mock_modbus_connection.interpolate_h2_flow(current_array, h2_flowrate_array, 1.0)
     assert result == 0
+
+def test_h2_flow_lookup_table(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        tmp_path: "Path"
+    ) -> None:
+    """
+    Test the lookup table of the H2 flow rate conversion on a curve with a non-monotonic
+    segment and currents above MAX_CURRENT, including the batch conversion.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    curve_file = tmp_path / "curve.txt"
+    curve_file.write_text("Current_[A];H2_Flowrate_[Nl_per_min]\n"
+                          "60;20.0\n50;16.0\n40;16.5\n30;10.0\n10;4.0\n0;0.0\n")
+    conn = mock_modbus_connection
+    conn.modbus_config['H2_FLOW_ARRAY'] = str(curve_file)
+    conn.settings = compile_modbus_config(conn.modbus_config)
+    set_points = [-1.0, 0.5, 2.66, 4.0, 12.3, 16.2, 16.4, 19.0, 20.0, 25.0]
+    interpolated = [conn.convert_h2_flow_to_current(flow) for flow in set_points]
+    assert interpolated == [0, 0, 0, 10, 34, 50, 51, 52, 52, 52]
+
+    conn.modbus_config['H2_FLOW_RESOLUTION'] = 0.1
+    conn.settings = compile_modbus_config(conn.modbus_config)
+    assert conn.convert_h2_flows_to_currents(set_points) == [0, 0, 0, 10, 34, 50, 51, 52, 52, 52]
+    assert conn.convert_h2_flow_to_current(12.35) == conn.convert_h2_flow_to_current(12.3)
+    table = conn.get_h2_curve().table
+    assert conn.get_h2_curve().table is table    # Built once for the file and settings
+
+def test_connect_in_worker_thread(mock_modbus_connection: "pci_modbus.ModbusConnection") -> None:
+    """
+    Test that the Modbus client can be created and connected in a worker thread without an
+    event loop, like the concurrent connects at startup and the reconnect workers.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    with socket.create_server(('127.0.0.1', 0)) as server:
+        mock_modbus_connection.modbus_config['PORT'] = server.getsockname()[1]
+        mock_modbus_connection.client = None
+        mock_modbus_connection.connected = False
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(mock_modbus_connection.connect).result()
+        assert mock_modbus_connection.connected
+        mock_modbus_connection.client.close()
@@ -8,8 +8,11 @@ test_opcua.py:
 ----------------------------------------------------------------------------------------------------
 """
 
+import concurrent.futures
 from unittest.mock import MagicMock
 
+from src.pci_opcua import is_connection_error
+
 def test_read_node_values(mock_opcua_connection: "pci_opcua.OPCUAConnection") -> None:
     """
     Test reading node values via OPC UA.
@@ -24,3 +27,36 @@ def test_read_node_values(mock_opcua_connection: "pci_opcua.OPCUAConnection") ->
     assert isinstance(result, dict)
     for v in result.values():
         assert v == 42
+
+def test_connection_lost_on_hot_path(mock_opcua_connection: "pci_opcua.OPCUAConnection") -> None:
+    """
+    Test that a socket error marks the connection as lost and the next reads fail fast.
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    node_mock = MagicMock()
+    node_mock.get_value.side_effect = TimeoutError()
+    mock_opcua_connection.client.get_node.return_value = node_mock
+
+    assert mock_opcua_connection.read_node_values('AllNodes') == {
+        'ns=7;s=::AsGlobalPV:real_temperature': None}
+    assert not mock_opcua_connection.is_connected()
+    mock_opcua_connection.read_node_values('H2')
+    assert node_mock.get_value.call_count == 1  # No further calls until reconnected
+    # Timeout of the synchronous client (no subclass of OSError before Python 3.11)
+    assert is_connection_error(concurrent.futures.TimeoutError())
+    assert not is_connection_error(ValueError("BadNodeIdUnknown"))
+
+def test_is_connected_probes_server_state(
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test the ServerStatus watchdog of the connection check.
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    state_node = MagicMock()
+    state_node.get_value.side_effect = [0, 4]   # Running, Shutdown
+    mock_opcua_connection.client.get_node.return_value = state_node
+
+    assert mock_opcua_connection.is_connected()
+    assert not mock_opcua_connection.is_connected()
+    mock_opcua_connection.client.get_node.assert_called_with("i=2259")
@@ -0,0 +1,128 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_reload.py: 
+> Tests the hot reload of the configuration files
+----------------------------------------------------------------------------------------------------
+"""
+
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import yaml
+
+from src.pci_config import CONFIG_FILES, load_configs, check_configs
+from src.pci_reload import ConfigWatcher, apply_gen_config
+
+def test_config_watcher_applies_valid_changes(tmp_path: Path) -> None:
+    """
+    Test that the watcher applies a changed file and rejects an invalid one.
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    config_path = tmp_path / "config_gen.yaml"
+    config_path.write_text("PEMEL_CONTROL_INTERVAL : 1\nDATA_STORAGE_INTERVAL : 10\n"
+                           "RECONNECTION_INTERVAL : 10\n", encoding="utf-8")
+    gen_config = {'PEMEL_CONTROL_INTERVAL': 1, 'DATA_STORAGE_INTERVAL': 10,
+                  'RECONNECTION_INTERVAL': 10}
+    watcher = ConfigWatcher(
+        {str(config_path): lambda new: apply_gen_config(gen_config, None, new)}, 5
+    )
+
+    config_path.write_text("PEMEL_CONTROL_INTERVAL : 0.5\nDATA_STORAGE_INTERVAL : 10\n"
+                           "RECONNECTION_INTERVAL : 10\n", encoding="utf-8")
+    os.utime(config_path, (1, 1))
+    watcher.check()
+    assert gen_config['PEMEL_CONTROL_INTERVAL'] == 0.5
+
+    config_path.write_text("PEMEL_CONTROL_INTERVAL : 0.2\n", encoding="utf-8")
+    os.utime(config_path, (2, 2))
+    watcher.check()
+    assert gen_config['PEMEL_CONTROL_INTERVAL'] == 0.5, "Invalid config must be rejected!"
+
+    config_path.write_text("PEMEL_CONTROL_INTERVAL : 0.2\nDATA_STORAGE_INTERVAL : 10\n"
+                           "RECONNECTION_INTERVAL : 10\nJITTER_REPORT_INTERVAL : 0\n",
+                           encoding="utf-8")
+    os.utime(config_path, (3, 3))
+    watcher.check()
+    assert gen_config['PEMEL_CONTROL_INTERVAL'] == 0.5, "Invalid interval must be rejected!"
+
+def test_node_added_to_opcua_and_sql_config(tmp_path: Path) -> None:
+    """
+    Test that a new OPC UA node and its DB_COLUMNS entry are applied together, also if the
+    files are saved in different polls, and that the first file alone is rejected.
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    configs = load_configs()
+    paths = {name: str(tmp_path / os.path.basename(CONFIG_FILES[name]))
+             for name in ('opcua', 'sql')}
+    for name, path in paths.items():
+        Path(path).write_text(yaml.safe_dump(configs[name]), encoding="utf-8")
+    names = {path: name for name, path in paths.items()}
+
+    def apply(name: str, new_config: dict) -> None:
+        configs[name] = new_config
+
+    watcher = ConfigWatcher(
+        {path: lambda new, name=name: apply(name, new) for name, path in paths.items()}, 5,
+        check=lambda new_configs: check_configs(
+            {**configs, **{names[path]: new for path, new in new_configs.items()}})
+    )
+    opcua = dict(configs['opcua'], OPCUA_NODE_IDs=configs['opcua']['OPCUA_NODE_IDs']
+                 + ['ns=7;s=::AsGlobalPV:real_new_value'])
+    Path(paths['opcua']).write_text(yaml.safe_dump(opcua), encoding="utf-8")
+    os.utime(paths['opcua'], (1, 1))
+    watcher.check()
+    assert configs['opcua'] != opcua, "Node without DB_COLUMNS entry must be rejected!"
+
+    columns = list(configs['sql']['DB_COLUMNS'])
+    columns.insert(len(opcua['OPCUA_NODE_IDs']), 'real_new_value')
+    sql = dict(configs['sql'], DB_COLUMNS=columns)
+    Path(paths['sql']).write_text(yaml.safe_dump(sql), encoding="utf-8")
+    os.utime(paths['sql'], (2, 2))
+    watcher.check()
+    assert configs['opcua'] == opcua and configs['sql'] == sql
+    assert not watcher.rejected
+
+def test_modbus_reload_keeps_socket(mock_modbus_connection: "pci_modbus.ModbusConnection") -> None:
+    """
+    Test that a register map change keeps the Modbus connection and an address change does not.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    mock_modbus_connection.connect = MagicMock()
+    client = mock_modbus_connection.client
+
+    mock_modbus_config = mock_modbus_connection.modbus_config
+    new_config = dict(mock_modbus_config)
+    new_config['PROCESS_VALUES'] = {'ADDRESS': 0x8062, 'COUNT': 14}
+    mock_modbus_connection.reload_config(new_config)
+    assert mock_modbus_connection.modbus_config['PROCESS_VALUES']['COUNT'] == 14
+    assert not client.close.called and not mock_modbus_connection.connect.called
+
+    new_config = dict(mock_modbus_config, IP_ADDRESS='10.0.6.66')
+    mock_modbus_connection.reload_config(new_config)
+    assert mock_modbus_connection.connect.called
+
+    # A supervised connection is reconnected by its reconnect worker, not the watcher thread
+    mock_modbus_connection.connect.reset_mock()
+    mock_modbus_connection.health = MagicMock()
+    mock_modbus_connection.reload_config(dict(mock_modbus_config, IP_ADDRESS='10.0.6.67'))
+    assert mock_modbus_connection.health.request_reconnect.called
+    assert not mock_modbus_connection.connect.called
+
+def test_opcua_reload_rebuilds_node_cache(
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test that a node list change rebuilds the node cache without reconnecting.
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    mock_opcua_connection.read_node_values('AllNodes')
+    assert mock_opcua_connection.node_cache
+
+    new_config = dict(mock_opcua_connection.opcua_config, OPCUA_NODE_IDs=['ns=7;s=new'])
+    mock_opcua_connection.reload_config(new_config)
+    assert not mock_opcua_connection.node_cache
+    assert not mock_opcua_connection.client.disconnect.called
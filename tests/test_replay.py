@@ -0,0 +1,123 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_replay.py: 
+> Tests the replay of recorded process data through the decoding and storage path
+----------------------------------------------------------------------------------------------------
+"""
+
+import os
+from pathlib import Path
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from src.pci_archive import TEMP_SUFFIX, ArchiveWriter
+from src.pci_replay import Replayer, BatchSQLWriter, sql_rows, archive_rows
+from src.pci_row import Row
+
+def test_replay_decodes_recorded_rows(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test that recorded rows pass the Modbus and OPC UA decoding and keep their timestamps.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    status_bits = [1, 0, 0, 1] + [0] * 6 + [1] + [0] * 5
+    rows = [(datetime(2025, 1, 1, 0, 0, i * 10), [20.5 + i] + status_bits + [100, 200, 300])
+            for i in range(5)]
+    sql_connection = MagicMock(settings=MagicMock(status_packed=False))
+    sink = MagicMock()
+    writer = BatchSQLWriter(sql_connection, batch_size=2, table='replay')
+
+    stats = Replayer(mock_modbus_connection, mock_opcua_connection).run(iter(rows), writer, [sink])
+
+    assert stats['rows'] == 5 and stats['written'] == 5
+    assert sql_connection.insert_rows.call_count == 3   # Batches of 2, 2, and 1 rows
+    last_row = sql_connection.insert_rows.call_args.args[0][0]
+    assert last_row.timestamp == rows[-1][0]
+    assert last_row.values[1:] == rows[-1][1]
+    timestamp, values = sink.write_row.call_args.args
+    assert (timestamp, list(values)) == rows[-1]
+
+def test_replay_packed_source_and_sql_columns(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection",
+        mock_sql_connection: "pci_sql.SQLConnection"
+    ) -> None:
+    """
+    Test that a recorded packed status word is decoded by the flag of the source, and that the
+    recorded rows are read with the configured columns.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    cursor = mock_sql_connection.pool.connect_func.return_value.cursor.return_value
+    cursor.fetchall.return_value = [(datetime(2025, 1, 1), 20.5, 0x0409, 100, 200, 300)]
+    rows = list(sql_rows(mock_sql_connection, 'pemel_data',
+                         ['timestamp', 'real_temperature', 'status_word', 'el_power_act',
+                          'el_current_act', 'el_h2_pressure_act'],
+                         datetime(2025, 1, 1), datetime(2025, 1, 2)))
+    query = cursor.execute.call_args.args[0]
+    assert query.startswith("SELECT timestamp, real_temperature, status_word, el_power_act, ")
+    assert "timestamp < %s" in query
+
+    sql_connection = MagicMock(settings=MagicMock(status_packed=False))
+    writer = BatchSQLWriter(sql_connection, batch_size=1, table='replay')
+    replayer = Replayer(mock_modbus_connection, mock_opcua_connection, source_packed=True)
+    replayer.run(iter(rows), writer)
+    row = sql_connection.insert_rows.call_args.args[0][0]
+    assert row.values[1:] == [20.5, 1, 0, 0, 1] + [0] * 6 + [1] + [0] * 5 + [100, 200, 300]
+
+def test_archive_rows_half_open(mock_archive_writer: "pci_archive.ArchiveWriter") -> None:
+    """
+    Test that the archived rows are read batch by batch from the start up to (excluding) the
+    end, like the SQL source.
+    :param mock_archive_writer: Fixture providing an ArchiveWriter instance
+    """
+    for hour in (10, 11, 12):
+        for minute in (0, 30):
+            mock_archive_writer.write_row(datetime(2025, 1, 1, hour, minute),
+                                          [float(hour), 0, minute])
+    mock_archive_writer.close()
+
+    rows = list(archive_rows(mock_archive_writer.archive_config['ARCHIVE_DIR'],
+                             datetime(2025, 1, 1, 10, 30), datetime(2025, 1, 1, 12)))
+    assert [row[0] for row in rows] == [datetime(2025, 1, 1, 10, 30), datetime(2025, 1, 1, 11),
+                                        datetime(2025, 1, 1, 11, 30)]
+    assert rows[0][1] == [10.0, 0, 30]
+
+def test_target_archive_recovered_instead_of_archive_dir(tmp_path: Path) -> None:
+    """
+    Test that the archive writer of a replay cleans up the unfinished files of its target
+    archive, and not those of the running service in ARCHIVE_DIR.
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    target = tmp_path / "target"
+    target.mkdir()
+    (target / ("pycomint_20250101_13.parquet" + TEMP_SUFFIX)).write_bytes(b"")
+    writer = ArchiveWriter(str(target))
+    assert writer.archive_config['ARCHIVE_DIR'] == str(target)
+    assert os.listdir(target) == []
+
+def test_insert_rows_single_transaction(mock_sql_connection: "pci_sql.SQLConnection") -> None:
+    """
+    Test that several rows are inserted with one multi-row statement and one commit.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    connection = mock_sql_connection.pool.connect_func.return_value
+    rows = []
+    for i in range(3):
+        row = Row(3)
+        row.stamp(datetime(2025, 1, 1, 0, 0, i))
+        row.values[1:] = [i, i * 2]
+        rows.append(row)
+
+    assert mock_sql_connection.insert_rows(rows)
+    query, params = connection.cursor.return_value.execute.call_args.args
+    assert query.count('(%s, %s, %s)') == 3
+    assert params[:3] == ['2025-01-01 00:00:00', 0, 0]
+    assert connection.commit.call_count == 1
@@ -0,0 +1,93 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_scan.py: 
+> Tests the scan groups and the scheduler for multi-rate data acquisition
+----------------------------------------------------------------------------------------------------
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.pci_config import compile_sql_config
+from src.pci_scan import ScanGroup, ScanScheduler
+
+def make_group(name: str, interval: float, ranges: list, nodes: list) -> ScanGroup:
+    """
+    Create a scan group with generated column names.
+    :return: ScanGroup instance
+    """
+    count = len(nodes) + sum(r[1] for r in ranges)
+    return ScanGroup({
+        'NAME': name,
+        'INTERVAL': interval,
+        'MODBUS_RANGES': [{'ADDRESS': a, 'COUNT': c} for a, c in ranges],
+        'OPCUA_NODES': nodes,
+        'DB_TABLE': name,
+        'DB_COLUMNS': ['timestamp'] + [f"col{i}" for i in range(count)],
+    })
+
+def test_scan_group_column_mismatch() -> None:
+    """
+    Test that a scan group with the wrong number of columns is rejected.
+    """
+    with pytest.raises(ValueError):
+        ScanGroup({'NAME': 'g', 'INTERVAL': 1, 'MODBUS_RANGES': [{'ADDRESS': 0, 'COUNT': 2}],
+                   'DB_TABLE': 't', 'DB_COLUMNS': ['timestamp', 'a']})
+
+def test_merge_ranges_and_nodes() -> None:
+    """
+    Test that overlapping and contiguous register ranges and duplicate nodes are combined.
+    """
+    fast = make_group('fast', 0.5, [(0x8065, 3)], ['n1'])
+    slow = make_group('slow', 60, [(0x8066, 4), (0x8070, 1)], ['n1', 'n2'])
+
+    assert ScanScheduler.merge_ranges([fast, slow]) == [(0x8065, 5), (0x8070, 1)]
+    assert ScanScheduler.merge_nodes([fast, slow]) == ['n1', 'n2']
+
+    # Ranges beyond the 125 registers of one read request are split
+    large = make_group('large', 1, [(0, 100), (90, 200)], [])
+    assert ScanScheduler.merge_ranges([large, fast]) == [(0, 125), (125, 125), (250, 40),
+                                                         (0x8065, 3)]
+
+def test_scan_func(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection",
+        mock_sql_connection: "pci_sql.SQLConnection"
+    ) -> None:
+    """
+    Test that due groups share one Modbus read and one OPC UA read, and that the rows of the
+    group storing DB_COLUMNS into DB_TABLE are passed to the sinks.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    fast = make_group('fast', 0.5, [(100, 2)], ['n1'])
+    slow = make_group('slow', 60, [(101, 2)], [])
+    # The slow group stores into DB_TABLE, so its rows are passed to the sinks
+    slow.table = mock_sql_connection.settings.table
+    slow.columns = list(mock_sql_connection.settings.columns[:3])
+    mock_sql_connection.sql_config['DB_COLUMNS'] = slow.columns
+    mock_sql_connection.settings = compile_sql_config(mock_sql_connection.sql_config)
+    scheduler = ScanScheduler([fast, slow])
+    sink = MagicMock()
+    mock_modbus_connection.read_registers = MagicMock(return_value=[1, 2, 3])
+    mock_opcua_connection.read_nodes = MagicMock(return_value={'n1': 4.0})
+    mock_sql_connection.insert_data = MagicMock()
+
+    from src.pci_threads import scan_func
+    scan_func(scheduler, mock_modbus_connection, mock_opcua_connection, mock_sql_connection,
+              [sink])
+
+    mock_modbus_connection.read_registers.assert_called_once_with(100, 3)
+    mock_opcua_connection.read_nodes.assert_called_once_with(['n1'])
+    rows = [call.args[0] for call in mock_sql_connection.insert_data.call_args_list]
+    assert rows == [[4.0, 1, 2], [2, 3]]
+    assert [call.kwargs['timespec'] for call in mock_sql_connection.insert_data.call_args_list] \
+        == ['milliseconds', 'seconds']
+    sink.write_row.assert_called_once()
+    assert sink.write_row.call_args.args[1] == [2, 3]
+    assert scheduler.due_groups() == []     # Next scan not yet due
@@ -0,0 +1,99 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_service.py:
+> Tests the service runner with graceful shutdown and the drain of the buffered rows
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+import socket
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from src.pci_row import RowBuffer, RowLayout
+from src.pci_service import ServiceRunner, drain_rows
+
+def test_runner_notifies_and_stops_threads(tmp_path: Path, monkeypatch) -> None:
+    """
+    Test that the runner reports readiness and watchdog pings to the service manager, ends on
+    a failed critical thread, and stops the loops via the shared stop event.
+    :param tmp_path: pytest fixture for temporary directory
+    :param monkeypatch: pytest fixture for monkeypatching
+    """
+    address = str(tmp_path / "notify")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    server.bind(address)
+    server.settimeout(1)
+    monkeypatch.setenv('NOTIFY_SOCKET', address)
+    monkeypatch.setenv('WATCHDOG_USEC', '100000')
+    monkeypatch.delenv('WATCHDOG_PID', raising=False)
+
+    runner = ServiceRunner({'SHUTDOWN_TIMEOUT': 1})
+    crashed = threading.Event()
+    loop = runner.thread("loop", lambda stop_event: stop_event.wait(), critical=False)
+    worker = runner.thread("worker", lambda stop_event: crashed.wait(1))
+    loop.start()
+    worker.start()
+    threading.Timer(0.2, crashed.set).start()
+
+    assert runner.run() == 1
+    assert runner.shutdown() == []
+    assert not loop.is_alive()
+    messages = []
+    while True:
+        try:
+            messages.append(server.recv(64).decode())
+        except socket.timeout:
+            break
+    server.close()
+    assert messages[0] == "READY=1"
+    assert "WATCHDOG=1" in messages
+    assert messages[-1] == "STOPPING=1"
+
+def test_drain_rows_on_shutdown(mock_sql_connection: "pci_sql.SQLConnection") -> None:
+    """
+    Test that the buffered rows are inserted after a reconnect within the shutdown timeout.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    row_buffer = RowBuffer(RowLayout(1, 1, packed=True), 4)
+    for _ in range(3):
+        row_buffer.push(row_buffer.acquire())
+    mock_sql_connection.alive = False
+    mock_sql_connection.insert_rows = MagicMock(side_effect=lambda rows: mock_sql_connection.alive)
+    mock_sql_connection.connect = MagicMock(
+        side_effect=lambda: setattr(mock_sql_connection, 'alive', True))
+
+    assert drain_rows(row_buffer, mock_sql_connection, 2) == 0
+    assert mock_sql_connection.insert_rows.call_count == 2
+    assert row_buffer.snapshot() == []
+
+    row_buffer.push(row_buffer.acquire())
+    mock_sql_connection.insert_rows = MagicMock(return_value=False)
+    assert drain_rows(row_buffer, mock_sql_connection, 0.1) == 1
+
+def test_shutdown_reports_hung_thread_and_ends_retries(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that a thread still running after SHUTDOWN_TIMEOUT is reported (its rows are not
+    drained), and that the Modbus retry waits end with the stop event.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    runner = ServiceRunner({'SHUTDOWN_TIMEOUT': 0.1})
+    release = threading.Event()
+    hung = runner.thread("data-storage", lambda stop_event: release.wait(2))
+    hung.start()
+    assert runner.shutdown() == ["data-storage"]
+    release.set()
+
+    mock_modbus_connection.stop_event = runner.stop_event
+    mock_modbus_connection.modbus_config['RETRY_INTERVAL'] = 10
+    mock_modbus_connection.client.read_holding_registers.side_effect = OSError("timeout")
+    started = time.monotonic()
+    assert mock_modbus_connection.read_registers(0x8062, 2) is None
+    assert time.monotonic() - started < 1
+    assert mock_modbus_connection.client.read_holding_registers.call_count == 1
@@ -0,0 +1,44 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_soak.py:
+> Tests the soak test harness with a short run of the full thread pipeline
+----------------------------------------------------------------------------------------------------
+"""
+
+from pathlib import Path
+
+import pytest
+
+from tools.pci_soak import SoakTest, analyse
+
+@pytest.mark.slow
+def test_short_soak_run(tmp_path: Path) -> None:
+    """
+    Test that the pipeline runs against the simulators with injected faults, stores rows in the
+    database stand-in, and stops on SIGTERM with exit code 0. (Opt-in: pytest -m slow)
+    :param tmp_path: pytest fixture for temporary directory
+    """
+    soak_test = SoakTest(str(tmp_path), speed=10, sample_interval=0.5, fault_interval=0.5,
+                         fault_duration=0.3, slow_delay=0.1, seed=2)
+    soak_test.prepare()
+    report = soak_test.run(4)
+    assert report['exit_code'] == 0
+    assert report['samples'] >= 5 and sum(report['faults'].values()) > 0
+    assert report['rows'].get('pemel_data', 0) > 0
+    assert (tmp_path / "soak_samples.csv").exists()
+
+def test_analyse_detects_leaks() -> None:
+    """
+    Test that a rising floor of the threads is reported, while temporary peaks are not.
+    """
+    samples = [{'time': t, 'rss_mb': 100.0, 'threads': 10 + t // 50 + (t % 7 == 0) * 5,
+                'sockets': 4, 'fds': 10, 'control_cycles': 10, 'control_p50_ms': 2.0,
+                'control_p99_ms': 3.0, 'storage_p50_ms': 4.0, 'storage_p99_ms': 5.0}
+               for t in range(200)]
+    assert analyse(samples, 2.0)['findings'] == ["threads grows from 10 to 13"]
+    for sample in samples:
+        sample['threads'] = 10 + (sample['time'] % 7 == 0) * 5
+    assert not analyse(samples, 2.0)['findings']
@@ -8,17 +8,99 @@ test_sql.py:
 ----------------------------------------------------------------------------------------------------
 """
 
+from datetime import datetime
 from unittest.mock import MagicMock
 
+from pg8000.exceptions import DatabaseError
+
+from src.pci_config import compile_sql_config
+from src.pci_row import Row
+
 def test_insert_data(mock_sql_connection: "pci_sql.SQLConnection") -> None:
     """
     Test inserting data into SQL database.
     :param mock_sql_connection: Fixture providing a SQLConnection instance
     """
     mock_cursor = MagicMock()
-    mock_sql_connection.connection.cursor.return_value = mock_cursor
+    connection = mock_sql_connection.pool.connect_func.return_value
+    connection.cursor.return_value = mock_cursor
     mock_sql_connection.sql_config['DB_COLUMNS'] = ['timestamp', 'val1', 'val2']
+    mock_sql_connection.settings = compile_sql_config(mock_sql_connection.sql_config)
     mock_sql_connection.insert_data([1, 2])
     assert mock_cursor.execute.called
-    assert mock_sql_connection.connection.commit.called
+    assert connection.commit.called
     assert mock_cursor.close.called
+
+def test_pool_replaces_broken_connection(mock_sql_connection: "pci_sql.SQLConnection") -> None:
+    """
+    Test that a broken pooled connection is detected by the probe and replaced.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    pool = mock_sql_connection.pool
+    broken, fresh = MagicMock(), MagicMock()
+    broken.cursor.side_effect = OSError("network error")
+    pool.connect_func = MagicMock(side_effect=[broken, fresh])
+
+    pool.checkin(pool.checkout())
+    assert mock_sql_connection.is_connected()   # The probe replaces the broken connection
+    assert broken.close.called
+    assert pool.idle[0][0] is fresh
+    assert pool.open_count == 1
+
+def test_insert_retries_after_connection_lost(
+        mock_sql_connection: "pci_sql.SQLConnection"
+    ) -> None:
+    """
+    Test that an insert on a connection broken mid-operation is retried on a new connection.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    broken, fresh = MagicMock(), MagicMock()
+    broken.cursor.return_value.execute.side_effect = OSError("connection reset")
+    broken.rollback.side_effect = OSError("connection reset")
+    mock_sql_connection.pool.connect_func = MagicMock(side_effect=[broken, fresh])
+
+    mock_sql_connection.insert_data([1, 2])
+    assert fresh.commit.called
+    assert mock_sql_connection.pool.open_count == 1
+
+def test_network_error_marks_connection_lost(mock_sql_connection: "pci_sql.SQLConnection") -> None:
+    """
+    Test that a network error on the hot path marks the connection as lost, so that the
+    supervisor reconnects and the following inserts fail fast.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    mock_sql_connection.pool.connect_func = MagicMock(side_effect=OSError("network unreachable"))
+
+    mock_sql_connection.insert_data([1, 2])
+    assert not mock_sql_connection.is_connected()
+    mock_sql_connection.insert_data([1, 2])
+    assert mock_sql_connection.pool.connect_func.call_count == 1    # No attempt until reconnected
+
+def test_invalid_row_dropped(mock_sql_connection: "pci_sql.SQLConnection") -> None:
+    """
+    Test that a row with invalid values is dropped without blocking the other rows, while a
+    connection error keeps all rows buffered.
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    rows = []
+    for i in range(3):
+        row = Row(3)
+        row.stamp(datetime(2025, 1, 1, 0, 0, i))
+        row.values[1:] = [i, 'invalid' if i == 1 else i]
+        rows.append(row)
+    invalid = DatabaseError({'C': '22P02', 'M': 'invalid input syntax for type integer'})
+
+    def execute(query: str, params: list = None) -> None:
+        if params is not None and 'invalid' in params:
+            raise invalid
+    connection = mock_sql_connection.pool.connect_func.return_value
+    connection.cursor.return_value.execute.side_effect = execute
+    assert mock_sql_connection.insert_rows(rows)
+    executed = [c.args for c in connection.cursor.return_value.execute.call_args_list]
+    assert ("ROLLBACK TO SAVEPOINT pycomint_row",) in executed
+    assert [args[1][0] for args in executed if len(args) == 2] == [
+        rows[0].values[0], rows[0].values[0], rows[1].values[0], rows[2].values[0]]
+    assert connection.commit.call_count == 1
+
+    connection.cursor.return_value.execute.side_effect = OSError("connection reset")
+    assert not mock_sql_connection.insert_rows(rows)
@@ -0,0 +1,83 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_status.py: 
+> Tests the packed storage of the PEMEL status word
+----------------------------------------------------------------------------------------------------
+"""
+
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+
+from src.pci_config import compile_sql_config
+from src.pci_status import status_bit_names, status_view_query, decode_status
+
+def test_status_view_and_decode() -> None:
+    """
+    Test the bit names, the generated view, and the vectorized decoding of status words.
+    """
+    names = status_bit_names({'PEMEL_STATUS': {'ADDRESS': 0x8061, 'BIT_0': 'Error',
+                                               'BIT_4': 'Safety OK'}})
+    assert names[0] == 'error' and names[4] == 'safety_ok' and names[1] == 'bit_1'
+    query = status_view_query('pemel_status', 'pemel', 'status_word', names)
+    assert "(status_word >> 4) & 1 AS safety_ok" in query
+
+    table = decode_status(pa.table({'status_word': [0b10001, 0, 1 << 15]}), 'status_word', names)
+    assert table.column('error').to_pylist() == [1, 0, 0]
+    assert table.column('safety_ok').to_pylist() == [1, 0, 0]
+    assert table.column('bit_15').to_pylist() == [0, 0, 1]
+
+def test_data_trans_func_packed_status(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection",
+        mock_sql_connection: "pci_sql.SQLConnection"
+    ) -> None:
+    """
+    Test that the raw status word is stored in one column with STATUS_PACKED.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    status_response = MagicMock(registers=[0x0411])
+    status_response.isError.return_value = False
+    values_response = MagicMock(registers=[1, 2, 3])
+    values_response.isError.return_value = False
+    mock_modbus_connection.client.read_holding_registers.side_effect = [status_response,
+                                                                        values_response]
+    mock_opcua_connection.client.get_node.return_value.get_value.return_value = 1.0
+    mock_sql_connection.sql_config.update(
+        STATUS_PACKED=True, STATUS_COLUMN='status_word',
+        DB_COLUMNS=['timestamp', 'real_temperature', 'status_word', 'el_power_act',
+                    'el_current_act', 'el_h2_pressure_act'])
+    mock_sql_connection.settings = compile_sql_config(mock_sql_connection.sql_config)
+    mock_sql_connection.insert_rows = MagicMock(return_value=True)
+
+    from src.pci_threads import data_trans_func
+    data_trans_func(mock_modbus_connection, mock_opcua_connection, mock_sql_connection)
+    row = mock_sql_connection.insert_rows.call_args.args[0][0]
+    assert row.values[1:] == [1.0, 0x0411, 1, 2, 3]
+
+def test_status_view_from_validated_config(
+        mock_modbus_config: dict,
+        mock_sql_connection: "pci_sql.SQLConnection",
+        monkeypatch: "pytest.MonkeyPatch"
+    ) -> None:
+    """
+    Test that the status view is created from the bit names of the validated Modbus
+    configuration without loading config_modbus.yaml.
+    :param mock_modbus_config: Fixture providing mock Modbus config
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    :param monkeypatch: pytest fixture for monkeypatching
+    """
+    mock_sql_connection.sql_config.update(STATUS_VIEW='pemel_status', STATUS_COLUMN='status_word')
+    mock_sql_connection.status_bit_names = status_bit_names(mock_modbus_config)
+    monkeypatch.setattr("builtins.open", MagicMock(side_effect=OSError("No file access")))
+    mock_sql_connection.create_status_view()
+
+    cursor = mock_sql_connection.pool.connect_func.return_value.cursor.return_value
+    query = cursor.execute.call_args.args[0]
+    assert query.startswith("CREATE OR REPLACE VIEW pemel_status AS")
+    assert f"AS {mock_sql_connection.status_bit_names[0]}," in query
@@ -10,6 +10,11 @@ test_threads.py:
 
 from unittest.mock import MagicMock
 
+import pytest
+
+from src.pci_config import compile_modbus_config, compile_opcua_config
+from src.pci_threads import mirror_process_values
+
 def test_el_control_func(
         mock_modbus_connection: "pci_modbus.ModbusConnection",
         mock_opcua_connection: "pci_opcua.OPCUAConnection"
@@ -24,9 +29,35 @@ def test_el_control_func(
     mock_modbus_connection.write_pemel_current = MagicMock()
 
     from src.pci_threads import el_control_func
-    last_log_time = 0
-    result = el_control_func(mock_modbus_connection, mock_opcua_connection, last_log_time)
-    assert isinstance(result, float)
+    result = el_control_func(mock_modbus_connection, mock_opcua_connection)
+    assert result is True
+    mock_modbus_connection.write_pemel_current.assert_called_once_with(5.0)
+
+def test_mirror_process_values(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection"
+    ) -> None:
+    """
+    Test that the selected process values of the data storage read are mirrored to the PLC in
+    one Write service call without another Modbus read, and that unchanged values are not
+    written again.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    """
+    mock_modbus_connection.modbus_config['PROCESS_VALUES'].update(
+        REG_0='EL_Power_Act', REG_1='EL_Current_Act', REG_2='EL_CalcH2Flow_Act')
+    mock_opcua_connection.opcua_config['MIRROR_NODES'] = {'EL_CalcH2Flow_Act': 'ns=7;s=h2',
+                                                          'EL_Power_Act': 'ns=7;s=power'}
+    mock_modbus_connection.settings = compile_modbus_config(mock_modbus_connection.modbus_config)
+    mock_opcua_connection.settings = compile_opcua_config(mock_opcua_connection.opcua_config)
+    assert mirror_process_values(mock_modbus_connection, mock_opcua_connection, [1000, 20, 15])
+    assert mirror_process_values(mock_modbus_connection, mock_opcua_connection, [1000, 20, 16])
+    assert not mock_modbus_connection.client.read_holding_registers.called
+
+    calls = mock_opcua_connection.client.set_values.call_args_list
+    assert [len(call.args[0]) for call in calls] == [2, 1]
+    assert [value.Value.Value for value in calls[0].args[1]] == [15, 1000]
+    assert calls[1].args[1][0].Value.Value == 16
 
 def test_data_trans_func(
         mock_modbus_connection: "pci_modbus.ModbusConnection",
@@ -39,11 +70,57 @@ def test_data_trans_func(
     :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
     :param mock_sql_connection: Fixture providing a SQLConnection instance
     """
-    mock_modbus_connection.read_pemel_status = MagicMock(return_value=[1]*16)
-    mock_modbus_connection.read_pemel_process_values = MagicMock(return_value=[1, 2, 3])
-    mock_opcua_connection.read_node_values = MagicMock(return_value={'id': 1.0, 'id2': 2.0})
-    mock_sql_connection.insert_data = MagicMock()
+    status_response = MagicMock(registers=[0b101])
+    status_response.isError.return_value = False
+    values_response = MagicMock(registers=[1, 2, 3])
+    values_response.isError.return_value = False
+    mock_modbus_connection.client.read_holding_registers.side_effect = [status_response,
+                                                                        values_response]
+    mock_opcua_connection.client.get_node.return_value.get_value.return_value = 1.0
+    mock_sql_connection.insert_rows = MagicMock(return_value=True)
 
     from src.pci_threads import data_trans_func
     data_trans_func(mock_modbus_connection, mock_opcua_connection, mock_sql_connection)
-    assert mock_sql_connection.insert_data.called
+    row = mock_sql_connection.insert_rows.call_args.args[0][0]
+    assert row.values[1:] == [1.0, 1, 0, 1] + [0] * 13 + [1, 2, 3]
+
+def test_data_trans_func_buffers_failed_rows(
+        mock_modbus_connection: "pci_modbus.ModbusConnection",
+        mock_opcua_connection: "pci_opcua.OPCUAConnection",
+        mock_sql_connection: "pci_sql.SQLConnection"
+    ) -> None:
+    """
+    Test that rows of failed inserts are kept and inserted with the next row.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    :param mock_opcua_connection: Fixture providing an OPCUAConnection instance
+    :param mock_sql_connection: Fixture providing a SQLConnection instance
+    """
+    from src.pci_row import RowBuffer, RowLayout
+    from src.pci_threads import data_trans_func
+    response = MagicMock(registers=[0, 0, 0])
+    response.isError.return_value = False
+    mock_modbus_connection.client.read_holding_registers.return_value = response
+    mock_sql_connection.insert_rows = MagicMock(side_effect=[False, True])
+    row_buffer = RowBuffer(RowLayout.from_configs(mock_modbus_connection.modbus_config,
+                                                  mock_opcua_connection.opcua_config), 4)
+
+    for _ in range(2):
+        data_trans_func(mock_modbus_connection, mock_opcua_connection, mock_sql_connection,
+                        row_buffer=row_buffer)
+    assert len(mock_sql_connection.insert_rows.call_args.args[0]) == 2
+    assert not row_buffer.pending and len(row_buffer.free) == 4
+
+def test_row_buffer_overflow_warning(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Test that a full row buffer warns about the dropped rows once per buffer length, also for
+    a buffer of one row.
+    :param caplog: pytest fixture for capturing log records
+    """
+    from src.pci_row import RowBuffer, RowLayout
+    for capacity, warnings in ((1, 3), (2, 2)):
+        row_buffer = RowBuffer(RowLayout(1, 3), capacity)
+        caplog.clear()
+        for _ in range(capacity + 3):
+            row_buffer.push(row_buffer.acquire())
+        assert row_buffer.dropped == 3
+        assert caplog.text.count("Row buffer full") == warnings
@@ -0,0 +1,59 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_trace.py: 
+> Tests the opt-in tracing and the Chrome trace export
+----------------------------------------------------------------------------------------------------
+"""
+
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from src.pci_trace import TRACER, NULL_SPAN, span
+
+def test_tracing_disabled_records_nothing(
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that no spans are recorded while tracing is disabled.
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    TRACER.configure(False, 1000)
+    TRACER.spans.clear()
+    mock_modbus_connection.client.read_holding_registers.return_value.isError.return_value = False
+    mock_modbus_connection.client.read_holding_registers.return_value.registers = [0]
+    mock_modbus_connection.read_pemel_status()
+    assert span("modbus.transaction") is NULL_SPAN
+    assert not TRACER.spans
+
+def test_chrome_trace_export(
+        tmp_path: Path,
+        mock_modbus_connection: "pci_modbus.ModbusConnection"
+    ) -> None:
+    """
+    Test that nested spans of a protocol call are exported in the Chrome trace format.
+    :param tmp_path: pytest fixture for temporary directory
+    :param mock_modbus_connection: Fixture providing a ModbusConnection instance
+    """
+    mock_response = MagicMock()
+    mock_response.isError.return_value = False
+    mock_response.registers = [1, 2, 3]
+    mock_modbus_connection.client.read_holding_registers.return_value = mock_response
+
+    TRACER.configure(True, 1000)
+    try:
+        TRACER.spans.clear()
+        mock_modbus_connection.read_pemel_process_values()
+        TRACER.export_chrome_trace(str(tmp_path / "trace.json"))
+    finally:
+        TRACER.configure(False, 1000)
+
+    with open(tmp_path / "trace.json", "r", encoding="utf-8") as fptr:
+        events = json.load(fptr)['traceEvents']
+    spans = {event['name']: event for event in events if event['ph'] == 'X'}
+    assert set(spans) == {'modbus.read_pemel_process_values', 'modbus.transaction'}
+    outer, inner = spans['modbus.read_pemel_process_values'], spans['modbus.transaction']
+    assert outer['ts'] <= inner['ts'] and inner['dur'] <= outer['dur']
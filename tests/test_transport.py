@@ -0,0 +1,125 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+test_transport.py:
+> Tests the Modbus transports and the gateway multiplexer
+----------------------------------------------------------------------------------------------------
+"""
+
+import time
+import threading
+from unittest.mock import MagicMock, patch
+
+from pymodbus.framer import FramerRTU, FramerSocket
+
+from src.pci_transport import create_client, GatewayMultiplexer
+
+def test_create_client_transports(mock_modbus_config: dict) -> None:
+    """
+    Test that the configured transport selects the pymodbus client and framer.
+    :param mock_modbus_config: Fixture providing mock Modbus config
+    """
+    assert isinstance(create_client(mock_modbus_config).framer, FramerSocket)
+    rtu_config = dict(mock_modbus_config, TRANSPORT='rtu_over_tcp')
+    assert isinstance(create_client(rtu_config).framer, FramerRTU)
+    serial_config = dict(mock_modbus_config, TRANSPORT='serial',
+                         SERIAL={'PORT': '/dev/ttyUSB0', 'BAUDRATE': 9600})
+    with patch('pymodbus.client.ModbusSerialClient') as serial_client:  # pyserial not required
+        create_client(serial_config)
+    assert serial_client.call_args.args == ('/dev/ttyUSB0',)
+    assert serial_client.call_args.kwargs['baudrate'] == 9600
+
+def test_gateway_round_robin_and_timeouts(mock_modbus_config: dict) -> None:
+    """
+    Test that the slaves of a shared gateway take turns with their own timeouts and that the
+    transport is closed with the last channel.
+    :param mock_modbus_config: Fixture providing mock Modbus config
+    """
+    served = []
+    first_request = threading.Event()
+    release = threading.Event()
+    client = MagicMock()
+    client.connect.return_value = True
+
+    def read_holding_registers(address, count, slave):
+        served.append((slave, client.comm_params.timeout_connect))
+        first_request.set()
+        release.wait(1)
+
+    client.read_holding_registers.side_effect = read_holding_registers
+    with patch('src.pci_transport.create_client', return_value=client):
+        gateway = GatewayMultiplexer(mock_modbus_config)
+        storage = gateway.channel(1, 3)
+        control = gateway.channel(2, 0.1)
+        assert storage.connect() and control.connect()
+
+        threads = [threading.Thread(target=storage.read_holding_registers, args=(0, 1),
+                                    kwargs={'slave': 1}) for _ in range(3)]
+        threads[0].start()
+        first_request.wait(1)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=control.read_holding_registers, args=(0, 1),
+                                        kwargs={'slave': 2}))
+        threads[-1].start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(1)
+
+        assert served == [(1, 3), (1, 3), (2, 0.1), (1, 3)]
+        storage.close()
+        client.close.assert_not_called()
+        control.close()
+        client.close.assert_called_once()
+
+def test_gateway_channels_of_one_slave_and_reconnect(mock_modbus_config: dict) -> None:
+    """
+    Test that two connections to the same slave take turns, that a reconnect waits for the
+    running request, and that the timeout of the open serial port follows the channel.
+    :param mock_modbus_config: Fixture providing mock Modbus config
+    """
+    served = []
+    first_request = threading.Event()
+    release = threading.Event()
+    client = MagicMock()
+    client.connect.return_value = True
+
+    def read_holding_registers(address, count, slave):
+        served.append(client.socket.timeout)
+        first_request.set()
+        release.wait(1)
+
+    def create_client(modbus_config):
+        served.append('connect')
+        return client
+
+    client.read_holding_registers.side_effect = read_holding_registers
+    serial_config = dict(mock_modbus_config, TRANSPORT='serial', SERIAL={'PORT': '/dev/ttyUSB0'})
+    with patch('src.pci_transport.create_client', side_effect=create_client):
+        gateway = GatewayMultiplexer(serial_config)
+        storage = gateway.channel(1, 3)
+        control = gateway.channel(1, 0.1)
+        assert storage.connect()
+
+        threads = [threading.Thread(target=storage.read_holding_registers, args=(0, 1),
+                                    kwargs={'slave': 1}) for _ in range(3)]
+        threads.append(threading.Thread(target=control.read_holding_registers, args=(0, 1),
+                                        kwargs={'slave': 1}))
+        threads.append(threading.Thread(target=control.connect))
+        threads[0].start()
+        first_request.wait(1)
+        client.is_socket_open.return_value = False     # Lost during the first request
+        for thread in threads[1:]:
+            thread.start()
+            time.sleep(0.05)
+        assert served == ['connect', 3]     # The reconnect waits for its turn
+        release.set()
+        for thread in threads:
+            thread.join(1)
+
+        assert served == ['connect', 3, 3, 0.1, 'connect', 3]
+        assert not gateway.scheduler.waiting
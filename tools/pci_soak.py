@@ -0,0 +1,813 @@
+"""
+----------------------------------------------------------------------------------------------------
+PyComInt: Communication interface for chemical plants
+https://github.com/SimMarkt/PyComInt
+
+pci_soak.py:
+> Soak test of the full thread pipeline of pci_main.py (development tool, not part of the
+  service): local Modbus and OPC UA simulators behind fault-injecting proxies (in a separate
+  process), an in-memory database stand-in, accelerated intervals, injected disconnects and slow
+  responses, and the sampling of RSS, threads, sockets, and cycle latency with a trend report
+  (Linux, /proc)
+> Example: python -m tools.pci_soak --duration 12h --speed 10 --workdir soak
+----------------------------------------------------------------------------------------------------
+"""
+
+# pylint: disable=broad-exception-caught
+
+import os
+import sys
+import csv
+import time
+import random
+import signal
+import socket
+import struct
+import logging
+import threading
+import socketserver
+import argparse
+import multiprocessing
+from typing import Any, Callable, Optional
+from functools import partial
+from unittest.mock import patch
+
+import yaml
+
+from src.pci_sql import SQLConnection
+from src.pci_control import ControlExecutor
+from src.pci_trace import TRACER
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))    # Repository root
+STATUS_WORD = 0x0418        # ModeAutomatic, Safety OK, hydrogen cooling temperature reached
+COOLING_BIT = 1 << 10       # Cleared in some reads to trigger status events (0 A write)
+FAULTS = ('modbus_disconnect', 'opcua_disconnect', 'modbus_slow', 'opcua_slow', 'sql_outage',
+          'sql_slow')
+# Intervals of config_gen.yaml divided by the acceleration factor
+ACCELERATED_KEYS = ('PEMEL_CONTROL_INTERVAL', 'DATA_STORAGE_INTERVAL', 'RECONNECTION_INTERVAL',
+                    'RECONNECTION_BACKOFF_MIN', 'RECONNECTION_BACKOFF_MAX',
+                    'JITTER_REPORT_INTERVAL')
+# Trend metrics: (sample key, floor of the values instead of the median, tolerance)
+TREND_METRICS = (('rss_mb', True, None), ('threads', True, 0), ('sockets', True, 0),
+                 ('fds', True, 0), ('control_p50_ms', False, None),
+                 ('control_p99_ms', False, None), ('storage_p50_ms', False, None),
+                 ('storage_p99_ms', False, None))
+
+def recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """
+        :param sock: Connected socket
+        :param size: Number of bytes to receive
+        :return: Received bytes or None if the connection was closed
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+class ModbusRequestHandler(socketserver.BaseRequestHandler):
+    """ Serves the Modbus TCP requests of one client connection. """
+    def handle(self) -> None:
+        try:
+            while True:
+                header = recv_exact(self.request, 7)
+                if header is None:
+                    return
+                transaction, protocol, length, unit = struct.unpack('>HHHB', header)
+                pdu = recv_exact(self.request, length - 1)
+                if pdu is None:
+                    return
+                response = self.server.process(pdu)
+                self.request.sendall(struct.pack('>HHHB', transaction, protocol,
+                                                 len(response) + 1, unit) + response)
+        except OSError:
+            return  # Connection dropped by the proxy
+
+class ModbusSimulator(socketserver.ThreadingTCPServer):
+    """ Modbus TCP server with the PEMEL status and process value registers. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, modbus_config: dict[str, Any], seed: int) -> None:
+        """
+            :param modbus_config: Modbus configuration with the register map
+            :param seed: Seed of the simulated process values
+        """
+        super().__init__(('127.0.0.1', 0), ModbusRequestHandler)
+        offset = modbus_config['BASE_REGISTER_OFFSET']
+        self.status_address = modbus_config['PEMEL_STATUS']['ADDRESS'] - offset
+        self.process_address = modbus_config['PROCESS_VALUES']['ADDRESS'] - offset
+        self.process_count = modbus_config['PROCESS_VALUES']['COUNT']
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.registers = {self.status_address: STATUS_WORD}     # Values by wire address
+        for i in range(self.process_count):
+            self.registers[self.process_address + i] = self.random.randint(0, 1000)
+
+    def tick(self) -> None:
+        """ Advances the simulated process values (random walk) and status bits. """
+        for i in range(self.process_count):
+            address = self.process_address + i
+            self.registers[address] = min(max(self.registers[address]
+                                              + self.random.randint(-5, 5), 0), 0xFFFF)
+        cooling_lost = self.random.random() < 0.01
+        self.registers[self.status_address] = STATUS_WORD & ~COOLING_BIT if cooling_lost \
+            else STATUS_WORD
+
+    def process(self, pdu: bytes) -> bytes:
+        """
+            Executes a request (read holding registers, write single or multiple registers).
+            :param pdu: Request PDU
+            :return: Response PDU
+        """
+        function = pdu[0]
+        with self.lock:
+            if function == 3:
+                address, count = struct.unpack('>HH', pdu[1:5])
+                self.tick()
+                values = [self.registers.get(address + i, 0) for i in range(count)]
+                return struct.pack(f'>BB{count}H', 3, 2 * count, *values)
+            if function == 6:
+                address, value = struct.unpack('>HH', pdu[1:5])
+                self.registers[address] = value
+                return pdu[:5]
+            if function == 16:
+                address, count = struct.unpack('>HH', pdu[1:5])
+                values = struct.unpack(f'>{count}H', pdu[6:6 + 2 * count])
+                self.registers.update(zip(range(address, address + count), values))
+                return pdu[:5]
+        return bytes([function | 0x80, 1])  # Illegal function
+
+class OPCUASimulator:
+    """ OPC UA server with the configured nodes of the PLC. """
+    def __init__(self, opcua_config: dict[str, Any], seed: int) -> None:
+        """
+            :param opcua_config: OPC UA configuration with the node IDs
+            :param seed: Seed of the simulated values
+        """
+        # pylint: disable=import-outside-toplevel
+        from opcua import Server, ua
+
+        logging.getLogger('opcua').setLevel(logging.ERROR)
+        self.random = random.Random(seed)
+        self.port = free_port()
+        self.server = Server()
+        self.server.set_endpoint(f"opc.tcp://127.0.0.1:{self.port}/")
+        h2_flow_ids = opcua_config['H2_FLOW_ID']
+        if isinstance(h2_flow_ids, str):
+            h2_flow_ids = [h2_flow_ids]
+        node_ids = [*opcua_config['OPCUA_NODE_IDs'], *h2_flow_ids,
+                    *(opcua_config.get('MIRROR_NODES') or {}).values()]
+        objects = self.server.get_objects_node()
+        self.variables = []
+        for node_id in dict.fromkeys(node_ids):
+            node = ua.NodeId.from_string(node_id)
+            while self.server.register_namespace(
+                    f"urn:pycomint:soak:{len(self.server.get_namespace_array())}"
+                    ) < node.NamespaceIndex:
+                pass    # Namespaces up to the index of the node (e.g. ns=7 of the PLC)
+            variable = objects.add_variable(node, f"{node.NamespaceIndex}:{node.Identifier}",
+                                            0.0)
+            variable.set_writable()
+            self.variables.append(variable)
+        self.server.start()
+
+    def update(self) -> None:
+        """ Sets new simulated values (e.g. the H2 flow rate set point in 0 - 20 Nl/min). """
+        for variable in self.variables:
+            variable.set_value(round(self.random.uniform(0, 20), 2))
+
+    def stop(self) -> None:
+        """ Stops the server. """
+        self.server.stop()
+
+class FaultProxy:
+    """ TCP proxy in front of a simulator, which drops connections or delays responses. """
+    def __init__(self, upstream_port: int) -> None:
+        """
+            :param upstream_port: Port of the simulator on localhost
+        """
+        self.upstream_port = upstream_port
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.delay = 0.0        # Delay of each response in [s]
+        self.sockets = set()    # Open client and upstream sockets
+        self.lock = threading.Lock()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self) -> None:
+        """ Accepts client connections and connects them to the simulator. """
+        while True:
+            try:
+                client, _ = self.listener.accept()
+                upstream = socket.create_connection(('127.0.0.1', self.upstream_port))
+            except OSError:
+                return  # Listener closed
+            with self.lock:
+                self.sockets.update((client, upstream))
+            threading.Thread(target=self.pump, args=(client, upstream, False),
+                             daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, client, True),
+                             daemon=True).start()
+
+    def pump(self, source: socket.socket, target: socket.socket, response: bool) -> None:
+        """
+            Forwards the data of one direction until a connection is closed.
+            :param source: Socket to read from
+            :param target: Socket to write to
+            :param response: True for the direction from the simulator to the client
+        """
+        try:
+            while data := source.recv(65536):
+                if response and self.delay:
+                    time.sleep(self.delay)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                self.close_socket(sock)
+
+    def close_socket(self, sock: socket.socket) -> None:
+        """
+            Closes a socket of the proxy (both directions of the connection end).
+            :param sock: Client or upstream socket
+        """
+        with self.lock:
+            self.sockets.discard(sock)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def drop(self) -> None:
+        """ Drops all open connections (e.g. a network outage or a device restart). """
+        with self.lock:
+            sockets = list(self.sockets)
+        for sock in sockets:
+            self.close_socket(sock)
+
+    def close(self) -> None:
+        """ Stops accepting connections and drops the open ones. """
+        self.listener.close()
+        self.drop()
+
+def free_port() -> int:
+    """
+        :return: Free TCP port on localhost
+    """
+    with socket.create_server(('127.0.0.1', 0)) as sock:
+        return sock.getsockname()[1]
+
+def run_simulators(
+        modbus_config: dict[str, Any],
+        opcua_config: dict[str, Any],
+        seed: int,
+        pipe: Any
+    ) -> None:
+    """
+        Contains the main function of the simulator process: starts the simulators behind
+        their proxies, sends the proxy ports, and executes the fault commands of the pipe
+        ('drop', name), ('delay', name, seconds), or ('stop',).
+        :param modbus_config: Modbus configuration with the register map
+        :param opcua_config: OPC UA configuration with the node IDs
+        :param seed: Seed of the simulated values
+        :param pipe: Connection to the soak test process
+    """
+    modbus = ModbusSimulator(modbus_config, seed)
+    threading.Thread(target=modbus.serve_forever, daemon=True).start()
+    opcua = OPCUASimulator(opcua_config, seed)
+    proxies = {'modbus': FaultProxy(modbus.server_address[1]), 'opcua': FaultProxy(opcua.port)}
+    pipe.send({name: proxy.port for name, proxy in proxies.items()})
+    try:
+        while True:
+            if pipe.poll(0.5):
+                command = pipe.recv()
+                if command[0] == 'stop':
+                    break
+                if command[0] == 'drop':
+                    proxies[command[1]].drop()
+                elif command[0] == 'delay':
+                    proxies[command[1]].delay = command[2]
+            opcua.update()
+    finally:
+        for proxy in proxies.values():
+            proxy.close()
+        modbus.shutdown()
+        opcua.stop()
+
+class StandInDatabase:
+    """ In-memory stand-in of the PostgreSQL server, which counts the rows without keeping them. """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.rows = {}          # Number of inserted rows by table
+        self.connections = 0    # Number of open connections
+        self.down = False       # Outage: connects and statements fail
+        self.delay = 0.0        # Delay of each statement in [s]
+
+    def connect(self) -> "StandInConnection":
+        """
+            :return: New connection (replaces pg8000.connect)
+        """
+        if self.down:
+            raise ConnectionRefusedError("Database stand-in is down")
+        with self.lock:
+            self.connections += 1
+        return StandInConnection(self)
+
+class StandInConnection:
+    """ Connection of the database stand-in (DB-API subset used by PyComInt). """
+    def __init__(self, database: StandInDatabase) -> None:
+        self.database = database
+        self.closed = False
+
+    def check(self) -> None:
+        """ Raises the error of a lost connection during an outage or after close(). """
+        if self.database.down or self.closed:
+            raise ConnectionResetError("Database stand-in connection lost")
+
+    def cursor(self) -> "StandInCursor":
+        """ :return: New cursor """
+        return StandInCursor(self)
+
+    def commit(self) -> None:
+        """ Commits the transaction. """
+        self.check()
+
+    def rollback(self) -> None:
+        """ Rolls the transaction back. """
+        self.check()
+
+    def close(self) -> None:
+        """ Closes the connection. """
+        if not self.closed:
+            self.closed = True
+            with self.database.lock:
+                self.database.connections -= 1
+
+class StandInCursor:
+    """ Cursor of the database stand-in, which counts the inserted rows. """
+    def __init__(self, connection: StandInConnection) -> None:
+        self.connection = connection
+
+    def execute(self, query: str, params: Any = None) -> None:  # pylint: disable=unused-argument
+        """
+            Counts the rows of INSERT statements.
+            :param query: SQL statement
+            :param params: Parameters of the statement
+        """
+        self.connection.check()
+        database = self.connection.database
+        if database.delay:
+            time.sleep(database.delay)
+        if query.startswith("INSERT INTO "):
+            table = query.split()[2]
+            with database.lock:
+                database.rows[table] = database.rows.get(table, 0) + query.count("(%s")
+
+    def fetchall(self) -> list:
+        """ :return: Result of the probe ('SELECT 1') """
+        return [(1,)]
+
+    def close(self) -> None:
+        """ Closes the cursor. """
+
+class StandInSQLConnection(SQLConnection):
+    """ SQL connection of PyComInt using the database stand-in instead of pg8000. """
+    def __init__(self, database: StandInDatabase, sql_config: Optional[dict] = None) -> None:
+        """
+            :param database: Database stand-in
+            :param sql_config: Validated SQL configuration (None to load the file)
+        """
+        super().__init__(sql_config)
+        self.database = database
+
+    def connect_function(self) -> Callable[[], Any]:
+        """
+            :return: Function opening a connection of the database stand-in
+        """
+        return self.database.connect
+
+def process_metrics() -> dict[str, float]:
+    """
+        Reads the resource usage of this process from /proc (Linux).
+        :return: RSS in [MB], number of threads, open sockets, and open file descriptors
+    """
+    with open("/proc/self/statm", "r", encoding="utf-8") as fptr:
+        rss_pages = int(fptr.read().split()[1])
+    with open("/proc/self/status", "r", encoding="utf-8") as fptr:
+        threads = next(int(line.split()[1]) for line in fptr if line.startswith("Threads:"))
+    sockets = fds = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            target = os.readlink(f"/proc/self/fd/{fd}")
+        except OSError:
+            continue    # Closed while listing
+        fds += 1
+        sockets += target.startswith("socket:")
+    return {'rss_mb': rss_pages * os.sysconf('SC_PAGE_SIZE') / 2**20, 'threads': threads,
+            'sockets': sockets, 'fds': fds}
+
+class SoakSampler:
+    """ Samples the resource usage and the cycle latency of the pipeline over time. """
+    def __init__(self, database: StandInDatabase, interval: float) -> None:
+        """
+            :param database: Database stand-in (stored rows)
+            :param interval: Sampling interval in [s]
+        """
+        self.database = database
+        self.interval = interval
+        self.start = time.monotonic()
+        self.samples = []
+
+    def sample(self) -> dict[str, float]:
+        """
+            Takes a sample. The spans of the control and data transfer cycles since the last
+            sample are drained from the trace buffer, so that it does not grow over the test.
+            :return: Sample with the process metrics, latency percentiles, and counters
+        """
+        durations = {'threads.el_control': [], 'threads.data_transfer': []}
+        spans = TRACER.spans
+        while spans:
+            try:
+                name, _, duration, _, _ = spans.popleft()
+            except IndexError:
+                break
+            if name in durations:
+                durations[name].append(duration / 1e6)
+        control = ControlExecutor.percentiles(durations['threads.el_control'])
+        storage = ControlExecutor.percentiles(durations['threads.data_transfer'])
+        with self.database.lock:
+            rows = sum(self.database.rows.values())
+        sample = {'time': time.monotonic() - self.start, **process_metrics(),
+                  'control_cycles': len(durations['threads.el_control']),
+                  'control_p50_ms': control['p50'], 'control_p99_ms': control['p99'],
+                  'storage_p50_ms': storage['p50'], 'storage_p99_ms': storage['p99'],
+                  'rows': rows}
+        self.samples.append(sample)
+        logging.info("Soak sample: %s", {k: round(v, 2) for k, v in sample.items()})
+        return sample
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+            Contains the thread function sampling every interval.
+            :param stop_event: Event ending the loop
+        """
+        while not stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error("Soak sampling failed: %s", e)
+
+    def write_csv(self, path: str) -> None:
+        """
+            Writes the samples as CSV file (e.g. for plotting).
+            :param path: Path of the CSV file
+        """
+        if not self.samples:
+            return
+        with open(path, "w", newline="", encoding="utf-8") as fptr:
+            writer = csv.DictWriter(fptr, fieldnames=list(self.samples[0]))
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+class FaultInjector:
+    """ Injects disconnects, slow responses, and database outages at random times. """
+    def __init__(
+            self,
+            pipe: Any,
+            database: StandInDatabase,
+            interval: float,
+            duration: float,
+            slow_delay: float,
+            seed: int
+        ) -> None:
+        """
+            :param pipe: Connection to the simulator process
+            :param database: Database stand-in
+            :param interval: Mean interval between the faults in [s]
+            :param duration: Duration of slow responses and outages in [s]
+            :param slow_delay: Delay of the slow responses in [s]
+            :param seed: Seed of the fault sequence
+        """
+        self.pipe = pipe
+        self.database = database
+        self.interval = interval
+        self.duration = duration
+        self.slow_delay = slow_delay
+        self.random = random.Random(seed)
+        self.counts = dict.fromkeys(FAULTS, 0)  # Number of injected faults by type
+
+    def inject(self, fault: str, stop_event: threading.Event) -> None:
+        """
+            Injects a fault and reverts it after the fault duration.
+            :param fault: Type of the fault (see FAULTS)
+            :param stop_event: Event ending a running fault early
+        """
+        logging.info("Soak test: injecting %s", fault)
+        self.counts[fault] += 1
+        target, kind = fault.split('_')
+        if kind == 'disconnect':
+            self.pipe.send(('drop', target))
+            return
+        if target == 'sql':
+            setattr(self.database, 'down' if kind == 'outage' else 'delay',
+                    True if kind == 'outage' else self.slow_delay)
+        else:
+            self.pipe.send(('delay', target, self.slow_delay))
+        stop_event.wait(self.duration)
+        if target == 'sql':
+            self.database.down = False
+            self.database.delay = 0.0
+        else:
+            self.pipe.send(('delay', target, 0.0))
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+            Contains the thread function injecting the faults.
+            :param stop_event: Event ending the loop
+        """
+        while not stop_event.wait(self.random.expovariate(1 / self.interval)):
+            try:
+                self.inject(self.random.choice(FAULTS), stop_event)
+            except Exception as e:
+                logging.error("Soak fault injection failed: %s", e)
+
+def slope(times: list[float], values: list[float]) -> float:
+    """
+        :param times: Sample times in [s]
+        :param values: Sample values
+        :return: Least-squares slope of the values per hour
+    """
+    if len(times) < 2:
+        return 0.0
+    mean_t = sum(times) / len(times)
+    mean_v = sum(values) / len(values)
+    variance = sum((t - mean_t) ** 2 for t in times)
+    if variance == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / variance * 3600
+
+def analyse(
+        samples: list[dict[str, float]],
+        max_rss_growth: float,
+        warmup: float = 0.1
+    ) -> dict[str, Any]:
+    """
+        Compares the first and the last quarter of the samples after the warm-up. Leaks show
+        as a rising floor (minimum) of the resource metrics, since faults only cause temporary
+        peaks. Degradation shows as rising median latencies.
+        :param samples: Samples of SoakSampler
+        :param max_rss_growth: Tolerated RSS growth in [MB/h]
+        :param warmup: Share of the samples skipped as warm-up (imports, caches, buffers)
+        :return: Trends by metric as (start, end, slope per hour) and the findings
+    """
+    samples = samples[int(len(samples) * warmup):]
+    quarter = max(1, len(samples) // 4)
+    trends = {}
+    findings = []
+    for key, floor, tolerance in TREND_METRICS:
+        values = [sample[key] for sample in samples]
+        if not values:
+            continue
+        first, last = sorted(values[:quarter]), sorted(values[-quarter:])
+        start, end = (first[0], last[0]) if floor else (first[len(first) // 2],
+                                                        last[len(last) // 2])
+        trend = slope([sample['time'] for sample in samples], values)
+        trends[key] = (start, end, trend)
+        # (The floor has to rise by more than the allocator noise of 1 MB)
+        if key == 'rss_mb' and end - start > 1 and trend > max_rss_growth:
+            findings.append(f"RSS grows by {trend:.1f} MB/h ({start:.1f} > {end:.1f} MB)")
+        elif tolerance is not None and end - start > tolerance:
+            findings.append(f"{key} grows from {start:.0f} to {end:.0f}")
+        elif key.endswith('p50_ms') and end > 2 * start + 1:
+            findings.append(f"{key} degrades from {start:.1f} to {end:.1f} ms")
+    stalled = sum(1 for sample in samples if sample['control_cycles'] == 0)
+    return {'trends': trends, 'findings': findings, 'stalled_samples': stalled}
+
+class SoakTest:
+    """ Runs the thread pipeline of pci_main.py against the simulators and reports the trends. """
+    def __init__(
+            self,
+            workdir: str,
+            speed: float = 10.0,
+            sample_interval: float = 10.0,
+            fault_interval: float = 60.0,
+            fault_duration: float = 5.0,
+            slow_delay: float = 0.5,
+            seed: int = 1,
+            overrides: Optional[dict[str, dict[str, Any]]] = None
+        ) -> None:
+        """
+            :param workdir: Working directory with the generated configuration, log, and
+                            sample files (the configuration paths of pci_main.py are relative)
+            :param speed: Acceleration factor of the intervals of config_gen.yaml
+            :param sample_interval: Sampling interval in [s]
+            :param fault_interval: Mean interval between the injected faults in [s]
+            :param fault_duration: Duration of slow responses and outages in [s]
+            :param slow_delay: Delay of the slow responses in [s]
+            :param seed: Seed of the simulated values and the fault sequence
+            :param overrides: Additional settings by configuration file name ('gen', 'modbus',
+                              'opcua', 'sql', 'archive', 'history')
+        """
+        self.source_dir = ROOT_DIR
+        self.previous_dir = None
+        self.workdir = os.path.abspath(workdir)
+        self.speed = speed
+        self.sample_interval = sample_interval
+        self.fault_interval = fault_interval
+        self.fault_duration = fault_duration
+        self.slow_delay = slow_delay
+        self.seed = seed
+        self.overrides = overrides or {}
+        self.configs = {}
+        self.process = None
+        self.pipe = None
+        self.database = StandInDatabase()
+
+    def load_config(self, name: str) -> dict[str, Any]:
+        """
+            :param name: Name of the configuration file, e.g. 'modbus' for config_modbus.yaml
+            :return: Configuration of the source directory
+        """
+        with open(os.path.join(self.source_dir, "config", f"config_{name}.yaml"), "r",
+                  encoding="utf-8") as env_file:
+            return yaml.safe_load(env_file)
+
+    def prepare(self) -> None:
+        """
+            Starts the simulator process and writes the configuration of the working directory
+            (simulator addresses, accelerated intervals, tracing for the cycle latency), then
+            changes into the working directory (the configuration paths of pci_main.py are
+            relative) until run() ends.
+        """
+        self.configs = {name: self.load_config(name)
+                        for name in ('gen', 'modbus', 'opcua', 'sql', 'archive', 'history')}
+        # Separate process, so that the samples only contain the resources of PyComInt
+        context = multiprocessing.get_context('spawn')
+        self.pipe, child_pipe = context.Pipe()
+        self.process = context.Process(
+            target=run_simulators, name="soak-simulators", daemon=True,
+            args=(self.configs['modbus'], self.configs['opcua'], self.seed, child_pipe))
+        self.process.start()
+        if not self.pipe.poll(60):
+            raise RuntimeError("Simulators did not start")
+        ports = self.pipe.recv()
+
+        gen = self.configs['gen']
+        for key in ACCELERATED_KEYS:
+            if key in gen:
+                gen[key] = gen[key] / self.speed
+        gen.update(SCAN_GROUPS=[], TRACE_ENABLED=True, TRACE_FILE="PyComInt_trace.json",
+                   TRACE_EXPORT_INTERVAL=365 * 86400)   # Spans are drained by the sampler
+        modbus = self.configs['modbus']
+        modbus.update(IP_ADDRESS='127.0.0.1', PORT=ports['modbus'], TRANSPORT='tcp',
+                      GATEWAY_SHARED=False, RETRY_INTERVAL=modbus['RETRY_INTERVAL'] / self.speed,
+                      H2_FLOW_ARRAY=os.path.join(self.source_dir, modbus['H2_FLOW_ARRAY']))
+        self.configs['opcua']['URL'] = f"opc.tcp://127.0.0.1:{ports['opcua']}/"
+        self.configs['history'].update(HISTORY_ENABLED=True, HISTORY_PORT=0)
+        sql = self.configs['sql']
+        sql.update(DB_HOST='stand-in', DB_TABLE='pemel_data',
+                   EVENTS_TABLE=sql.get('EVENTS_TABLE') or 'soak_events')
+        os.makedirs(os.path.join(self.workdir, "config"), exist_ok=True)
+        for name, config in self.configs.items():
+            config.update(self.overrides.get(name, {}))
+            with open(os.path.join(self.workdir, "config", f"config_{name}.yaml"), "w",
+                      encoding="utf-8") as env_file:
+                yaml.safe_dump(config, env_file, sort_keys=False)
+        self.previous_dir = os.getcwd()
+        os.chdir(self.workdir)
+
+    def run(self, duration: float, max_rss_growth: float = 2.0) -> dict[str, Any]:
+        """
+            Runs the pipeline for the duration and stops it with SIGTERM like a service
+            manager (must be called from the main thread after prepare()). The SQL connection
+            of pci_main.py is patched with the database stand-in.
+            :param duration: Duration of the test in [s]
+            :param max_rss_growth: Tolerated RSS growth in [MB/h]
+            :return: Report with the trends, findings, injected faults, and counters
+        """
+        stop_event = threading.Event()
+        sampler = SoakSampler(self.database, self.sample_interval)
+        injector = FaultInjector(self.pipe, self.database, self.fault_interval,
+                                 self.fault_duration, self.slow_delay, self.seed)
+        threads = [threading.Thread(target=sampler.run, args=(stop_event,), name="soak-sampler",
+                                    daemon=True),
+                   threading.Thread(target=injector.run, args=(stop_event,), name="soak-faults",
+                                    daemon=True)]
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+        tracing = (TRACER.enabled, TRACER.spans.maxlen)
+        timer = threading.Timer(duration, os.kill, (os.getpid(), signal.SIGTERM))
+        timer.daemon = True
+        import pci_main  # pylint: disable=import-outside-toplevel
+        try:
+            for thread in threads:
+                thread.start()
+            timer.start()
+            with patch.object(pci_main, 'SQLConnection',
+                              partial(StandInSQLConnection, self.database)):
+                exit_code = pci_main.main()
+        finally:
+            timer.cancel()
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            TRACER.configure(*tracing)
+            self.stop()
+            if self.previous_dir is not None:
+                os.chdir(self.previous_dir)
+        sampler.write_csv(os.path.join(self.workdir, "soak_samples.csv"))
+        report = analyse(sampler.samples, max_rss_growth)
+        with self.database.lock:
+            rows = dict(self.database.rows)
+        report.update(exit_code=exit_code, duration=duration, speed=self.speed,
+                      samples=len(sampler.samples), faults=injector.counts, rows=rows)
+        return report
+
+    def stop(self) -> None:
+        """ Stops the simulator process. """
+        if self.process is not None:
+            try:
+                self.pipe.send(('stop',))
+            except OSError:
+                pass
+            self.process.join(10)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+def format_report(report: dict[str, Any]) -> str:
+    """
+        :param report: Report of SoakTest.run()
+        :return: Text of the report
+    """
+    lines = [f"Soak test: {report['duration']:.0f} s at {report['speed']:g}x "
+             f"({report['duration'] * report['speed'] / 3600:.1f} h of plant time), "
+             f"{report['samples']} samples, {sum(report['faults'].values())} faults injected "
+             f"{report['faults']}",
+             f"{'metric':<16}{'start':>10}{'end':>10}{'trend/h':>10}"]
+    for key, (start, end, trend) in report['trends'].items():
+        lines.append(f"{key:<16}{start:>10.2f}{end:>10.2f}{trend:>+10.2f}")
+    lines.append(f"Rows stored: {report['rows']}, samples without control cycles: "
+                 f"{report['stalled_samples']}, exit code: {report['exit_code']}")
+    lines.append("Findings: " + ("; ".join(report['findings']) or "none"))
+    return "\n".join(lines)
+
+def parse_duration(value: str) -> float:
+    """
+        :param value: Duration in seconds or with the suffix s, m, or h (e.g. '30m')
+        :return: Duration in [s]
+    """
+    factors = {'s': 1, 'm': 60, 'h': 3600}
+    if value and value[-1] in factors:
+        return float(value[:-1]) * factors[value[-1]]
+    return float(value)
+
+def parse_args() -> argparse.Namespace:
+    """ Parses the command line arguments of the soak test. """
+    parser = argparse.ArgumentParser(description="Soak test of the PyComInt thread pipeline.")
+    parser.add_argument('--duration', type=parse_duration, default=3600.0,
+                        help="Duration of the test (e.g. 3600, 30m, 12h)")
+    parser.add_argument('--speed', type=float, default=10.0,
+                        help="Acceleration factor of the intervals of config_gen.yaml")
+    parser.add_argument('--fault-interval', type=parse_duration, default=60.0,
+                        help="Mean interval between the injected faults")
+    parser.add_argument('--fault-duration', type=parse_duration, default=5.0,
+                        help="Duration of slow responses and database outages")
+    parser.add_argument('--slow-delay', type=float, default=0.5,
+                        help="Delay of the slow responses in [s]")
+    parser.add_argument('--sample-interval', type=parse_duration, default=10.0,
+                        help="Sampling interval of the metrics")
+    parser.add_argument('--max-rss-growth', type=float, default=2.0,
+                        help="Tolerated RSS growth in [MB/h]")
+    parser.add_argument('--seed', type=int, default=1,
+                        help="Seed of the simulated values and the fault sequence")
+    parser.add_argument('--workdir', default='soak',
+                        help="Directory of the generated configuration, log, and sample files")
+    return parser.parse_args()
+
+def main() -> int:
+    """ Runs the soak test and prints the report. """
+    # pylint: disable=import-outside-toplevel
+    from src.pci_logging import setup_logging
+
+    args = parse_args()
+    soak_test = SoakTest(args.workdir, args.speed, args.sample_interval, args.fault_interval,
+                         args.fault_duration, args.slow_delay, args.seed)
+    soak_test.prepare()
+    # Log file of the working directory
+    log_listener = setup_logging()
+    try:
+        report = soak_test.run(args.duration, args.max_rss_growth)
+    finally:
+        log_listener.stop()
+    print(format_report(report))
+    return 0 if report['exit_code'] == 0 and not report['findings'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())